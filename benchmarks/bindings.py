@@ -0,0 +1,62 @@
+"""
+Calls per second of the library functions that are used per frame
+
+Usage: python benchmarks/bindings.py [channel] [calls]
+
+Compares each function bound with a prototype and paramflags (the binding of all other library
+functions) with the binding in functions.py (plain restype/argtypes). CPC_Handle and
+CPC_WaitForEvent are called on an idle channel, the send functions transmit real frames.
+"""
+
+import ctypes
+import sys
+import time
+
+from can_wuensche import EMSWuenscheBus
+from can_wuensche import functions
+from can_wuensche.constants import EVENT_READ
+from can_wuensche.structures import CPC_MSG_T, CPC_CAN_MSG_T, CPC_CANFD_MSG_T
+
+# Argument types of the functions (restype first)
+PROTOTYPES = {
+	"CPC_GetMSGQueueCnt" : ((ctypes.c_int, ctypes.c_int), ((1, "handle"),)),
+	"CPC_WaitForEvent"   : ((ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_ubyte), ((1, "handle"), (1, "timeout"), (1, "event"))),
+	"CPC_Handle"         : ((ctypes.POINTER(CPC_MSG_T), ctypes.c_int), ((1, "handle"),)),
+	"CPC_SendMsg"        : ((ctypes.c_int, ctypes.c_int, ctypes.c_ubyte, ctypes.POINTER(CPC_CAN_MSG_T)), ((1, "handle"), (1, "confirm"), (1, "pCANMsg"))),
+	"CPC_SendMsgFD"      : ((ctypes.c_int, ctypes.c_int, ctypes.c_ubyte, ctypes.POINTER(CPC_CANFD_MSG_T)), ((1, "handle"), (1, "confirm"), (1, "pCANMsg"))),
+}
+
+def calls_per_second(func, args : tuple, calls : int) -> float:
+	start = time.perf_counter()
+	for _ in range(calls):
+		func(*args)
+	return calls / (time.perf_counter() - start)
+
+def main() -> None:
+	channel = sys.argv[1] if len(sys.argv) > 1 else "CHAN00"
+	calls = int(sys.argv[2]) if len(sys.argv) > 2 else 100_000
+	with EMSWuenscheBus(channel=channel) as bus:
+		handle = bus._cpc_handle
+		canmsg = CPC_CAN_MSG_T()
+		canmsg.id = 0x7FF
+		canmsg.length = 8
+		canfdmsg = CPC_CANFD_MSG_T()
+		canfdmsg.id = 0x7FF
+		canfdmsg.length = 64
+		args = {
+			"CPC_GetMSGQueueCnt" : (handle,),
+			"CPC_WaitForEvent"   : (handle, 0, EVENT_READ),
+			"CPC_Handle"         : (handle,),
+			"CPC_SendMsg"        : (handle, 0, ctypes.byref(canmsg)),
+			"CPC_SendMsgFD"      : (handle, 0, ctypes.byref(canfdmsg)),
+		}
+		print("function".ljust(20) + "paramflags/s".rjust(14) + "argtypes/s".rjust(14) + "speedup".rjust(9))
+		for name, (types, paramflags) in PROTOTYPES.items():
+			prototype = functions._cpclib_func_decorator(*types)((name, functions._cpclib_dll), paramflags)
+			# Sends may fail with a full queue, only the call overhead matters here
+			before = calls_per_second(func=prototype, args=args[name], calls=calls)
+			after = calls_per_second(func=getattr(functions, name), args=args[name], calls=calls)
+			print(name.ljust(20) + str(round(before)).rjust(14) + str(round(after)).rjust(14) + (str(round(after / before, 2)) + "x").rjust(9))
+
+if __name__ == "__main__":
+	main()
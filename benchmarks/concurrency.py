@@ -0,0 +1,61 @@
+"""
+Throughput of concurrent senders and a receiver on one EMSWuenscheBus
+
+Usage: python benchmarks/concurrency.py [channel] [seconds]
+
+Runs 1, 2 and 4 sender threads next to a receiving thread (and a thread that changes the bus
+state once per second) and prints the frames per second sent and received.
+"""
+
+import sys
+import threading
+import time
+
+import can
+from can_wuensche import EMSWuenscheBus
+
+def run(bus : EMSWuenscheBus, senders : int, seconds : float) -> tuple:
+	stop = threading.Event()
+	sent = [0] * senders
+	received = [0]
+
+	def send(index : int) -> None:
+		msg = can.Message(arbitration_id=0x100 + index, data=bytes(8), is_extended_id=False)
+		while not stop.is_set():
+			try:
+				bus.send(msg, timeout=0.1)
+				sent[index] += 1
+			except can.CanError:
+				pass
+
+	def receive() -> None:
+		while not stop.is_set():
+			if bus.recv(timeout=0.1) is not None:
+				received[0] += 1
+
+	def configure() -> None:
+		while not stop.wait(1.0):
+			bus.state = can.BusState.ACTIVE
+
+	threads = [threading.Thread(target=send, args=(i,)) for i in range(senders)]
+	threads += [threading.Thread(target=receive), threading.Thread(target=configure)]
+	start = time.perf_counter()
+	for thread in threads:
+		thread.start()
+	time.sleep(seconds)
+	stop.set()
+	for thread in threads:
+		thread.join()
+	duration = time.perf_counter() - start
+	return sum(sent) / duration, received[0] / duration
+
+def main() -> None:
+	channel = sys.argv[1] if len(sys.argv) > 1 else "CHAN00"
+	seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 3.0
+	with EMSWuenscheBus(channel=channel) as bus:
+		for senders in (1, 2, 4):
+			tx, rx = run(bus=bus, senders=senders, seconds=seconds)
+			print(str(senders) + " sender(s): " + str(round(tx)) + " frames/s sent, " + str(round(rx)) + " frames/s received")
+
+if __name__ == "__main__":
+	main()
@@ -2,4 +2,24 @@
 """
 
 from ._version import __version__
-from .wuensche import EMSWuenscheBus
\ No newline at end of file
+from .wuensche import EMSWuenscheBus
+from .recovery import ConnectionGap, BusOffRecovery, BusOffRecoveryPolicy
+from .info import clear_device_info_cache
+from .parallel import EMSWuenscheSession, open_buses
+from .capabilities import clear_capability_cache
+from .fanout import EMSWuenscheFanoutServer, EMSWuenscheFanoutBus
+from .pipeline import EMSWuenscheCapturePipeline
+from .capture import EMSWuenscheCaptureWriter, EMSWuenscheCaptureReader
+from .replay import EMSWuenscheReplay, ReplayReport
+from .changes import ChangeSummary
+from .latest import EMSWuenscheLatestValues, LatestFrame
+from .isotp import EMSWuenscheIsoTp
+from .errors import EMSWuenscheErrorAnalytics, CanErrorEvent, decode_error_frame
+from .autobaud import AutoBaudResult, AutoBaudProbe, AUTOBAUD_BITRATES, AUTOBAUD_DATA_BITRATES
+from .configuration import EMSWuenscheConfiguration, Reconfiguration
+from .columns import COLUMNS
+from .txqueue import EMSWuenscheTxQueue
+from .polling import RxPollStrategy
+from .instrument import enable_instrumentation, disable_instrumentation, reset_instrumentation, instrumentation_report
+from .instrument import _enable_from_environment
+_enable_from_environment()
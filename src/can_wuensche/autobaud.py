@@ -0,0 +1,190 @@
+"""
+Bitrate detection in listen-only mode
+"""
+
+# Global imports
+import logging
+import time
+from typing import List, NamedTuple
+
+# Local imports
+from .constants import *
+from .util      import _create_can_params, _can_params_get_clock, _can_params_set_listen_only, _create_timing_from_can_params
+from .errors    import _decode_error_record
+
+logger = logging.getLogger("can.can_wuensche")
+
+# Nominal bitrates ordered by how common they are
+AUTOBAUD_BITRATES      = (500_000, 250_000, 125_000, 1_000_000, 100_000, 50_000, 800_000, 20_000, 10_000)
+AUTOBAUD_DATA_BITRATES = (2_000_000, 1_000_000, 4_000_000, 5_000_000, 2_500_000, 500_000)
+
+_FRAME_TYPES = (CPC_MSG_T_CAN, CPC_MSG_T_XCAN, CPC_MSG_T_RTR, CPC_MSG_T_XRTR, CPC_MSG_T_CANFD)
+
+class AutoBaudProbe(NamedTuple):
+	bitrate: int
+	data_bitrate: "int | None"
+	dwell: float            # Time listened in seconds
+	frames: int             # Valid frames received
+	errors: int             # Error frames received
+	brs_frames: int         # CAN FD frames with bitrate switch
+	data_errors: int        # Errors in the data phase of CAN FD frames (LPC546XX only)
+
+class AutoBaudResult(NamedTuple):
+	bitrate: "int | None"           # Detected nominal bitrate (None if not found)
+	data_bitrate: "int | None"      # Detected data bitrate (None if not found or no frames with bitrate switch seen)
+	timing: "object | None"         # BitTiming or BitTimingFd of the detected bitrates
+	duration: float                 # Time needed for the detection in seconds
+	probes: List[AutoBaudProbe]     # All configurations that were tried (in this order)
+
+# Errors in the data phase of a CAN FD frame mean that the arbitration phase was received
+# correctly, so they count for the nominal bitrate
+def _nominal_good(frames : int, data_errors : int) -> int:
+	return frames + data_errors
+
+class _AutoBaud:
+	# Tries listen-only configurations one after the other. A configuration is accepted as soon as
+	# min_frames valid frames were received without an error frame and rejected as soon as
+	# error frames arrive without a valid frame. Each configuration is listened to for dwell
+	# seconds at most; the dwell doubles with every pass over the candidates in which the bus
+	# was silent, up to max_dwell.
+	def __init__(self, bus, bitrates, fd : bool, data_bitrates, min_dwell : float, max_dwell : float, min_frames : int, timeout : float):
+		self.bus           = bus
+		self.bitrates      = list(bitrates if bitrates is not None else AUTOBAUD_BITRATES)
+		self.fd            = fd
+		self.data_bitrates = list(data_bitrates if data_bitrates is not None else AUTOBAUD_DATA_BITRATES)
+		self.min_dwell     = min_dwell
+		self.max_dwell     = max(min_dwell, max_dwell)
+		self.min_frames    = min_frames
+		self.timeout       = timeout
+		self.probes        = []
+		self._controller   = bus._can_params.cc_type
+		self._f_clock      = _can_params_get_clock(can_params=bus._can_params)
+
+	def _can_params(self, bitrate : int, data_bitrate : "int | None"):
+		if data_bitrate is None:
+			can_params = _create_can_params(controller=self._controller, fd=False, f_clock=self._f_clock, bitrate=bitrate)
+		else:
+			can_params = _create_can_params(controller=self._controller, fd=True, f_clock=self._f_clock, nom_bitrate=bitrate, data_bitrate=data_bitrate)
+		_can_params_set_listen_only(can_params=can_params, listen_only=True)
+		return can_params
+
+	def probe(self, bitrate : int, data_bitrate : "int | None", dwell : float, data_phase : bool = False) -> "AutoBaudProbe | None":
+		try:
+			can_params = self._can_params(bitrate=bitrate, data_bitrate=data_bitrate)
+		except ValueError as e:
+			logger.debug("Auto-baud: Skipping " + str(bitrate) + "/" + str(data_bitrate) + ": " + str(e))
+			return None
+		start = time.monotonic()
+		self.bus._cpc_reinit(can_params=can_params)
+		deadline = start + dwell
+		frames = errors = brs_frames = data_errors = 0
+		while True:
+			remaining = deadline - time.monotonic()
+			if remaining <= 0:
+				break
+			for record in self.bus._recv_raw(timeout=min(remaining, 0.005), unfiltered=True):
+				msg_type = record[0]
+				if msg_type in _FRAME_TYPES:
+					frames += 1
+					if (msg_type == CPC_MSG_T_CANFD) and (record[16] & CPC_FDFLAG_BRS) and not (record[16] & CPC_FDFLAG_NONCANFD_MSG):
+						brs_frames += 1
+				elif msg_type == CPC_MSG_T_CANERROR:
+					errors += 1
+					event = _decode_error_record(record)
+					if (event is not None) and (event.data_error_type is not None):
+						data_errors += 1
+			if data_phase:
+				# Only frames with bitrate switch tell something about the data bitrate
+				good, bad = brs_frames, data_errors
+			else:
+				good, bad = _nominal_good(frames, data_errors), errors - data_errors
+			if ((good >= self.min_frames) and (bad == 0)) or ((bad >= 2) and (good == 0)):
+				break
+		probe = AutoBaudProbe(
+			bitrate=bitrate,
+			data_bitrate=data_bitrate,
+			dwell=time.monotonic() - start,
+			frames=frames,
+			errors=errors,
+			brs_frames=brs_frames,
+			data_errors=data_errors,
+		)
+		self.probes.append(probe)
+		logger.debug("Auto-baud: " + str(probe))
+		return probe
+
+	@staticmethod
+	def _score(good : int, bad : int) -> float:
+		return good / (good + bad) if good else 0.0
+
+	def _search(self, candidates : list, deadline : float, data_phase : bool) -> "AutoBaudProbe | None":
+		if data_phase:
+			good = lambda probe: probe.brs_frames
+			bad  = lambda probe: probe.data_errors
+		else:
+			good = lambda probe: _nominal_good(probe.frames, probe.data_errors)
+			bad  = lambda probe: probe.errors - probe.data_errors
+		dwell = self.min_dwell
+		best = None
+		while candidates:
+			silent = True
+			rejected = []
+			for bitrate, data_bitrate in candidates:
+				remaining = deadline - time.monotonic()
+				if remaining <= 0:
+					return None
+				probe = self.probe(bitrate=bitrate, data_bitrate=data_bitrate, dwell=min(dwell, remaining), data_phase=data_phase)
+				if probe is None:
+					rejected.append((bitrate, data_bitrate))
+					continue
+				if good(probe) or bad(probe):
+					silent = False
+				if (good(probe) >= self.min_frames) and (bad(probe) == 0):
+					return probe
+				if (good(probe) == 0) and (bad(probe) >= 2):
+					# Only errors: not tried again
+					rejected.append((bitrate, data_bitrate))
+				if (best is None) or (self._score(good(probe), bad(probe)) > self._score(good(best), bad(best))):
+					best = probe
+			# Frames without errors, but fewer than min_frames within the dwell
+			if (best is not None) and (self._score(good(best), bad(best)) >= 0.9):
+				return best
+			if (not silent) and (dwell >= self.max_dwell):
+				return None
+			candidates = [candidate for candidate in candidates if candidate not in rejected]
+			dwell = min(dwell * 2, self.max_dwell)
+		return None
+
+	def run(self) -> AutoBaudResult:
+		start = time.monotonic()
+		deadline = start + self.timeout
+		# The nominal bitrate is searched with a FD configuration (if requested), so FD frames do
+		# not show up as errors. The data bitrate does not matter for classic frames.
+		first_data = self.data_bitrates[0] if (self.fd and self.data_bitrates) else None
+		nominal = self._search(
+			candidates=[(bitrate, first_data) for bitrate in self.bitrates],
+			deadline=deadline,
+			data_phase=False,
+		)
+		bitrate = data_bitrate = None
+		if nominal is not None:
+			bitrate = nominal.bitrate
+			if first_data is not None:
+				if nominal.brs_frames and (nominal.data_errors == 0):
+					data_bitrate = first_data
+				elif nominal.data_errors:
+					# Frames with bitrate switch failed in the data phase: try the other data bitrates
+					data = self._search(
+						candidates=[(bitrate, candidate) for candidate in self.data_bitrates if candidate != first_data],
+						deadline=deadline,
+						data_phase=True,
+					)
+					if data is not None:
+						data_bitrate = data.data_bitrate
+		timing = None
+		if bitrate is not None:
+			try:
+				timing = _create_timing_from_can_params(can_params=self._can_params(bitrate=bitrate, data_bitrate=data_bitrate))
+			except Exception:
+				pass
+		return AutoBaudResult(bitrate=bitrate, data_bitrate=data_bitrate, timing=timing, duration=time.monotonic() - start, probes=self.probes)
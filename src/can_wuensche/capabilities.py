@@ -0,0 +1,128 @@
+"""
+Persistent cache of the controller capabilities per interface
+"""
+
+# Global imports
+import json
+import logging
+import os
+import threading
+from sys import platform
+
+logger = logging.getLogger("can.can_wuensche")
+
+def _default_capability_cache_path() -> str:
+	path = os.environ.get("CAN_WUENSCHE_CAPABILITY_CACHE")
+	if path:
+		return path
+	if platform in ["win32", "cygwin"]:
+		base = os.environ.get("LOCALAPPDATA", os.path.expanduser("~"))
+	else:
+		base = os.environ.get("XDG_CACHE_HOME", os.path.join(os.path.expanduser("~"), ".cache"))
+	return os.path.join(base, "can_wuensche", "capabilities.json")
+
+class _CapabilityCache:
+	# Entries are keyed by what is known before the controller is initialized (the serial number
+	# of a JSON channel description or the channel name, see EMSWuenscheBus.__capability_key):
+	#   { key : { "library" : str, "serial" : str | None, "firmware" : str | None,
+	#             "controller" : int, "canfd" : str | None, "can_clk" : int | None } }
+	# An entry is only used with the library version it was recorded with. Serial number and
+	# firmware are filled in once the interface infos arrive; if they differ from the recorded
+	# ones (other device or firmware update), the entry is dropped, so the next open probes the
+	# controller again. The file is only written when an entry changes.
+	def __init__(self, path : str):
+		self.path     = path
+		self._lock    = threading.Lock()
+		self._entries = None
+
+	def lookup(self, key : str, library : str) -> "dict | None":
+		with self._lock:
+			self._load()
+			entry = self._entries.get(key)
+			if not isinstance(entry, dict) or ("controller" not in entry):
+				return None
+			if entry.get("library") != library:
+				# Library changed: the device may accept other parameters now
+				logger.debug("Capability cache: Library of " + key + " changed from " + str(entry.get("library")) + " to " + library)
+				del self._entries[key]
+				self._save()
+				return None
+			return dict(entry)
+
+	def store(self, key : str, library : str, serial : "str | None", firmware : "str | None", controller : int, canfd : "str | None", can_clk : "int | None") -> None:
+		with self._lock:
+			self._load()
+			old = self._entries.get(key)
+			if isinstance(old, dict):
+				for name, value in (("serial", serial), ("firmware", firmware)):
+					if (value is not None) and (old.get(name) not in (None, value)):
+						# The controller may have been accepted only because it was tried first
+						logger.debug("Capability cache: " + name.capitalize() + " of " + key + " changed from " + str(old.get(name)) + " to " + value)
+						del self._entries[key]
+						self._save()
+						return
+				# Keep the recorded identity until the infos of this device arrive
+				if serial is None:
+					serial = old.get("serial")
+				if firmware is None:
+					firmware = old.get("firmware")
+				if canfd is None:
+					canfd = old.get("canfd")
+			entry = { "library" : library, "serial" : serial, "firmware" : firmware, "controller" : controller, "canfd" : canfd, "can_clk" : can_clk }
+			if old == entry:
+				return
+			self._entries[key] = entry
+			self._save()
+
+	def clear(self) -> None:
+		with self._lock:
+			self._entries = {}
+			self._save()
+
+	def _load(self) -> None:
+		if self._entries is not None:
+			return
+		try:
+			with open(self.path, "r", encoding="utf-8") as f:
+				entries = json.load(f)
+			self._entries = entries if isinstance(entries, dict) else {}
+		except (OSError, ValueError):
+			self._entries = {}
+
+	def _save(self) -> None:
+		# The cache is an optimization only, so failing to write it is not an error
+		try:
+			os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+			tmp_path = self.path + "." + str(os.getpid()) + ".tmp"
+			with open(tmp_path, "w", encoding="utf-8") as f:
+				json.dump(self._entries, f, indent=1, sort_keys=True)
+			os.replace(tmp_path, self.path)
+		except OSError as e:
+			logger.debug("Capability cache: Failed to write '" + self.path + "': " + str(e))
+
+_capability_caches      = {}
+_capability_caches_lock = threading.Lock()
+
+# One cache object per file, shared by all buses of the process
+def _get_capability_cache(path : "str | None" = None) -> _CapabilityCache:
+	if path is None:
+		path = _default_capability_cache_path()
+	with _capability_caches_lock:
+		cache = _capability_caches.get(path)
+		if cache is None:
+			cache = _CapabilityCache(path=path)
+			_capability_caches[path] = cache
+		return cache
+
+# Cache of a bus (see EMSWuenscheBus(capability_cache=...)): True for the default file, a path 
+# for another file, None only if CAN_WUENSCHE_CAPABILITY_CACHE is set and False for no cache
+def _open_capability_cache(setting : "str | bool | None") -> "_CapabilityCache | None":
+	if setting is None:
+		setting = os.environ.get("CAN_WUENSCHE_CAPABILITY_CACHE") or False
+	if setting is False:
+		return None
+	return _get_capability_cache(path=setting if isinstance(setting, str) else None)
+
+def clear_capability_cache(path : "str | None" = None) -> None:
+	"""Forget all recorded controller capabilities (default file or the given one)."""
+	_get_capability_cache(path=path).clear()
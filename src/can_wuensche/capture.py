@@ -0,0 +1,228 @@
+"""
+Compact binary capture of raw frames
+"""
+
+# Global imports
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+from typing import Iterator
+
+# python-can imports
+import can
+from can import Message
+
+# Local imports
+from .constants  import *
+from .structures import CPC_MSG_T
+from .message    import _cpc_msg_to_message
+
+logger = logging.getLogger("can.can_wuensche")
+
+# File layout:
+#   file header (64 bytes) : magic, version, index interval, start time, channel info (utf-8, truncated)
+#   records                : record header (type, payload length, msgid, ts_sec, ts_nsec: 11 bytes) + payload
+#                            (the used part of the CPC_MSG_T union)
+#   index blocks           : record header with type _CAPTURE_INDEX_TYPE, payload: offset of the previous index
+#                            block (0: none), number of records before the block, timestamp of the last record
+#   trailer                : record header with type _CAPTURE_INDEX_TYPE, payload: offset of the last index
+#                            block + _CAPTURE_TRAILER_MAGIC (only if the file was closed properly)
+_CAPTURE_MAGIC          = b"EMSWCAP1"
+_CAPTURE_TRAILER_MAGIC  = b"EMSWEND1"
+_CAPTURE_VERSION        = 1
+_CAPTURE_FILE_HEADER    = struct.Struct("<8sHHIdH")
+_CAPTURE_HEADER_SIZE    = 64
+_CAPTURE_CHANNEL_SIZE   = _CAPTURE_HEADER_SIZE - _CAPTURE_FILE_HEADER.size
+_CAPTURE_RECORD         = struct.Struct("<BBBII")
+_CAPTURE_INDEX          = struct.Struct("<QQII")
+_CAPTURE_TRAILER        = struct.Struct("<Q8s")
+_CAPTURE_INDEX_TYPE     = 0xFF
+_CAPTURE_UNION_SIZE     = len(bytes(CPC_MSG_T())) - _CAPTURE_RECORD.size
+# Writes are done in multiples of this size (and therefore at aligned file offsets)
+_CAPTURE_WRITE_ALIGN    = 4096
+
+class EMSWuenscheCaptureWriter:
+	"""Append raw frames (see EMSWuenscheBus._recv_raw) to a compact binary capture file.
+
+	Only the used part of each frame is stored (11 bytes + id, length and data). The data is
+	collected in memory and written in large blocks of a multiple of 4096 bytes. Every
+	index_interval records an index block is inserted, which EMSWuenscheCaptureReader uses to
+	seek by time.
+	"""
+
+	def __init__(self, path : str, channel_info : str = "", index_interval : int = 65536, buffer_size : int = 1 << 20):
+		self.path            = path
+		self.index_interval  = index_interval
+		self.record_count    = 0
+		self._buffer_size    = max(_CAPTURE_WRITE_ALIGN, buffer_size - buffer_size % _CAPTURE_WRITE_ALIGN)
+		self._buffer         = bytearray()
+		self._file           = open(path, "wb", buffering=0)
+		self._offset         = 0 # File offset of self._buffer[0]
+		self._last_index     = 0
+		self._since_index    = 0
+		self._last_ts        = (0, 0)
+		channel = channel_info.encode("utf-8")[:_CAPTURE_CHANNEL_SIZE]
+		header = _CAPTURE_FILE_HEADER.pack(_CAPTURE_MAGIC, _CAPTURE_VERSION, 0, index_interval, time.time(), len(channel)) + channel
+		self._buffer += header.ljust(_CAPTURE_HEADER_SIZE, b"\0")
+
+	def write_raw(self, records : list) -> None:
+		buffer = self._buffer
+		for record in records:
+			msg_type = record[0]
+			if msg_type in (CPC_MSG_T_CAN, CPC_MSG_T_XCAN, CPC_MSG_T_RTR, CPC_MSG_T_XRTR):
+				length = 5 + min(record[_CAPTURE_RECORD.size + 4], 8)
+			elif msg_type == CPC_MSG_T_CANFD:
+				length = 6 + min(record[_CAPTURE_RECORD.size + 4], 64)
+			else:
+				length = min(record[1], _CAPTURE_UNION_SIZE)
+			# The record header has the layout of the CPC_MSG_T header, only the length is replaced
+			buffer.append(msg_type)
+			buffer.append(length)
+			buffer += record[2:_CAPTURE_RECORD.size + length]
+			self._since_index += 1
+			if self._since_index >= self.index_interval:
+				self.record_count += self._since_index
+				self._since_index = 0
+				self._last_ts = struct.unpack_from("<II", record, 3)
+				self.__write_index()
+		if records:
+			self._last_ts = struct.unpack_from("<II", records[-1], 3)
+		if len(buffer) >= self._buffer_size:
+			self.__write(aligned=True)
+
+	def capture(self, bus, duration : "float | None" = None, stop : "threading.Event | None" = None, batch : int = 1024) -> None:
+		"""Write the frames of the bus until duration expired or stop is set."""
+		end_time = None if duration is None else time.monotonic() + duration
+		while ((stop is None) or (not stop.is_set())) and ((end_time is None) or (time.monotonic() < end_time)):
+			self.write_raw(bus._recv_raw(timeout=0.1, max_count=batch))
+
+	def flush(self) -> None:
+		self.__write(aligned=False)
+
+	def close(self) -> None:
+		if self._file is None:
+			return
+		self.record_count += self._since_index
+		self._since_index = 0
+		self.__write_index()
+		self._buffer += _CAPTURE_RECORD.pack(_CAPTURE_INDEX_TYPE, _CAPTURE_TRAILER.size, 0, 0, 0)
+		self._buffer += _CAPTURE_TRAILER.pack(self._last_index, _CAPTURE_TRAILER_MAGIC)
+		self.__write(aligned=False)
+		self._file.close()
+		self._file = None
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		self.close()
+
+	def __write_index(self) -> None:
+		offset = self._offset + len(self._buffer)
+		self._buffer += _CAPTURE_RECORD.pack(_CAPTURE_INDEX_TYPE, _CAPTURE_INDEX.size, 0, 0, 0)
+		self._buffer += _CAPTURE_INDEX.pack(self._last_index, self.record_count, *self._last_ts)
+		self._last_index = offset
+
+	def __write(self, aligned : bool) -> None:
+		size = len(self._buffer)
+		if aligned:
+			size -= size % _CAPTURE_WRITE_ALIGN
+		if size == 0:
+			return
+		view = memoryview(self._buffer)
+		written = 0
+		while written < size:
+			written += self._file.write(view[written:size])
+		view.release()
+		del self._buffer[:size]
+		self._offset += size
+
+class EMSWuenscheCaptureReader:
+	"""Read a capture file written by EMSWuenscheCaptureWriter.
+
+	Iterating yields can.Message objects. Use export() to convert the capture into any format
+	supported by can.Logger (e.g. BLF or ASC).
+	"""
+
+	def __init__(self, path : str):
+		self.path = path
+		with open(path, "rb") as f:
+			header = f.read(_CAPTURE_HEADER_SIZE)
+		if (len(header) < _CAPTURE_HEADER_SIZE) or (header[:len(_CAPTURE_MAGIC)] != _CAPTURE_MAGIC):
+			raise ValueError("'" + path + "' is not a capture file")
+		magic, version, _, self.index_interval, self.start_time, channel_length = _CAPTURE_FILE_HEADER.unpack_from(header)
+		if version != _CAPTURE_VERSION:
+			raise ValueError("Unsupported capture file version: " + str(version))
+		self.channel_info = header[_CAPTURE_FILE_HEADER.size:_CAPTURE_FILE_HEADER.size + channel_length].decode("utf-8", errors="replace")
+
+	def index(self) -> list:
+		"""Index blocks as (file offset, records before, timestamp) in file order (empty if the file was not closed)."""
+		entries = []
+		with open(self.path, "rb") as f:
+			f.seek(0, os.SEEK_END)
+			if f.tell() < _CAPTURE_HEADER_SIZE + _CAPTURE_TRAILER.size:
+				return entries
+			f.seek(-_CAPTURE_TRAILER.size, os.SEEK_END)
+			offset, magic = _CAPTURE_TRAILER.unpack(f.read(_CAPTURE_TRAILER.size))
+			if magic != _CAPTURE_TRAILER_MAGIC:
+				return entries
+			while offset:
+				f.seek(offset + _CAPTURE_RECORD.size)
+				previous, count, ts_sec, ts_nsec = _CAPTURE_INDEX.unpack(f.read(_CAPTURE_INDEX.size))
+				entries.append((offset, count, ts_sec + ts_nsec / 1_000_000_000.0))
+				offset = previous
+		entries.reverse()
+		return entries
+
+	def records(self, start : "float | None" = None) -> Iterator[bytes]:
+		"""Raw CPC_MSG_T records (81 bytes each), optionally starting close before the given timestamp."""
+		offset = _CAPTURE_HEADER_SIZE
+		if start is not None:
+			for entry_offset, _, timestamp in self.index():
+				if timestamp >= start:
+					break
+				offset = entry_offset
+		with open(self.path, "rb") as f:
+			if os.fstat(f.fileno()).st_size <= offset:
+				return
+			with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+				size = len(data)
+				pos = offset
+				while size - pos >= _CAPTURE_RECORD.size:
+					msg_type = data[pos]
+					length = data[pos + 1]
+					end = pos + _CAPTURE_RECORD.size + length
+					if end > size:
+						# Truncated (e.g. capture was not closed)
+						return
+					if msg_type == _CAPTURE_INDEX_TYPE:
+						if length != _CAPTURE_INDEX.size:
+							# Trailer reached
+							return
+					else:
+						yield data[pos:end].ljust(_CAPTURE_RECORD.size + _CAPTURE_UNION_SIZE, b"\0")
+					pos = end
+
+	def __iter__(self) -> Iterator[Message]:
+		return self.messages()
+
+	def messages(self, start : "float | None" = None) -> Iterator[Message]:
+		channel = self.channel_info or None
+		for record in self.records(start=start):
+			msg = _cpc_msg_to_message(CPC_MSG_T.from_buffer_copy(record))
+			if (start is not None) and (msg.timestamp < start):
+				continue
+			msg.channel = channel
+			yield msg
+
+	def export(self, path : str) -> int:
+		"""Write all messages to a file of any format supported by can.Logger. Returns the number of messages."""
+		count = 0
+		with can.Logger(path) as writer:
+			for msg in self.messages():
+				writer.on_message_received(msg)
+				count += 1
+		return count
@@ -0,0 +1,91 @@
+"""
+Change-only receive mode
+"""
+
+# Global imports
+import time
+from typing import Callable, List, NamedTuple
+
+# Local imports
+from .constants import *
+
+_CAN_TYPES = (CPC_MSG_T_CAN, CPC_MSG_T_XCAN, CPC_MSG_T_RTR, CPC_MSG_T_XRTR)
+
+class ChangeSummary(NamedTuple):
+	start: float            # Begin of the summary interval (time.time())
+	end: float              # End of the summary interval (time.time())
+	passed: int             # Frames delivered in the interval
+	suppressed: int         # Unchanged frames suppressed in the interval
+	suppressed_by_id: dict  # Suppressed frames per (arbitration_id, is_extended_id)
+
+class _ChangeFilter:
+	# Passes a frame only if its payload (including dlc and flags) differs from the last passed frame with
+	# the same id and type. With a window, an unchanged frame is passed again once the window expired.
+	# Works on raw records (see EMSWuenscheBus._recv_raw); frames that are no data frames always pass.
+	def __init__(self, window : "float | None", summary_interval : float, on_summary : "Callable[[ChangeSummary], None]"):
+		self._window_ns      = None if window is None else round(window * 1_000_000_000)
+		self._interval       = summary_interval
+		self._on_summary     = on_summary
+		self._last           = {} # { (type, id[, ext]) : [payload, timestamp of the last passed frame (ns)] }
+		self.__reset_summary(time.time())
+
+	def __reset_summary(self, now : float) -> None:
+		self._summary_start  = now
+		self._summary_due    = time.monotonic() + self._interval
+		self._passed         = 0
+		self._suppressed     = {}
+
+	def summary(self) -> ChangeSummary:
+		now = time.time()
+		suppressed_by_id = {}
+		for key, count in self._suppressed.items():
+			is_extended = (key[0] in (CPC_MSG_T_XCAN, CPC_MSG_T_XRTR)) or ((key[0] == CPC_MSG_T_CANFD) and bool(key[2]))
+			id_key = (key[1], is_extended)
+			suppressed_by_id[id_key] = suppressed_by_id.get(id_key, 0) + count
+		summary = ChangeSummary(start=self._summary_start, end=now, passed=self._passed, suppressed=sum(self._suppressed.values()), suppressed_by_id=suppressed_by_id)
+		self.__reset_summary(now)
+		return summary
+
+	# Emit the summary if the interval expired
+	def poll(self) -> None:
+		if time.monotonic() >= self._summary_due:
+			self._on_summary(self.summary())
+
+	def filter(self, records : List[bytes]) -> List[bytes]:
+		match = self.match
+		records = [record for record in records if match(record)]
+		self.poll()
+		return records
+
+	def match(self, record : bytes) -> bool:
+		msg_type = record[0]
+		# Remote frames have no payload: only the dlc (and flags) count, the data bytes are stale
+		if msg_type in _CAN_TYPES:
+			key = (msg_type, int.from_bytes(record[11:15], "little"))
+			if msg_type in (CPC_MSG_T_RTR, CPC_MSG_T_XRTR):
+				payload = record[15:16]
+			else:
+				payload = record[15:16 + min(record[15], 8)]
+		elif msg_type == CPC_MSG_T_CANFD:
+			key = (msg_type, int.from_bytes(record[11:15], "little"), record[16] & CPC_FDFLAG_XTD)
+			if record[16] & CPC_FDFLAG_RTR:
+				payload = record[15:17]
+			else:
+				payload = record[15:17 + min(record[15], 64)]
+		else:
+			return True
+		last = self._last.get(key)
+		if last is not None and last[0] == payload:
+			if self._window_ns is None:
+				self._suppressed[key] = self._suppressed.get(key, 0) + 1
+				return False
+			timestamp = int.from_bytes(record[3:7], "little") * 1_000_000_000 + int.from_bytes(record[7:11], "little")
+			if timestamp - last[1] < self._window_ns:
+				self._suppressed[key] = self._suppressed.get(key, 0) + 1
+				return False
+			last[1] = timestamp
+		else:
+			timestamp = int.from_bytes(record[3:7], "little") * 1_000_000_000 + int.from_bytes(record[7:11], "little")
+			self._last[key] = [payload, timestamp]
+		self._passed += 1
+		return True
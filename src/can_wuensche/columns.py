@@ -0,0 +1,109 @@
+"""
+Columnar batches (NumPy / Apache Arrow) of received frames
+"""
+
+# Global imports
+import threading
+import time
+from typing import Iterator
+
+# Local imports
+from .constants import *
+
+try:
+	import numpy
+except ImportError:
+	numpy = None
+
+# Size of a raw CPC_MSG_T record (see EMSWuenscheBus._recv_raw)
+_RECORD_SIZE = 81
+
+COLUMNS = ("timestamp", "arbitration_id", "is_extended_id", "is_remote_frame", "is_fd", "bitrate_switch", "error_state_indicator", "dlc", "data")
+
+def _record_dtype():
+	# Overlapping views of the CAN and CANFD message inside the record
+	return numpy.dtype({
+		"names"   : ["type", "ts_sec", "ts_nsec", "id", "length", "can_data", "fd_flags", "fd_data"],
+		"formats" : ["u1", "<u4", "<u4", "<u4", "u1", ("u1", 8), "u1", ("u1", 64)],
+		"offsets" : [0, 3, 7, 11, 15, 16, 16, 17],
+		"itemsize": _RECORD_SIZE,
+	})
+
+def _records_to_columns(buffer : "bytes | bytearray", payload_size : int = 64) -> dict:
+	# Convert concatenated raw records into NumPy columns (frames only, everything else is dropped).
+	# data is a (n, payload_size) uint8 array, bytes beyond dlc are zero.
+	records = numpy.frombuffer(buffer, dtype=_record_dtype(), count=len(buffer) // _RECORD_SIZE)
+	msg_type = records["type"]
+	fd_record = msg_type == CPC_MSG_T_CANFD
+	records = records[fd_record | numpy.isin(msg_type, (CPC_MSG_T_CAN, CPC_MSG_T_XCAN, CPC_MSG_T_RTR, CPC_MSG_T_XRTR))]
+	msg_type = records["type"]
+	fd_record = msg_type == CPC_MSG_T_CANFD
+	flags = numpy.where(fd_record, records["fd_flags"], 0)
+	length = records["length"]
+	data = numpy.zeros((len(records), payload_size), dtype=numpy.uint8)
+	can_width = min(8, payload_size)
+	data[~fd_record, :can_width] = records["can_data"][~fd_record, :can_width]
+	data[fd_record] = records["fd_data"][fd_record, :payload_size]
+	# Clear the bytes beyond the length (the library does not clear them)
+	data[numpy.arange(payload_size) >= numpy.minimum(length, numpy.where(fd_record, 64, 8))[:, None]] = 0
+	remote = numpy.isin(msg_type, (CPC_MSG_T_RTR, CPC_MSG_T_XRTR)) | (fd_record & ((flags & CPC_FDFLAG_RTR) != 0))
+	data[remote] = 0
+	is_fd = fd_record & ((flags & CPC_FDFLAG_NONCANFD_MSG) == 0)
+	return {
+		"timestamp"             : records["ts_sec"] + records["ts_nsec"] / 1_000_000_000,
+		"arbitration_id"        : records["id"].copy(),
+		"is_extended_id"        : numpy.isin(msg_type, (CPC_MSG_T_XCAN, CPC_MSG_T_XRTR)) | (fd_record & ((flags & CPC_FDFLAG_XTD) != 0)),
+		"is_remote_frame"       : remote,
+		"is_fd"                 : is_fd,
+		"bitrate_switch"        : is_fd & ((flags & CPC_FDFLAG_BRS) != 0),
+		"error_state_indicator" : fd_record & ((flags & CPC_FDFLAG_ESI) != 0),
+		"dlc"                   : length.copy(),
+		"data"                  : data,
+	}
+
+def _columns_to_arrow(columns : dict):
+	import pyarrow
+	data = columns["data"]
+	arrays = [pyarrow.array(columns[name]) for name in COLUMNS[:-1]]
+	# The payload column references the NumPy buffer directly
+	arrays.append(pyarrow.FixedSizeBinaryArray.from_buffers(pyarrow.binary(data.shape[1]), len(data), [None, pyarrow.py_buffer(data)]))
+	return pyarrow.RecordBatch.from_arrays(arrays, names=list(COLUMNS))
+
+def _iter_batches(
+	bus,
+	batch_size : int,
+	flush_interval : float,
+	arrow : bool,
+	payload_size : int,
+	duration : "float | None",
+	stop : "threading.Event | None",
+) -> Iterator:
+	if numpy is None:
+		raise ImportError("Columnar batches need numpy (pip install python-can-wuensche[columnar])")
+	if arrow:
+		import pyarrow
+	if not 0 < payload_size <= 64:
+		raise ValueError("payload_size must be within 1..64")
+	end_time = None if duration is None else time.monotonic() + duration
+	buffer = bytearray()
+	count = 0
+	flush_at = None
+	while True:
+		now = time.monotonic()
+		running = ((stop is None) or (not stop.is_set())) and ((end_time is None) or (now < end_time))
+		if count and ((count >= batch_size) or (now >= flush_at) or (not running)):
+			columns = _records_to_columns(buffer, payload_size=payload_size)
+			buffer = bytearray()
+			count = 0
+			# Batches may be empty if only error frames were received
+			if len(columns["timestamp"]):
+				yield _columns_to_arrow(columns) if arrow else columns
+		if not running:
+			return
+		timeout = max(0.0, min(0.1, flush_at - now)) if count else 0.1
+		records = bus._recv_raw(timeout=timeout, max_count=batch_size - count)
+		if records:
+			if not count:
+				flush_at = time.monotonic() + flush_interval
+			buffer += b"".join(records)
+			count += len(records)
@@ -0,0 +1,30 @@
+"""
+Transactional changes of the CAN parameters
+"""
+
+from typing import NamedTuple, Tuple
+
+class Reconfiguration(NamedTuple):
+	"""CPC_CANInit caused by a change of the settings (see EMSWuenscheBus.configure())."""
+	time    : float           # Time of the CPC_CANInit (time.time())
+	offline : float           # Time in seconds the controller was offline for the CPC_CANInit
+	changes : Tuple[str, ...] # Changed fields of the CAN parameters (e.g. "sja1000.btr0"), empty if only the bus state was restored
+
+class EMSWuenscheConfiguration:
+	"""Context of EMSWuenscheBus.configure().
+
+	All changes of timing and state within the block are applied together at its end. If the
+	block raises, the changes are discarded. After the block, reconfiguration holds the
+	Reconfiguration (None if nothing had to be applied).
+	"""
+
+	def __init__(self, bus):
+		self.bus             = bus
+		self.reconfiguration = None
+
+	def __enter__(self):
+		self.bus._cpc_begin_configuration()
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		self.reconfiguration = self.bus._cpc_end_configuration(commit=exc_type is None)
@@ -0,0 +1,81 @@
+"""
+Correlation of requests and responses in the receive loop
+"""
+
+# Global imports
+import threading
+from collections import deque
+from concurrent.futures import Future
+from typing import List
+
+# Local imports
+from .constants  import *
+from .structures import CPC_MSG_T
+from .message    import _cpc_msg_to_message, _cpc_record_id
+
+class _Correlator:
+	# Receive stage that completes the futures of outstanding requests with the first matching frame.
+	# Requests for an exact id are kept in a dict (one FIFO per id), masked requests in a list.
+	# Matching frames are consumed, all other frames pass.
+	def __init__(self):
+		self._exact   = {} # { (id, extended) : deque of futures }
+		self._masked  = [] # [ (id, mask, extended, future) ]
+		self._lock    = threading.Lock()
+		self._pending = 0
+
+	def add(self, can_id : int, mask : int, extended : bool) -> Future:
+		future = Future()
+		with self._lock:
+			if mask == 0x1FFFFFFF:
+				self._exact.setdefault((can_id, extended), deque()).append(future)
+			else:
+				self._masked.append((can_id & mask, mask, extended, future))
+			self._pending += 1
+		future.add_done_callback(self.__done)
+		return future
+
+	def __done(self, future : Future) -> None:
+		with self._lock:
+			self._pending -= 1
+			if future.cancelled():
+				# Drop the registration of an abandoned request
+				for key, futures in list(self._exact.items()):
+					if future in futures:
+						futures.remove(future)
+						if not futures:
+							del self._exact[key]
+				self._masked = [entry for entry in self._masked if entry[3] is not future]
+
+	def __len__(self) -> int:
+		return self._pending
+
+	def filter(self, records : List[bytes]) -> List[bytes]:
+		if not self._pending:
+			return records
+		match = self.match
+		return [record for record in records if match(record)]
+
+	def match(self, record : bytes) -> bool:
+		if (not self._pending) or (record[0] == CPC_MSG_T_CANERROR):
+			return True
+		can_id, extended = _cpc_record_id(record)
+		with self._lock:
+			future = None
+			futures = self._exact.get((can_id, extended))
+			if futures:
+				future = futures.popleft()
+				if not futures:
+					del self._exact[(can_id, extended)]
+			else:
+				for index, (request_id, mask, request_extended, request_future) in enumerate(self._masked):
+					if (request_extended == extended) and ((can_id & mask) == request_id):
+						future = request_future
+						del self._masked[index]
+						break
+		if future is None:
+			return True
+		# Only a frame that completes a request becomes a message
+		if not future.set_running_or_notify_cancel():
+			return True
+		future.set_result(_cpc_msg_to_message(CPC_MSG_T.from_buffer_copy(record)))
+		return False
@@ -0,0 +1,217 @@
+"""
+Decoding and statistics of CAN error frames
+"""
+
+# Global imports
+import struct
+import threading
+import time
+from collections import deque
+from typing import List, NamedTuple
+
+# python-can imports
+from can import Message
+
+# Local imports
+from .constants import *
+
+# SJA1000 error code capture register (ECC)
+_SJA1000_ECC_TYPES = ("bit", "form", "stuff", "other")
+_SJA1000_ECC_SEGMENTS = {
+	0x03 : "start of frame",
+	0x02 : "id.28-21",
+	0x06 : "id.20-18",
+	0x04 : "srtr",
+	0x05 : "ide",
+	0x07 : "id.17-13",
+	0x0F : "id.12-5",
+	0x0E : "id.4-0",
+	0x0C : "rtr",
+	0x0D : "reserved bit 1",
+	0x09 : "reserved bit 0",
+	0x0B : "dlc",
+	0x0A : "data field",
+	0x08 : "crc sequence",
+	0x18 : "crc delimiter",
+	0x19 : "ack slot",
+	0x1B : "ack delimiter",
+	0x1A : "end of frame",
+	0x12 : "intermission",
+	0x11 : "active error flag",
+	0x16 : "passive error flag",
+	0x13 : "tolerate dominant bits",
+	0x17 : "error delimiter",
+	0x1C : "overload flag",
+}
+# M_CAN protocol status register (PSR): last error code (LEC, DLEC) and activity (ACT)
+_MCAN_LEC_TYPES = ("none", "stuff", "form", "ack", "bit1", "bit0", "crc", "unchanged")
+_MCAN_ACTIVITY = ("synchronizing", "idle", "receiver", "transmitter")
+
+_SJA1000_REGS = struct.Struct("<BBB")
+_LPC546XX_REGS = struct.Struct("<II")
+# Offsets within a raw CPC_MSG_T_CANERROR record (see EMSWuenscheBus._recv_raw)
+_REC_ECODE = 11
+_REC_CC    = 12
+_REC_REGS  = 13
+
+class CanErrorEvent(NamedTuple):
+	timestamp: float
+	controller: str             # "SJA1000" or "LPC546XX"
+	error_type: str             # bit, bit0, bit1, stuff, form, ack, crc, other or none
+	direction: "str | None"     # "rx" or "tx" (None if unknown)
+	segment: "str | None"       # Frame segment of the error (SJA1000), "arbitration" or "data" (LPC546XX)
+	data_error_type: "str | None" # Error in the data phase of a CAN FD frame (LPC546XX DLEC)
+	activity: "str | None"      # Controller activity (LPC546XX)
+	error_warning: bool
+	error_passive: bool
+	bus_off: bool
+	rx_errors: int
+	tx_errors: int
+
+def _decode_sja1000(timestamp : float, ecc : int, rxerr : int, txerr : int) -> CanErrorEvent:
+	error_type = _SJA1000_ECC_TYPES[ecc >> 6]
+	segment_code = ecc & 0x1F
+	segment = _SJA1000_ECC_SEGMENTS.get(segment_code, hex(segment_code))
+	# The ECC has no own code for ACK errors: a missing acknowledge is reported in the ACK slot.
+	# Errors in the ACK or CRC delimiter keep their type (e.g. a form error).
+	if segment_code == 0x19:
+		error_type = "ack"
+	return CanErrorEvent(
+		timestamp=timestamp,
+		controller="SJA1000",
+		error_type=error_type,
+		direction="rx" if ecc & 0x20 else "tx",
+		segment=segment,
+		data_error_type=None,
+		activity=None,
+		error_warning=max(rxerr, txerr) >= 96,
+		error_passive=max(rxerr, txerr) >= 128,
+		bus_off=False,
+		rx_errors=rxerr,
+		tx_errors=txerr,
+	)
+
+def _decode_lpc546xx(timestamp : float, psr : int, ecr : int) -> CanErrorEvent:
+	activity = _MCAN_ACTIVITY[(psr >> 3) & 0x3]
+	lec = _MCAN_LEC_TYPES[psr & 0x7]
+	dlec = _MCAN_LEC_TYPES[(psr >> 8) & 0x7]
+	if lec in ("none", "unchanged") and dlec not in ("none", "unchanged"):
+		error_type, segment = dlec, "data"
+	else:
+		error_type, segment = lec, "arbitration"
+	return CanErrorEvent(
+		timestamp=timestamp,
+		controller="LPC546XX",
+		error_type=error_type,
+		direction={ "receiver" : "rx", "transmitter" : "tx" }.get(activity),
+		segment=segment,
+		data_error_type=dlec if dlec not in ("none", "unchanged") else None,
+		activity=activity,
+		error_warning=bool(psr & 0x40),
+		error_passive=bool(psr & 0x20),
+		bus_off=bool(psr & 0x80),
+		rx_errors=(ecr >> 8) & 0x7F,
+		tx_errors=ecr & 0xFF,
+	)
+
+def decode_error_frame(msg : Message) -> "CanErrorEvent | None":
+	"""Decode an error frame received from an EMSWuenscheBus (None if it carries no register values)."""
+	if not msg.is_error_frame:
+		return None
+	if len(msg.data) == _SJA1000_REGS.size:
+		return _decode_sja1000(msg.timestamp, *_SJA1000_REGS.unpack(bytes(msg.data)))
+	if len(msg.data) == _LPC546XX_REGS.size:
+		return _decode_lpc546xx(msg.timestamp, *_LPC546XX_REGS.unpack(bytes(msg.data)))
+	return None
+
+# Decode a raw CPC_MSG_T_CANERROR record
+def _decode_error_record(record : bytes) -> "CanErrorEvent | None":
+	if record[_REC_ECODE] != CPC_CAN_ECODE_ERRFRAME:
+		return None
+	timestamp = int.from_bytes(record[3:7], "little") + int.from_bytes(record[7:11], "little") / 1_000_000_000
+	if record[_REC_CC] == SJA1000:
+		return _decode_sja1000(timestamp, *_SJA1000_REGS.unpack_from(record, _REC_REGS))
+	if record[_REC_CC] == LPC546XX:
+		return _decode_lpc546xx(timestamp, *_LPC546XX_REGS.unpack_from(record, _REC_REGS))
+	return None
+
+class EMSWuenscheErrorAnalytics:
+	"""Rolling statistics of the error frames of an EMSWuenscheBus.
+
+	Errors are counted per (error type, segment) in a ring of time slots covering the last
+	window seconds, so the memory use does not depend on the error rate. The last events are
+	kept in last_events.
+
+	Create it with EMSWuenscheBus.cpc_error_analytics(). The bus needs to be read (e.g. by a
+	can.Notifier) to keep the statistics updated.
+	"""
+
+	def __init__(self, window : float = 60.0, slots : int = 60, keep_events : int = 100):
+		if (window <= 0) or (slots <= 0):
+			raise ValueError("window and slots must be greater than 0")
+		self.window       = window
+		self.total        = 0
+		self.last_events  = deque(maxlen=keep_events)
+		self._slot_length = window / slots
+		self._slots       = [{} for _ in range(slots)]
+		self._slot_ids    = [-1] * slots
+		self._totals      = {}
+		self._lock        = threading.Lock()
+
+	def add(self, event : CanErrorEvent) -> None:
+		key = (event.error_type, event.segment)
+		slot_id = int(time.monotonic() / self._slot_length)
+		index = slot_id % len(self._slots)
+		with self._lock:
+			if self._slot_ids[index] != slot_id:
+				# The slot is reused: forget its old counts
+				self._slots[index] = {}
+				self._slot_ids[index] = slot_id
+			counts = self._slots[index]
+			counts[key] = counts.get(key, 0) + 1
+			self._totals[key] = self._totals.get(key, 0) + 1
+			self.total += 1
+			self.last_events.append(event)
+
+	def histogram(self) -> dict:
+		"""Errors within the window as { (error type, segment) : count }."""
+		oldest = int(time.monotonic() / self._slot_length) - len(self._slots) + 1
+		result = {}
+		with self._lock:
+			for slot_id, counts in zip(self._slot_ids, self._slots):
+				if slot_id >= oldest:
+					for key, count in counts.items():
+						result[key] = result.get(key, 0) + count
+		return result
+
+	def by_type(self) -> dict:
+		"""Errors within the window as { error type : count }."""
+		result = {}
+		for (error_type, _), count in self.histogram().items():
+			result[error_type] = result.get(error_type, 0) + count
+		return result
+
+	def totals(self) -> dict:
+		"""All errors since the start as { (error type, segment) : count }."""
+		with self._lock:
+			return dict(self._totals)
+
+	def rate(self) -> float:
+		"""Errors per second within the window."""
+		return sum(self.histogram().values()) / self.window
+
+	# Receive stage (see EMSWuenscheBus.cpc_error_analytics): error frames pass
+	def filter(self, records : List[bytes]) -> List[bytes]:
+		for record in records:
+			if record[0] == CPC_MSG_T_CANERROR:
+				event = _decode_error_record(record)
+				if event is not None:
+					self.add(event)
+		return records
+
+	def match(self, record : bytes) -> bool:
+		if record[0] == CPC_MSG_T_CANERROR:
+			event = _decode_error_record(record)
+			if event is not None:
+				self.add(event)
+		return True
@@ -0,0 +1,297 @@
+"""
+Shared-memory fan-out of one channel to several local processes
+"""
+
+# Global imports
+import logging
+import os
+import secrets
+import struct
+import tempfile
+import threading
+import time
+from multiprocessing import shared_memory
+from multiprocessing.connection import Listener, Client
+from sys import platform
+from typing import Tuple
+
+# python-can imports
+from can import BusABC, Message
+from can import CanOperationError, CanInitializationError
+
+# Local imports
+from .structures import CPC_MSG_T
+from .message    import _cpc_msg_to_message, _cpc_marshal_to_bytes, _cpc_unmarshal_bytes
+from .util       import _isEMSHandleValid
+
+logger = logging.getLogger("can.can_wuensche")
+
+# Ring layout:
+#   header (64 bytes) : magic, capacity, record size, write index (number of records written), authkey
+#   slots             : sequence (u64) + raw CPC_MSG_T record, padded to _FANOUT_SLOT_SIZE
+# Each slot is protected by a seqlock: the writer sets the sequence of record n to 2n+1 (odd: writing),
+# copies the record, sets it to 2n+2 and only then advances the write index. Readers copy a record and
+# accept it if the sequence was 2n+2 before and after the copy.
+_FANOUT_MAGIC         = b"EMSWFAN1"
+_FANOUT_HEADER        = struct.Struct("<8sIIQ32s")
+_FANOUT_HEADER_SIZE   = 64
+_FANOUT_WRITE_INDEX   = struct.Struct("<Q")
+_FANOUT_WRITE_OFFSET  = 16
+_FANOUT_SEQ           = struct.Struct("<Q")
+_FANOUT_RECORD_SIZE   = len(bytes(CPC_MSG_T()))
+_FANOUT_SLOT_SIZE     = (_FANOUT_SEQ.size + _FANOUT_RECORD_SIZE + 15) & ~15
+
+# Names of the servers of this process (see EMSWuenscheFanoutBus.__init__)
+_fanout_local_servers = set()
+
+def _fanout_shm_name(name : str) -> str:
+	return "can_wuensche_" + name
+
+def _fanout_address(name : str) -> str:
+	if platform in ["win32", "cygwin"]:
+		return "\\\\.\\pipe\\can_wuensche_" + name
+	if platform.startswith("linux"):
+		# Abstract socket: nothing to clean up in the file system
+		return "\0can_wuensche_" + name
+	return os.path.join(tempfile.gettempdir(), "can_wuensche_" + name + ".sock")
+
+class EMSWuenscheFanoutServer:
+	"""Share the received frames of one EMSWuenscheBus with other local processes.
+
+	A drain thread copies the raw frames into a shared-memory ring buffer which any number of
+	EMSWuenscheFanoutBus instances read without further copies by this process. Frames to send
+	are accepted from the clients through a local connection and written to the bus.
+
+	The bus must not be read by anybody else while the server is running.
+	"""
+
+	def __init__(self, bus, name : str, capacity : int = 65536, batch : int = 256):
+		if capacity <= 0:
+			raise ValueError("The capacity must be greater than 0")
+		self.bus      = bus
+		self.name     = name
+		self.capacity = capacity
+		self._batch   = batch
+		self._stopped = False
+		self._authkey = secrets.token_bytes(32)
+		self._shm     = shared_memory.SharedMemory(name=_fanout_shm_name(name), create=True, size=_FANOUT_HEADER_SIZE + capacity * _FANOUT_SLOT_SIZE)
+		self._buf     = self._shm.buf
+		_FANOUT_HEADER.pack_into(self._buf, 0, _FANOUT_MAGIC, capacity, _FANOUT_RECORD_SIZE, 0, self._authkey)
+		self._write_index = 0
+		self.tx_count     = 0
+		self.tx_errors    = 0
+		try:
+			self._listener = Listener(address=_fanout_address(name), authkey=self._authkey)
+		except Exception:
+			self._buf = None
+			self._shm.close()
+			self._shm.unlink()
+			raise
+		_fanout_local_servers.add(name)
+		self._clients      = []
+		self._clients_lock = threading.Lock()
+		self._drain_thread  = threading.Thread(target=self._drain, name="EMSWuensche fan-out drain " + name, daemon=True)
+		self._accept_thread = threading.Thread(target=self._accept, name="EMSWuensche fan-out accept " + name, daemon=True)
+		self._drain_thread.start()
+		self._accept_thread.start()
+
+	@property
+	def rx_count(self) -> int:
+		return self._write_index
+
+	# True if the bus was shut down or lost its channel for good (no reconnect)
+	def _bus_closed(self) -> bool:
+		if getattr(self.bus, "_is_shutdown", False):
+			return True
+		return (not _isEMSHandleValid(handle=getattr(self.bus, "_cpc_handle", 0))) and (not getattr(self.bus, "_reconnect", False))
+
+	def _drain(self) -> None:
+		buf      = self._buf
+		capacity = self.capacity
+		failing  = False
+		while not self._stopped:
+			try:
+				records = self.bus._recv_raw(timeout=0.1, max_count=self._batch)
+			except Exception as e:
+				if self._bus_closed():
+					logger.warning("Fan-out '" + self.name + "': The bus is shut down, no more frames are shared: " + str(e))
+					return
+				# Log the first error of a series only
+				if not failing:
+					logger.exception(e)
+					failing = True
+				time.sleep(0.1)
+				continue
+			failing = False
+			index = self._write_index
+			for record in records:
+				offset = _FANOUT_HEADER_SIZE + (index % capacity) * _FANOUT_SLOT_SIZE
+				_FANOUT_SEQ.pack_into(buf, offset, 2*index + 1)
+				buf[offset + _FANOUT_SEQ.size : offset + _FANOUT_SEQ.size + _FANOUT_RECORD_SIZE] = record
+				_FANOUT_SEQ.pack_into(buf, offset, 2*index + 2)
+				index += 1
+			if records:
+				self._write_index = index
+				_FANOUT_WRITE_INDEX.pack_into(buf, _FANOUT_WRITE_OFFSET, index)
+
+	def _accept(self) -> None:
+		while not self._stopped:
+			try:
+				conn = self._listener.accept()
+			except Exception as e:
+				if not self._stopped:
+					logger.debug("Fan-out '" + self.name + "': Failed to accept a client: " + str(e))
+				continue
+			if self._stopped:
+				conn.close()
+				return
+			with self._clients_lock:
+				self._clients.append(conn)
+			threading.Thread(target=self._serve, args=(conn,), name="EMSWuensche fan-out client " + self.name, daemon=True).start()
+
+	def _serve(self, conn) -> None:
+		try:
+			while not self._stopped:
+				data = conn.recv_bytes()
+				try:
+					self.bus._cpc_send_batch([_cpc_unmarshal_bytes(data)])
+					self.tx_count += 1
+				except Exception as e:
+					self.tx_errors += 1
+					logger.debug("Fan-out '" + self.name + "': Failed to send: " + str(e))
+		except (EOFError, OSError):
+			pass
+		finally:
+			with self._clients_lock:
+				if conn in self._clients:
+					self._clients.remove(conn)
+			conn.close()
+
+	def shutdown(self) -> None:
+		if self._stopped:
+			return
+		self._stopped = True
+		# Wake up the accept thread
+		try:
+			Client(address=_fanout_address(self.name), authkey=self._authkey).close()
+		except Exception:
+			pass
+		self._listener.close()
+		with self._clients_lock:
+			for conn in self._clients:
+				conn.close()
+			self._clients = []
+		self._drain_thread.join()
+		self._accept_thread.join()
+		self._buf = None
+		self._shm.close()
+		self._shm.unlink()
+		_fanout_local_servers.discard(self.name)
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		self.shutdown()
+
+class EMSWuenscheFanoutBus(BusABC):
+	"""Read-only view of a channel that is shared by an EMSWuenscheFanoutServer.
+
+	Every client sees all frames received by the server. A client that falls behind by more than
+	the ring capacity skips the overwritten frames and counts them in lost_count. Sent frames are
+	forwarded to the server, which writes them to the channel.
+	"""
+
+	def __init__(self, channel : str, poll_interval : float = 0.0005, **kwargs):
+		"""
+		:param str channel:
+			Name of the EMSWuenscheFanoutServer.
+		:param float poll_interval:
+			Sleep time between two polls of the ring buffer while waiting for frames.
+		"""
+		try:
+			self._shm = shared_memory.SharedMemory(name=_fanout_shm_name(channel))
+		except FileNotFoundError as e:
+			raise CanInitializationError(message="No fan-out server named '" + channel + "'") from e
+		# The server owns the segment: do not let the resource tracker of this process remove it.
+		# Registrations are per name, so leave it alone if the server runs in this process.
+		if (os.name == "posix") and (channel not in _fanout_local_servers):
+			try:
+				from multiprocessing import resource_tracker
+				resource_tracker.unregister(self._shm._name, "shared_memory")
+			except Exception:
+				pass
+		self._buf = self._shm.buf
+		magic, capacity, record_size, write_index, authkey = _FANOUT_HEADER.unpack_from(self._buf, 0)
+		if (magic != _FANOUT_MAGIC) or (record_size != _FANOUT_RECORD_SIZE):
+			self._buf = None
+			self._shm.close()
+			raise CanInitializationError(message="Incompatible fan-out server '" + channel + "'")
+		self._capacity      = capacity
+		self._authkey       = authkey
+		self._read_index    = write_index # Only frames received after attaching
+		self._poll_interval = poll_interval
+		self._conn          = None
+		self._conn_lock     = threading.Lock()
+		self.lost_count     = 0
+		self.channel_info   = "EMSWuensche fan-out: " + channel
+		self._fanout_name   = channel
+		super().__init__(channel=channel, **kwargs)
+
+	# Copy the next record out of the ring (None if there is none yet)
+	def __read_record(self) -> "bytes | None":
+		buf = self._buf
+		while True:
+			write_index = _FANOUT_WRITE_INDEX.unpack_from(buf, _FANOUT_WRITE_OFFSET)[0]
+			if self._read_index >= write_index:
+				return None
+			if write_index - self._read_index > self._capacity:
+				# Lapped by the writer
+				self.lost_count  += write_index - self._read_index - self._capacity
+				self._read_index  = write_index - self._capacity
+			index  = self._read_index
+			offset = _FANOUT_HEADER_SIZE + (index % self._capacity) * _FANOUT_SLOT_SIZE
+			seq    = _FANOUT_SEQ.unpack_from(buf, offset)[0]
+			record = bytes(buf[offset + _FANOUT_SEQ.size : offset + _FANOUT_SEQ.size + _FANOUT_RECORD_SIZE])
+			if (seq == 2*index + 2) and (_FANOUT_SEQ.unpack_from(buf, offset)[0] == seq):
+				self._read_index = index + 1
+				return record
+			# The slot is being written or was overwritten while copying: retry with the new write index
+			if seq & 1:
+				# Let the writer finish the slot
+				time.sleep(0)
+
+	def _recv_internal(self, timeout: "float | None") -> Tuple["Message | None", bool]:
+		if self._buf is None:
+			raise CanOperationError(message="Bus is shut down")
+		end_time = None if timeout is None else time.monotonic() + timeout
+		while True:
+			record = self.__read_record()
+			if record is not None:
+				return _cpc_msg_to_message(CPC_MSG_T.from_buffer_copy(record)), False
+			if (end_time is not None) and (time.monotonic() >= end_time):
+				return None, False
+			time.sleep(self._poll_interval)
+
+	def send(self, msg: Message, timeout: "float | None" = None) -> None:
+		data = _cpc_marshal_to_bytes(msg)
+		with self._conn_lock:
+			try:
+				if self._conn is None:
+					self._conn = Client(address=_fanout_address(self._fanout_name), authkey=self._authkey)
+				self._conn.send_bytes(data)
+			except (OSError, EOFError) as e:
+				if self._conn is not None:
+					self._conn.close()
+					self._conn = None
+				raise CanOperationError(message="Fan-out server '" + self._fanout_name + "' is not available: " + str(e)) from e
+
+	def shutdown(self) -> None:
+		super().shutdown()
+		with self._conn_lock:
+			if self._conn is not None:
+				self._conn.close()
+				self._conn = None
+		if self._buf is not None:
+			self._buf = None
+			self._shm.close()
@@ -0,0 +1,120 @@
+"""
+Receive filter engine working on raw frames
+"""
+
+# Global imports
+from typing import List
+
+# python-can imports
+from can.typechecking import CanFilters
+
+# Local imports
+from .constants import *
+
+# Offsets within a raw CPC_MSG_T record (see EMSWuenscheBus._recv_raw)
+_REC_ID       = 11
+_REC_LENGTH   = 15
+_REC_FDFLAGS  = 16
+_REC_DATA     = 16
+_REC_FDDATA   = 17
+
+_STD_TYPES    = (CPC_MSG_T_CAN, CPC_MSG_T_RTR)
+_EXT_TYPES    = (CPC_MSG_T_XCAN, CPC_MSG_T_XRTR)
+_RTR_TYPES    = (CPC_MSG_T_RTR, CPC_MSG_T_XRTR)
+
+class _FilterEngine:
+	# Compiled form of python-can filters for raw frames:
+	#  - 11-bit ids: table of 2048 entries with the (ordered) indices of the matching filters
+	#  - 29-bit ids: one dict per distinct mask, mapping the masked id to the indices of the matching filters
+	# A filter may additionally contain "data" and "data_mask" (bytes): the frame only matches if
+	# data[i] & data_mask[i] == payload[i] & data_mask[i] for every given byte (default mask 0xFF).
+	# Remote frames carry no payload, they are matched by their id only.
+	# hits[i] counts the frames accepted by filter i (only the first matching filter counts).
+	# Error frames are matched like python-can does it for their message: as extended id 0.
+	def __init__(self, can_filters : CanFilters):
+		self.filters    = list(can_filters)
+		self.hits       = [0] * len(self.filters)
+		self.rejected   = 0
+		self._payload   = [None] * len(self.filters)
+		std_table       = [[] for _ in range(2048)]
+		ext_tables      = {}
+		for index, _filter in enumerate(self.filters):
+			can_id   = _filter["can_id"]
+			can_mask = _filter["can_mask"]
+			extended = _filter.get("extended")
+			if "data" in _filter:
+				data = bytes(_filter["data"])
+				data_mask = bytes(_filter.get("data_mask", b"\xff" * len(data))).ljust(len(data), b"\x00")
+				self._payload[index] = (len(data), int.from_bytes(data, "big") & int.from_bytes(data_mask, "big"), int.from_bytes(data_mask, "big"))
+			if extended is not True:
+				# Only ids below 2048 can match: bits above are 0 in an 11-bit id
+				if (can_id & can_mask) & ~0x7FF == 0:
+					base = can_id & can_mask & 0x7FF
+					free = ~can_mask & 0x7FF
+					# Enumerate all ids that only differ in the bits that are not masked
+					subset = free
+					while True:
+						std_table[base | subset].append(index)
+						if subset == 0:
+							break
+						subset = (subset - 1) & free
+			if extended is not False:
+				mask = can_mask & 0x1FFFFFFF
+				ext_tables.setdefault(mask, {}).setdefault(can_id & mask, []).append(index)
+		self._std = [tuple(sorted(indices)) if indices else None for indices in std_table]
+		# Masks with the lowest filter index first, so the first matching filter is found first
+		self._ext = sorted(
+			((mask, { value : tuple(indices) for value, indices in table.items() }) for mask, table in ext_tables.items()),
+			key=lambda entry: min(min(indices) for indices in entry[1].values())
+		)
+
+	def filter(self, records : List[bytes]) -> List[bytes]:
+		match = self.match
+		return [record for record in records if match(record)]
+
+	def match(self, record : bytes) -> bool:
+		msg_type = record[0]
+		# Offset of the payload (None: no payload to match, see "data")
+		if msg_type in _STD_TYPES:
+			can_id = int.from_bytes(record[_REC_ID:_REC_ID+4], "little")
+			candidates = self._std[can_id] if can_id < 2048 else None
+			data_offset = None if msg_type in _RTR_TYPES else _REC_DATA
+		elif msg_type in _EXT_TYPES:
+			candidates = self.__ext_candidates(int.from_bytes(record[_REC_ID:_REC_ID+4], "little"))
+			data_offset = None if msg_type in _RTR_TYPES else _REC_DATA
+		elif msg_type == CPC_MSG_T_CANFD:
+			can_id = int.from_bytes(record[_REC_ID:_REC_ID+4], "little")
+			if record[_REC_FDFLAGS] & CPC_FDFLAG_XTD:
+				candidates = self.__ext_candidates(can_id)
+			else:
+				candidates = self._std[can_id] if can_id < 2048 else None
+			data_offset = None if record[_REC_FDFLAGS] & CPC_FDFLAG_RTR else _REC_FDDATA
+		elif msg_type == CPC_MSG_T_CANERROR:
+			candidates = self.__ext_candidates(0)
+			data_offset = None
+		else:
+			return True
+		if candidates is None:
+			self.rejected += 1
+			return False
+		for index in candidates:
+			payload = self._payload[index]
+			if (payload is not None) and (data_offset is not None):
+				length, value, mask = payload
+				if (record[_REC_LENGTH] < length) or ((int.from_bytes(record[data_offset:data_offset+length], "big") & mask) != value):
+					continue
+			self.hits[index] += 1
+			return True
+		self.rejected += 1
+		return False
+
+	def __ext_candidates(self, can_id : int) -> "tuple | None":
+		candidates = None
+		for mask, table in self._ext:
+			found = table.get(can_id & mask)
+			if found is not None:
+				if candidates is None:
+					candidates = found
+				else:
+					candidates = tuple(sorted(candidates + found))
+		return candidates
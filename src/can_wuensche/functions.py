@@ -90,6 +90,17 @@ def __can_wuensche_load_func(func_dec, params):
 		return func_dec(*params)
 	except AttributeError:
 		return __can_wuensche_assign_error
+# Functions that are called per frame: plain restype/argtypes without paramflags take the
+# cheaper call path of ctypes (positional arguments only). _cpclib_dll[name] returns a new
+# function object, so the attribute cache of the library is not modified.
+def __can_wuensche_load_fast_func(name, restype, *argtypes):
+	try:
+		func = _cpclib_dll[name]
+	except AttributeError:
+		return __can_wuensche_assign_error
+	func.restype  = restype
+	func.argtypes = argtypes
+	return func
 
 # library related functions
 CPC_GetLibVersion         = __can_wuensche_load_func(_cpclib_func_decorator(ctypes.c_char_p),(                               ("CPC_GetLibVersion",         _cpclib_dll), None))
@@ -108,13 +119,13 @@ CPC_GetInitParamsPtr      = __can_wuensche_load_func(_cpclib_func_decorator(ctyp
 CPC_ClearMSGQueue         = __can_wuensche_load_func(_cpclib_func_decorator(ctypes.c_int, ctypes.c_int),(                    ("CPC_ClearMSGQueue",         _cpclib_dll), ((1, "handle"),)))
 CPC_BufferClear           = CPC_ClearMSGQueue
 CPC_ClearCMDQueue         = __can_wuensche_load_func(_cpclib_func_decorator(ctypes.c_int, ctypes.c_int, ctypes.c_ubyte),(    ("CPC_ClearCMDQueue",         _cpclib_dll), ((1, "handle"), (1, "confirm"))))
-CPC_GetMSGQueueCnt        = __can_wuensche_load_func(_cpclib_func_decorator(ctypes.c_int, ctypes.c_int),(                    ("CPC_GetMSGQueueCnt",        _cpclib_dll), ((1, "handle"),)))
+CPC_GetMSGQueueCnt        = __can_wuensche_load_fast_func("CPC_GetMSGQueueCnt", ctypes.c_int, ctypes.c_int)
 CPC_GetBufferCnt          = CPC_GetMSGQueueCnt
-CPC_SendMsg               = __can_wuensche_load_func(_cpclib_func_decorator(ctypes.c_int, ctypes.c_int, ctypes.c_ubyte, ctypes.POINTER(CPC_CAN_MSG_T)),(("CPC_SendMsg",     _cpclib_dll), ((1, "handle"), (1, "confirm"), (1, "pCANMsg"))))
-CPC_SendXMsg              = __can_wuensche_load_func(_cpclib_func_decorator(ctypes.c_int, ctypes.c_int, ctypes.c_ubyte, ctypes.POINTER(CPC_CAN_MSG_T)),(("CPC_SendXMsg",    _cpclib_dll), ((1, "handle"), (1, "confirm"), (1, "pCANMsg"))))
-CPC_SendRTR               = __can_wuensche_load_func(_cpclib_func_decorator(ctypes.c_int, ctypes.c_int, ctypes.c_ubyte, ctypes.POINTER(CPC_CAN_MSG_T)),(("CPC_SendRTR",     _cpclib_dll), ((1, "handle"), (1, "confirm"), (1, "pCANMsg"))))
-CPC_SendXRTR              = __can_wuensche_load_func(_cpclib_func_decorator(ctypes.c_int, ctypes.c_int, ctypes.c_ubyte, ctypes.POINTER(CPC_CAN_MSG_T)),(("CPC_SendXRTR",    _cpclib_dll), ((1, "handle"), (1, "confirm"), (1, "pCANMsg"))))
-CPC_SendMsgFD             = __can_wuensche_load_func(_cpclib_func_decorator(ctypes.c_int, ctypes.c_int, ctypes.c_ubyte, ctypes.POINTER(CPC_CANFD_MSG_T)),(("CPC_SendMsgFD", _cpclib_dll), ((1, "handle"), (1, "confirm"), (1, "pCANMsg"))))
+CPC_SendMsg               = __can_wuensche_load_fast_func("CPC_SendMsg", ctypes.c_int, ctypes.c_int, ctypes.c_ubyte, ctypes.POINTER(CPC_CAN_MSG_T))
+CPC_SendXMsg              = __can_wuensche_load_fast_func("CPC_SendXMsg", ctypes.c_int, ctypes.c_int, ctypes.c_ubyte, ctypes.POINTER(CPC_CAN_MSG_T))
+CPC_SendRTR               = __can_wuensche_load_fast_func("CPC_SendRTR", ctypes.c_int, ctypes.c_int, ctypes.c_ubyte, ctypes.POINTER(CPC_CAN_MSG_T))
+CPC_SendXRTR              = __can_wuensche_load_fast_func("CPC_SendXRTR", ctypes.c_int, ctypes.c_int, ctypes.c_ubyte, ctypes.POINTER(CPC_CAN_MSG_T))
+CPC_SendMsgFD             = __can_wuensche_load_fast_func("CPC_SendMsgFD", ctypes.c_int, ctypes.c_int, ctypes.c_ubyte, ctypes.POINTER(CPC_CANFD_MSG_T))
 CPC_Control               = __can_wuensche_load_func(_cpclib_func_decorator(ctypes.c_int, ctypes.c_int, ctypes.c_ushort),(   ("CPC_Control",               _cpclib_dll), ((1, "handle"), (1, "value"))))
 CPC_WaitForMType          = __can_wuensche_load_func(_cpclib_func_decorator(ctypes.POINTER(CPC_MSG_T), ctypes.c_int, ctypes.c_int),(("CPC_WaitForMType",     _cpclib_dll), ((1, "handle"), (1, "mtype"))))
 #CPC_DecodeErrorMsg        = __can_wuensche_load_func(_cpclib_func_decorator(ctypes.c_char_p, ctypes.c_int),(                 ("CPC_DecodeErrorMsg",        _cpclib_dll), ((1, "error"),)))
@@ -133,8 +144,8 @@ CPC_RemoveHandlerEx       = __can_wuensche_not_implemented_error
 ##int   CALL_CONV CPC_RemoveHandler     (int handle, void (CALL_CONV *handler)(int handle, const CPC_MSG_T* pCPCMsg));
 ##int   CALL_CONV CPC_AddHandlerEx      (int handle, void (CALL_CONV *handlerEx)(int handle, const CPC_MSG_T* pCPCMsg, void *customPointer), void *customPointer);
 ##int   CALL_CONV CPC_RemoveHandlerEx   (int handle, void (CALL_CONV *handlerEx)(int handle, const CPC_MSG_T* pCPCMsg, void *customPointer));
-CPC_WaitForEvent          = __can_wuensche_load_func(_cpclib_func_decorator(ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_ubyte),( ("CPC_WaitForEvent",       _cpclib_dll), ((1, "handle"), (1, "timeout"), (1, "event"))))
-CPC_Handle                = __can_wuensche_load_func(_cpclib_func_decorator(ctypes.POINTER(CPC_MSG_T), ctypes.c_int),( ("CPC_Handle",       _cpclib_dll), ((1, "handle"),)))
+CPC_WaitForEvent          = __can_wuensche_load_fast_func("CPC_WaitForEvent", ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_ubyte)
+CPC_Handle                = __can_wuensche_load_fast_func("CPC_Handle", ctypes.POINTER(CPC_MSG_T), ctypes.c_int)
 CPC_RequestCANParams      = __can_wuensche_load_func(_cpclib_func_decorator(ctypes.c_int, ctypes.c_int, ctypes.c_ubyte),( ("CPC_RequestCANParams",       _cpclib_dll), ((1, "handle"), (1, "confirm"))))
 CPC_RequestCANState       = __can_wuensche_load_func(_cpclib_func_decorator(ctypes.c_int, ctypes.c_int, ctypes.c_ubyte),( ("CPC_RequestCANState",       _cpclib_dll), ((1, "handle"), (1, "confirm"))))
 CPC_RequestInfo           = __can_wuensche_load_func(_cpclib_func_decorator(ctypes.c_int, ctypes.c_int, ctypes.c_ubyte, ctypes.c_ubyte, ctypes.c_ubyte),(("CPC_RequestInfo",_cpclib_dll), ((1, "handle"), (1, "confirm"), (1, "source"), (1, "type"))))
@@ -0,0 +1,82 @@
+"""
+Tracking of requested info messages and the process wide device info cache
+"""
+
+# Global imports
+import copy
+import threading
+from concurrent.futures import Future
+
+# Local imports
+from .constants import *
+from .util      import _infoSourceToString, _infoTypeToString
+
+# Device infos per serial number: { serial : { source : { type : value } } }
+_device_info_cache      = {}
+# Serial number per opened channel: { channel_info : serial }
+_device_info_serials    = {}
+_device_info_cache_lock = threading.Lock()
+# Only infos of these sources describe the device (library infos are requested synchronously)
+_device_info_sources    = (_infoSourceToString(CPC_INFOMSG_T_INTERFACE), _infoSourceToString(CPC_INFOMSG_T_DRIVER))
+
+class _InfoRequests:
+	# Pending futures keyed by (source, type) as integers. All futures of a key resolve with the next answer.
+	def __init__(self):
+		self._pending = {}
+		self._lock    = threading.Lock()
+
+	def add(self, info_source : int, info_type : int) -> Future:
+		future = Future()
+		with self._lock:
+			self._pending.setdefault((info_source, info_type), []).append(future)
+		return future
+
+	def resolve(self, info_source : int, info_type : int, value : str) -> None:
+		with self._lock:
+			futures = self._pending.pop((info_source, info_type), None)
+		if futures:
+			for future in futures:
+				if not future.done():
+					future.set_result(value)
+
+	def cancel_all(self) -> None:
+		with self._lock:
+			pending = self._pending
+			self._pending = {}
+		for futures in pending.values():
+			for future in futures:
+				future.cancel()
+
+	def __len__(self) -> int:
+		with self._lock:
+			return len(self._pending)
+
+# Store the device infos of a channel once its serial number is known
+def _info_cache_store(channel_info : str, infomsg : dict) -> None:
+	serial_string = _infoTypeToString(CPC_INFOMSG_T_SERIAL)
+	interface = infomsg.get(_infoSourceToString(CPC_INFOMSG_T_INTERFACE), {})
+	serial = interface.get(serial_string)
+	if not serial:
+		return
+	with _device_info_cache_lock:
+		_device_info_serials[channel_info] = serial
+		_device_info_cache[serial] = { source : dict(infomsg[source]) for source in _device_info_sources if source in infomsg }
+
+# Cached device infos of a channel (or None if the device is unknown). The serial number is taken
+# from the channel description if possible, otherwise from a previous bus on the same channel.
+def _info_cache_lookup(channel_info : str, serial : "str | None" = None) -> "dict | None":
+	with _device_info_cache_lock:
+		if serial is None:
+			serial = _device_info_serials.get(channel_info)
+		if serial is None:
+			return None
+		infomsg = _device_info_cache.get(str(serial))
+		if infomsg is None:
+			return None
+		return copy.deepcopy(infomsg)
+
+def clear_device_info_cache() -> None:
+	"""Forget all cached device infos (e.g. after a firmware update)."""
+	with _device_info_cache_lock:
+		_device_info_cache.clear()
+		_device_info_serials.clear()
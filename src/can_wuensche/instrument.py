@@ -0,0 +1,219 @@
+"""
+Instrumentation of the library calls (CPC_* functions)
+"""
+
+# Global imports
+import ctypes
+import logging
+import os
+import sys
+import threading
+import time
+from typing import Dict
+
+# Local imports
+from . import functions
+
+logger = logging.getLogger("can.can_wuensche")
+
+# Latency histogram: bucket n counts calls below 2^n microseconds (last bucket: everything above)
+_LATENCY_BUCKETS = 24
+
+class _CallStatistics:
+	def __init__(self):
+		self.lock = threading.Lock()
+		self.reset()
+
+	def reset(self) -> None:
+		self.calls             = 0
+		self.timed             = 0
+		self.total_ns          = 0
+		self.min_ns            = None
+		self.max_ns            = 0
+		self.latency_histogram = [0] * _LATENCY_BUCKETS
+		self.errors            = {} # Error code (or exception name) -> count
+
+	def report(self) -> dict:
+		with self.lock:
+			return {
+				"calls"             : self.calls,
+				"timed"             : self.timed,
+				"mean_us"           : (self.total_ns / self.timed / 1000) if self.timed else 0.0,
+				"min_us"            : (self.min_ns or 0) / 1000,
+				"max_us"            : self.max_ns / 1000,
+				"latency_histogram" : { ("<" + str(1 << i) + "us" if i < _LATENCY_BUCKETS-1 else ">=" + str(1 << (i-1)) + "us") : n for i, n in enumerate(self.latency_histogram) },
+				"errors"            : dict(self.errors),
+			}
+
+class _InstrumentedCall:
+	# Stands in for a library function. Compares and hashes like the wrapped function, so
+	# marshalled messages (see message._cpc_send_funcs) that were created before the
+	# instrumentation was enabled still work.
+	def __init__(self, name : str, func, statistics : _CallStatistics):
+		self.__name__    = name
+		self.__wrapped__ = func
+		self._func       = func
+		self._stats      = statistics
+
+	def __eq__(self, other) -> bool:
+		return (other is self._func) or (isinstance(other, _InstrumentedCall) and (other._func is self._func))
+
+	def __hash__(self) -> int:
+		return hash(self._func)
+
+	def __repr__(self) -> str:
+		return "<instrumented " + self.__name__ + ">"
+
+	def __call__(self, *args):
+		stats = self._stats
+		with stats.lock:
+			stats.calls += 1
+			timed = stats.calls % _instrumentation.sample == 0
+		try:
+			if timed:
+				start = time.perf_counter_ns()
+				result = self._func(*args)
+				elapsed = time.perf_counter_ns() - start
+			else:
+				result = self._func(*args)
+		except Exception as e:
+			with stats.lock:
+				stats.errors[type(e).__name__] = stats.errors.get(type(e).__name__, 0) + 1
+			raise
+		if timed or ((type(result) is int) and (result < 0)):
+			with stats.lock:
+				if timed:
+					stats.timed += 1
+					stats.total_ns += elapsed
+					if (stats.min_ns is None) or (elapsed < stats.min_ns):
+						stats.min_ns = elapsed
+					if elapsed > stats.max_ns:
+						stats.max_ns = elapsed
+					stats.latency_histogram[min((elapsed // 1000).bit_length(), _LATENCY_BUCKETS-1)] += 1
+				if (type(result) is int) and (result < 0):
+					stats.errors[result] = stats.errors.get(result, 0) + 1
+		return result
+
+class _Instrumentation:
+	def __init__(self):
+		self.lock       = threading.Lock()
+		self.enabled    = False
+		self.sample     = 1
+		self.statistics = {} # Name -> _CallStatistics
+		self.wrappers   = {} # id(library function) -> _InstrumentedCall
+
+_instrumentation = _Instrumentation()
+
+# The library functions by name (aliases like CPC_BufferClear share the entry of the original)
+def _library_functions() -> Dict[str, object]:
+	retVar = {}
+	seen = set()
+	for name in sorted(vars(functions)):
+		func = getattr(functions, name)
+		if name.startswith("CPC_") and isinstance(func, ctypes._CFuncPtr) and (id(func) not in seen):
+			seen.add(id(func))
+			retVar[name] = func
+	return retVar
+
+# Replace every reference to a library function in the modules of this package (they are
+# imported with "from .functions import *") and in the send function tables of message.py
+def _rebind(mapping : dict) -> None:
+	package = __name__.rpartition(".")[0]
+	for module_name, module in list(sys.modules.items()):
+		if (module is None) or ((module_name != package) and (not module_name.startswith(package + "."))):
+			continue
+		for name, value in list(vars(module).items()):
+			if name.startswith("CPC_") and (id(value) in mapping):
+				setattr(module, name, mapping[id(value)])
+	from . import message
+	message._cpc_send_funcs = tuple(mapping.get(id(func), func) for func in message._cpc_send_funcs)
+	message._cpc_record_send_funcs = { key : mapping.get(id(func), func) for key, func in message._cpc_record_send_funcs.items() }
+
+def enable_instrumentation(sample : int = 1) -> None:
+	"""Count and time all calls of the library functions (see instrumentation_report()).
+
+	Every call is counted and its error codes (negative results) are recorded, but only every
+	sample-th call is timed. Disabled instrumentation costs nothing, the functions are only
+	wrapped while it is enabled. Can also be enabled with the environment variable
+	CAN_WUENSCHE_INSTRUMENT (1 or the sample rate) before the package is imported.
+	"""
+	if sample < 1:
+		raise ValueError("sample must be at least 1")
+	with _instrumentation.lock:
+		_instrumentation.sample = sample
+		if _instrumentation.enabled:
+			return
+		mapping = {}
+		for name, func in _library_functions().items():
+			statistics = _instrumentation.statistics.setdefault(name, _CallStatistics())
+			wrapper = _InstrumentedCall(name=name, func=func, statistics=statistics)
+			_instrumentation.wrappers[id(func)] = wrapper
+			mapping[id(func)] = wrapper
+		_rebind(mapping)
+		_instrumentation.enabled = True
+	logger.debug("Instrumentation of the library calls enabled (sample=" + str(sample) + ")")
+
+def disable_instrumentation() -> None:
+	"""Restore the plain library functions. The recorded statistics are kept."""
+	with _instrumentation.lock:
+		if not _instrumentation.enabled:
+			return
+		_rebind({ id(wrapper) : wrapper._func for wrapper in _instrumentation.wrappers.values() })
+		_instrumentation.wrappers = {}
+		_instrumentation.enabled = False
+
+def reset_instrumentation() -> None:
+	"""Clear the recorded statistics."""
+	with _instrumentation.lock:
+		for statistics in _instrumentation.statistics.values():
+			with statistics.lock:
+				statistics.reset()
+
+# Cost of the time measurement and of a minimal ctypes call in nanoseconds (None if no C
+# library is available to compare against)
+def _calibrate(rounds : int = 10000) -> dict:
+	start = time.perf_counter_ns()
+	for _ in range(rounds):
+		time.perf_counter_ns()
+	timer_ns = (time.perf_counter_ns() - start) / rounds
+	ctypes_ns = None
+	try:
+		labs = ctypes.CDLL(None).labs
+		labs.restype  = ctypes.c_long
+		labs.argtypes = (ctypes.c_long,)
+		start = time.perf_counter_ns()
+		for _ in range(rounds):
+			labs(-1)
+		ctypes_ns = (time.perf_counter_ns() - start) / rounds
+	except Exception:
+		pass
+	return {"timer_ns": timer_ns, "ctypes_call_ns": ctypes_ns}
+
+def instrumentation_report(calibrate : bool = True) -> dict:
+	"""Statistics of all library functions that were called (calls, timed calls, latency in
+	microseconds, latency histogram and error codes), keyed by function name.
+
+	With calibrate=True the report also holds the cost of the time measurement itself and of
+	an empty ctypes call ("overhead"), so the latency of a call can be split into the Python
+	and ctypes overhead and the time spent in the library and driver.
+	"""
+	with _instrumentation.lock:
+		statistics = dict(_instrumentation.statistics)
+		report = {
+			"enabled"   : _instrumentation.enabled,
+			"sample"    : _instrumentation.sample,
+			"functions" : { name : stats.report() for name, stats in sorted(statistics.items()) if stats.calls },
+		}
+	if calibrate:
+		report["overhead"] = _calibrate()
+	return report
+
+def _enable_from_environment() -> None:
+	value = os.environ.get("CAN_WUENSCHE_INSTRUMENT", "").strip().lower()
+	if value in ("", "0", "false", "no", "off"):
+		return
+	try:
+		sample = int(value)
+	except ValueError:
+		sample = 1
+	enable_instrumentation(sample=max(1, sample))
@@ -0,0 +1,309 @@
+"""
+ISO-TP (ISO 15765-2) transport
+"""
+
+# Global imports
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import List
+
+# python-can imports
+from can import Message
+from can import CanOperationError, CanTimeoutError
+
+# Local imports
+from .constants import *
+from .message   import _cpc_marshal
+
+logger = logging.getLogger("can.can_wuensche")
+
+# Protocol control information (upper nibble of the first byte)
+_PCI_SF = 0x0
+_PCI_FF = 0x1
+_PCI_CF = 0x2
+_PCI_FC = 0x3
+# Flow status
+_FS_CTS   = 0
+_FS_WAIT  = 1
+_FS_OVFLW = 2
+# Maximum number of FC.WAIT in a row before the transfer is aborted (N_WFTmax)
+_MAX_WAIT_FRAMES = 10
+# STmin pacing sleeps until shortly before a frame is due and spins for the rest of the time
+_ST_MIN_SPIN_NS = 200_000
+# Valid CAN FD frame lengths
+_FD_LENGTHS = (0, 1, 2, 3, 4, 5, 6, 7, 8, 12, 16, 20, 24, 32, 48, 64)
+
+def _st_min_to_ns(st_min : int) -> int:
+	if st_min <= 0x7F:
+		return st_min * 1_000_000
+	if 0xF1 <= st_min <= 0xF9:
+		return (st_min - 0xF0) * 100_000
+	# Reserved values: use the maximum
+	return 127 * 1_000_000
+
+class EMSWuenscheIsoTp:
+	"""ISO-TP connection on an EMSWuenscheBus.
+
+	Received frames of rx_id are handled inside the receive loop of the bus: flow control frames
+	are answered immediately and segmented messages are reassembled without creating
+	can.Message objects. For sending, all consecutive frames of a block are marshalled up front
+	and written in one batch (or paced by the STmin of the receiver).
+
+	The bus needs to be read for the transport to work. While waiting for flow control or data,
+	the transport reads the bus itself; frames for other ids are kept for recv().
+	"""
+
+	def __init__(
+		self,
+		bus,
+		tx_id : int,
+		rx_id : int,
+		is_extended_id : bool = False,
+		fd : bool = False,
+		bitrate_switch : bool = True,
+		frame_length : "int | None" = None,
+		padding : "int | None" = 0xCC,
+		block_size : int = 0,
+		st_min : int = 0,
+		timeout : float = 1.0,
+		deliver : bool = False,
+	):
+		"""
+		:param int tx_id:
+			Arbitration id of the frames sent by this side.
+		:param int rx_id:
+			Arbitration id of the frames sent by the other side.
+		:param bool fd:
+			Send CAN FD frames (up to 64 bytes, see frame_length).
+		:param int frame_length:
+			Maximum frame length (TX_DL): 8 for classic CAN, default 64 with fd.
+		:param int padding:
+			Fill byte for unused frame bytes, None to send short frames (classic CAN only).
+		:param int block_size:
+			Block size announced in our flow control frames (0: no limit).
+		:param int st_min:
+			Minimum separation time announced in our flow control frames (ISO 15765-2 encoding).
+		:param float timeout:
+			Maximum time to wait for flow control (N_Bs) or the next consecutive frame (N_Cr).
+		:param bool deliver:
+			Also deliver the frames of rx_id to recv() of the bus.
+		"""
+		if frame_length is None:
+			frame_length = 64 if fd else 8
+		if (frame_length not in _FD_LENGTHS) or (frame_length < 8) or ((not fd) and (frame_length != 8)):
+			raise ValueError("Invalid frame length: " + str(frame_length))
+		self.bus            = bus
+		self.tx_id          = tx_id
+		self.rx_id          = rx_id
+		self.is_extended_id = is_extended_id
+		self.fd             = fd
+		self.bitrate_switch = bitrate_switch
+		self.frame_length   = frame_length
+		self.padding        = padding
+		self.block_size     = block_size
+		self.st_min         = st_min
+		self.timeout        = timeout
+		self.deliver        = deliver
+		self._types         = (CPC_MSG_T_XCAN, CPC_MSG_T_CANFD) if is_extended_id else (CPC_MSG_T_CAN, CPC_MSG_T_CANFD)
+		self._received      = queue.Queue()
+		self._fc_future     = None
+		self._tx_lock       = threading.Lock()
+		# Reception state
+		self._rx_data       = None
+		self._rx_length     = 0
+		self._rx_seq        = 0
+		self._rx_block      = 0
+		self._rx_waiting    = None
+		self._fc_cts        = self.__marshal(bytes((0x30 | _FS_CTS, block_size & 0xFF, st_min & 0xFF)))
+		bus._cpc_add_rx_stage(self)
+
+	def close(self) -> None:
+		self.bus._cpc_remove_rx_stage(self)
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		self.close()
+
+	def __marshal(self, data : bytes) -> tuple:
+		fill = bytes((0xCC if self.padding is None else self.padding,))
+		if self.padding is not None:
+			data = data.ljust(8, fill)
+		if self.fd:
+			# Only the valid CAN FD lengths can be sent
+			data = data.ljust(next(n for n in _FD_LENGTHS if n >= len(data)), fill)
+		return _cpc_marshal(Message(
+			arbitration_id=self.tx_id,
+			is_extended_id=self.is_extended_id,
+			data=data,
+			is_fd=self.fd,
+			bitrate_switch=self.fd and self.bitrate_switch,
+		))
+
+	# Split a payload into the marshalled first frame and consecutive frames (or a single frame)
+	def _segment(self, data : bytes) -> List[tuple]:
+		length = len(data)
+		frame_length = self.frame_length
+		if length <= (7 if frame_length == 8 else frame_length - 2):
+			if length <= 7:
+				return [self.__marshal(bytes((length,)) + data)]
+			return [self.__marshal(bytes((0, length)) + data)]
+		if length <= 0xFFF:
+			header = bytes((0x10 | (length >> 8), length & 0xFF))
+		else:
+			header = bytes((0x10, 0)) + length.to_bytes(4, "big")
+		first = frame_length - len(header)
+		frames = [self.__marshal(header + data[:first])]
+		seq = 1
+		for offset in range(first, length, frame_length - 1):
+			frames.append(self.__marshal(bytes((0x20 | seq,)) + data[offset:offset + frame_length - 1]))
+			seq = (seq + 1) & 0x0F
+		return frames
+
+	def send(self, data : bytes, timeout : "float | None" = None) -> None:
+		"""Send a payload, waiting for the flow control of the receiver."""
+		if timeout is None:
+			timeout = self.timeout
+		data = bytes(data)
+		if len(data) > 0xFFFFFFFF:
+			raise ValueError("Payload too long")
+		frames = self._segment(data)
+		with self._tx_lock:
+			if len(frames) == 1:
+				self.bus._cpc_send_batch(frames, timeout=timeout)
+				return
+			self._fc_future = Future()
+			self.bus._cpc_send_batch(frames[:1], timeout=timeout)
+			index = 1
+			while index < len(frames):
+				block_size, st_min_ns = self.__wait_flow_control(timeout=timeout)
+				end = len(frames) if block_size == 0 else min(len(frames), index + block_size)
+				if st_min_ns == 0:
+					self.bus._cpc_send_batch(frames[index:end], timeout=timeout)
+				else:
+					due_ns = time.perf_counter_ns()
+					for frame in frames[index:end]:
+						delay_ns = due_ns - time.perf_counter_ns()
+						if delay_ns > _ST_MIN_SPIN_NS:
+							time.sleep((delay_ns - _ST_MIN_SPIN_NS) / 1_000_000_000)
+						while time.perf_counter_ns() < due_ns:
+							pass
+						self.bus._cpc_send_batch([frame], timeout=timeout)
+						due_ns = time.perf_counter_ns() + st_min_ns
+				index = end
+			self._fc_future = None
+
+	def __wait_flow_control(self, timeout : float) -> tuple:
+		waits = 0
+		while True:
+			future = self._fc_future
+			if not future.done():
+				self.bus._cpc_wait_futures([future], timeout=timeout)
+			if not future.done():
+				self._fc_future = None
+				raise CanTimeoutError(message="ISO-TP: No flow control received (N_Bs)")
+			self._fc_future = Future()
+			flow_status, block_size, st_min = future.result()
+			if flow_status == _FS_CTS:
+				return block_size, _st_min_to_ns(st_min)
+			if flow_status == _FS_WAIT:
+				waits += 1
+				if waits <= _MAX_WAIT_FRAMES:
+					continue
+			self._fc_future = None
+			raise CanOperationError(message="ISO-TP: Transfer rejected by the receiver (flow status " + str(flow_status) + ")")
+
+	def recv(self, timeout : "float | None" = None) -> "bytes | None":
+		"""Next received payload (None on timeout)."""
+		if timeout is None:
+			timeout = self.timeout
+		deadline = time.monotonic() + timeout
+		while True:
+			try:
+				return self._received.get_nowait()
+			except queue.Empty:
+				pass
+			remaining = deadline - time.monotonic()
+			if remaining <= 0:
+				return None
+			# Read the bus until something was received
+			future = Future()
+			self._rx_waiting = future
+			self.bus._cpc_wait_futures([future], timeout=min(remaining, 0.05))
+
+	# Receive stage (see EMSWuenscheBus._cpc_add_rx_stage)
+	def filter(self, records : List[bytes]) -> List[bytes]:
+		match = self.match
+		return [record for record in records if match(record)]
+
+	def match(self, record : bytes) -> bool:
+		msg_type = record[0]
+		if msg_type not in self._types:
+			return True
+		if msg_type == CPC_MSG_T_CANFD:
+			if bool(record[16] & CPC_FDFLAG_XTD) != self.is_extended_id:
+				return True
+			data = record[17:17 + min(record[15], 64)]
+		else:
+			data = record[16:16 + min(record[15], 8)]
+		if (int.from_bytes(record[11:15], "little") != self.rx_id) or not data:
+			return True
+		pci = data[0] >> 4
+		if pci == _PCI_SF:
+			length = data[0] & 0x0F
+			if (length == 0) and (len(data) > 8):
+				self.__received(data[2:2 + data[1]])
+			elif length:
+				self.__received(data[1:1 + length])
+		elif pci == _PCI_FF:
+			length = ((data[0] & 0x0F) << 8) | data[1]
+			offset = 2
+			if length == 0:
+				length = int.from_bytes(data[2:6], "big")
+				offset = 6
+			if self._rx_data is not None:
+				logger.debug("ISO-TP: Reception aborted by a new first frame")
+			self._rx_data   = bytearray(data[offset:])
+			self._rx_length = length
+			self._rx_seq    = 1
+			self._rx_block  = 0
+			self.__send_flow_control(self._fc_cts)
+		elif pci == _PCI_CF:
+			if self._rx_data is None:
+				return self.deliver
+			if (data[0] & 0x0F) != self._rx_seq:
+				logger.debug("ISO-TP: Wrong sequence number, reception aborted")
+				self._rx_data = None
+				return self.deliver
+			self._rx_data += data[1:]
+			self._rx_seq = (self._rx_seq + 1) & 0x0F
+			if len(self._rx_data) >= self._rx_length:
+				payload = bytes(self._rx_data[:self._rx_length])
+				self._rx_data = None
+				self.__received(payload)
+			elif self.block_size:
+				self._rx_block += 1
+				if self._rx_block >= self.block_size:
+					self._rx_block = 0
+					self.__send_flow_control(self._fc_cts)
+		elif pci == _PCI_FC:
+			future = self._fc_future
+			if (future is not None) and (not future.done()) and (len(data) >= 3):
+				future.set_result((data[0] & 0x0F, data[1], data[2]))
+		return self.deliver
+
+	def __received(self, payload : bytes) -> None:
+		self._received.put(bytes(payload))
+		waiting = self._rx_waiting
+		if (waiting is not None) and (not waiting.done()):
+			waiting.set_result(None)
+
+	def __send_flow_control(self, frame : tuple) -> None:
+		try:
+			self.bus._cpc_send_batch([frame], timeout=self.timeout)
+		except Exception as e:
+			logger.debug("ISO-TP: Failed to send flow control: " + str(e))
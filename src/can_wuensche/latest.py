@@ -0,0 +1,190 @@
+"""
+Latest received frame per CAN id
+"""
+
+# Global imports
+import struct
+import threading
+import time
+from typing import List, NamedTuple, Tuple
+
+# python-can imports
+from can import Message
+
+# Local imports
+from .constants import *
+
+_STD_TYPES = (CPC_MSG_T_CAN, CPC_MSG_T_RTR)
+_EXT_TYPES = (CPC_MSG_T_XCAN, CPC_MSG_T_XRTR)
+_RTR_TYPES = (CPC_MSG_T_RTR, CPC_MSG_T_XRTR)
+
+# Slot layout: sequence, timestamp, previous timestamp, first timestamp (ns), count, flags, dlc, length, payload.
+# The sequence is odd while the slot is written (seqlock), readers retry until they got a stable copy.
+_SLOT_HEADER   = struct.Struct("<QQQQIBBBx")
+_SLOT_SEQ      = struct.Struct("<Q")
+_SLOT_SIZE     = _SLOT_HEADER.size + 64
+_FLAG_EXT      = 0x01
+_FLAG_RTR      = 0x02
+_FLAG_FD       = 0x04
+_FLAG_BRS      = 0x08
+_FLAG_ESI      = 0x10
+
+class LatestFrame(NamedTuple):
+	arbitration_id: int
+	is_extended_id: bool
+	timestamp: float
+	dlc: int
+	data: bytes
+	is_remote_frame: bool
+	is_fd: bool
+	bitrate_switch: bool
+	error_state_indicator: bool
+	sequence: int           # Increases with every received frame of this id
+	count: int              # Frames received for this id
+	rate: float             # Mean frames per second since the first frame of this id
+	period: float           # Time between the last two frames of this id in seconds (0.0 if unknown)
+
+	def to_message(self) -> Message:
+		return Message(
+			timestamp=self.timestamp,
+			arbitration_id=self.arbitration_id,
+			is_extended_id=self.is_extended_id,
+			is_remote_frame=self.is_remote_frame,
+			dlc=self.dlc,
+			data=self.data,
+			is_fd=self.is_fd,
+			bitrate_switch=self.bitrate_switch,
+			error_state_indicator=self.error_state_indicator
+		)
+
+class EMSWuenscheLatestValues:
+	"""Latest received frame per id, fed by the receive loop of an EMSWuenscheBus.
+
+	The slots are preallocated: 2048 for the 11-bit ids and ext_capacity for 29-bit ids
+	(assigned on first reception, further ids are counted in overflow). Reads do not take a
+	lock and do not create a can.Message unless asked for.
+
+	Create it with EMSWuenscheBus.cpc_latest_values(). The bus needs to be read (e.g. by a
+	can.Notifier) to keep the store updated.
+	"""
+
+	def __init__(self, ext_capacity : int = 1024, deliver : bool = True):
+		self.deliver       = deliver
+		self.ext_capacity  = ext_capacity
+		self.overflow      = 0
+		self._slots        = bytearray((2048 + ext_capacity) * _SLOT_SIZE)
+		self._std_used     = bytearray(2048)
+		self._ext_slots    = {}   # { 29-bit id : slot index }
+		self._ext_lock     = threading.Lock()
+
+	def filter(self, records : List[bytes]) -> List[bytes]:
+		match = self.match
+		if self.deliver:
+			for record in records:
+				match(record)
+			return records
+		return [record for record in records if match(record)]
+
+	# Store a raw frame (see EMSWuenscheBus._recv_raw). Returns whether the frame is delivered further.
+	def match(self, record : bytes) -> bool:
+		msg_type = record[0]
+		can_id = int.from_bytes(record[11:15], "little")
+		if msg_type in _STD_TYPES:
+			extended = False
+			flags = _FLAG_RTR if msg_type in _RTR_TYPES else 0
+			dlc = record[15]
+			data = b"" if flags else record[16:16 + min(dlc, 8)]
+		elif msg_type in _EXT_TYPES:
+			extended = True
+			flags = _FLAG_EXT | (_FLAG_RTR if msg_type in _RTR_TYPES else 0)
+			dlc = record[15]
+			data = b"" if flags & _FLAG_RTR else record[16:16 + min(dlc, 8)]
+		elif msg_type == CPC_MSG_T_CANFD:
+			fdflags = record[16]
+			extended = bool(fdflags & CPC_FDFLAG_XTD)
+			flags = (_FLAG_EXT if extended else 0) | (_FLAG_RTR if fdflags & CPC_FDFLAG_RTR else 0) | (_FLAG_ESI if fdflags & CPC_FDFLAG_ESI else 0)
+			if not (fdflags & CPC_FDFLAG_NONCANFD_MSG):
+				flags |= _FLAG_FD | (_FLAG_BRS if fdflags & CPC_FDFLAG_BRS else 0)
+			dlc = record[15]
+			data = record[17:17 + min(dlc, 64)]
+		else:
+			return True
+		index = self.__slot(can_id, extended, create=True)
+		if index is None:
+			self.overflow += 1
+			return self.deliver
+		offset = index * _SLOT_SIZE
+		slots = self._slots
+		seq, timestamp, _, first, count, _, _, _ = _SLOT_HEADER.unpack_from(slots, offset)
+		now = int.from_bytes(record[3:7], "little") * 1_000_000_000 + int.from_bytes(record[7:11], "little")
+		_SLOT_SEQ.pack_into(slots, offset, seq + 1)
+		_SLOT_HEADER.pack_into(slots, offset, seq + 1, now, timestamp if count else 0, first if count else now, count + 1, flags, dlc, len(data))
+		slots[offset + _SLOT_HEADER.size : offset + _SLOT_HEADER.size + len(data)] = data
+		_SLOT_SEQ.pack_into(slots, offset, seq + 2)
+		return self.deliver
+
+	def __slot(self, can_id : int, extended : bool, create : bool) -> "int | None":
+		if not extended:
+			if can_id >= 2048:
+				return None
+			if create:
+				self._std_used[can_id] = 1
+			elif not self._std_used[can_id]:
+				return None
+			return can_id
+		index = self._ext_slots.get(can_id)
+		if (index is None) and create:
+			with self._ext_lock:
+				if len(self._ext_slots) >= self.ext_capacity:
+					return None
+				index = 2048 + len(self._ext_slots)
+				self._ext_slots[can_id] = index
+		return index
+
+	def get(self, arbitration_id : int, is_extended_id : bool = False) -> "LatestFrame | None":
+		"""Latest frame of the id (None if nothing was received yet)."""
+		index = self.__slot(arbitration_id, is_extended_id, create=False)
+		if index is None:
+			return None
+		offset = index * _SLOT_SIZE
+		slots = self._slots
+		while True:
+			header = _SLOT_HEADER.unpack_from(slots, offset)
+			seq = header[0]
+			if not seq & 1:
+				data = bytes(slots[offset + _SLOT_HEADER.size : offset + _SLOT_HEADER.size + header[7]])
+				if _SLOT_SEQ.unpack_from(slots, offset)[0] == seq:
+					break
+			# The writer is inside the slot: let it finish instead of spinning against it for the GIL
+			time.sleep(0)
+		seq, timestamp, previous, first, count, flags, dlc, _ = header
+		if count == 0:
+			return None
+		return LatestFrame(
+			arbitration_id=arbitration_id,
+			is_extended_id=is_extended_id,
+			timestamp=timestamp / 1_000_000_000,
+			dlc=dlc,
+			data=data,
+			is_remote_frame=bool(flags & _FLAG_RTR),
+			is_fd=bool(flags & _FLAG_FD),
+			bitrate_switch=bool(flags & _FLAG_BRS),
+			error_state_indicator=bool(flags & _FLAG_ESI),
+			sequence=seq // 2,
+			count=count,
+			rate=((count - 1) * 1_000_000_000 / (timestamp - first)) if timestamp > first else 0.0,
+			period=((timestamp - previous) / 1_000_000_000) if previous else 0.0,
+		)
+
+	def sequence(self, arbitration_id : int, is_extended_id : bool = False) -> int:
+		"""Cheap check for updates: changes with every received frame of the id."""
+		index = self.__slot(arbitration_id, is_extended_id, create=False)
+		if index is None:
+			return 0
+		return _SLOT_SEQ.unpack_from(self._slots, index * _SLOT_SIZE)[0] // 2
+
+	def ids(self) -> List[Tuple[int, bool]]:
+		"""All ids received so far as (arbitration_id, is_extended_id)."""
+		ids = [(can_id, False) for can_id in range(2048) if self._std_used[can_id]]
+		ids.extend((can_id, True) for can_id in list(self._ext_slots))
+		return ids
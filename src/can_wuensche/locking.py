@@ -0,0 +1,76 @@
+"""
+Locking of the receive and transmit paths
+"""
+
+# Global imports
+import threading
+
+class _PathLock:
+	# Reentrant lock of one path (receive or transmit). Only one thread at a time is inside a path,
+	# the other path is independent. Threads entering a path wait while the paths are quiesced,
+	# unless they are already inside a path (they have to finish first) or quiesce themselves.
+	def __init__(self, quiesce : "_Quiesce"):
+		self._quiesce = quiesce
+		self._lock    = threading.RLock()
+		self._owner   = None
+		self._depth   = 0
+
+	def __enter__(self):
+		quiesce = self._quiesce
+		if not quiesce._inside():
+			quiesce._resumed.wait()
+		self._lock.acquire()
+		self._owner = threading.get_ident()
+		self._depth += 1
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		self._depth -= 1
+		if not self._depth:
+			self._owner = None
+		self._lock.release()
+
+class _Quiesce:
+	# Stops both paths, e.g. for a configuration change. Waits until the threads inside the paths
+	# left them (a receiver waits at most one wait slice, see EMSWuenscheBus.__wait_for_read) and
+	# keeps new threads out until the last quiescing thread is done. Reentrant.
+	def __init__(self):
+		self._resumed = threading.Event()
+		self._resumed.set()
+		self._lock    = threading.Lock()
+		self._pending = 0
+		self._owner   = None
+		self._depth   = 0
+		self.rx       = _PathLock(quiesce=self)
+		self.tx       = _PathLock(quiesce=self)
+
+	def _inside(self) -> bool:
+		me = threading.get_ident()
+		return me in (self._owner, self.rx._owner, self.tx._owner)
+
+	def __enter__(self):
+		me = threading.get_ident()
+		if self._owner == me:
+			self._depth += 1
+			return self
+		with self._lock:
+			self._pending += 1
+			self._resumed.clear()
+		# Always in this order: receive path first (a receiver may send, a sender never receives)
+		self.rx._lock.acquire()
+		self.tx._lock.acquire()
+		self._owner = me
+		self._depth = 1
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		self._depth -= 1
+		if self._depth:
+			return
+		self._owner = None
+		self.tx._lock.release()
+		self.rx._lock.release()
+		with self._lock:
+			self._pending -= 1
+			if not self._pending:
+				self._resumed.set()
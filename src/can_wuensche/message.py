@@ -0,0 +1,224 @@
+"""
+Conversion between python-can messages and library structures
+"""
+
+# Global imports
+from typing import Tuple
+
+# python-can imports
+from can import Message
+from can.typechecking import CanFilters
+
+# Local imports
+from .constants  import *
+from .structures import CPC_CAN_MSG_T, CPC_CANFD_MSG_T, CPC_MSG_T
+from .functions  import CPC_SendMsg, CPC_SendXMsg, CPC_SendRTR, CPC_SendXRTR, CPC_SendMsgFD
+
+# Convert a python-can message into the library structure and the matching send function.
+# The result can be handed to EMSWuenscheBus._cpc_write() any number of times.
+def _cpc_marshal(msg: Message) -> tuple:
+	# FD message
+	if msg.is_fd:
+		canmsg = CPC_CANFD_MSG_T()
+		canmsg.length = msg.dlc
+		canmsg.flags = 0
+		if msg.is_extended_id:
+			canmsg.flags |= CPC_FDFLAG_XTD
+			canmsg.id = msg.arbitration_id & 0x1FFFFFFF
+		else:
+			canmsg.id = msg.arbitration_id & 0x000007FF
+		if msg.is_remote_frame:
+			canmsg.flags |= CPC_FDFLAG_RTR
+		else:
+			# Copy data if not rtr
+			for i in range(msg.dlc):
+				canmsg.msg[i] = msg.data[i]
+		if msg.is_error_frame:
+			canmsg.flags |= CPC_FDFLAG_ESI
+		if msg.bitrate_switch:
+			canmsg.flags |= CPC_FDFLAG_BRS
+		return CPC_SendMsgFD, canmsg
+	# Classic CAN message
+	canmsg = CPC_CAN_MSG_T()
+	canmsg.length = msg.dlc
+	# Copy data (for non-rtr messages)
+	if not msg.is_remote_frame:
+		for i in range(msg.dlc):
+			canmsg.msg[i] = msg.data[i]
+	if not msg.is_extended_id:
+		canmsg.id = msg.arbitration_id & 0x000007FF
+		if not msg.is_remote_frame:
+			return CPC_SendMsg, canmsg
+		return CPC_SendRTR, canmsg
+	canmsg.id = msg.arbitration_id & 0x1FFFFFFF
+	if not msg.is_remote_frame:
+		return CPC_SendXMsg, canmsg
+	return CPC_SendXRTR, canmsg
+
+# Message types that carry a frame (see _cpc_msg_to_message)
+_cpc_frame_types = frozenset((CPC_MSG_T_CAN, CPC_MSG_T_XCAN, CPC_MSG_T_RTR, CPC_MSG_T_XRTR, CPC_MSG_T_CANFD, CPC_MSG_T_CANERROR))
+
+# Convert a received frame (any type in _cpc_frame_types) into a python-can message
+def _cpc_msg_to_message(msg : CPC_MSG_T) -> Message:
+	if msg.type == CPC_MSG_T_CANFD:
+		isExt = False
+		isRTR = False
+		isFD = False
+		btrs = False
+		isESI = False
+		if msg.msg.canfdmsg.flags & CPC_FDFLAG_XTD:
+			isExt = True
+		if msg.msg.canfdmsg.flags & CPC_FDFLAG_RTR:
+			isRTR = True
+		if msg.msg.canfdmsg.flags & CPC_FDFLAG_ESI:
+			isESI = True
+		if not (msg.msg.canfdmsg.flags & CPC_FDFLAG_NONCANFD_MSG):
+			isFD = True
+			# baudrate switch is only available with CAN-FD
+			if msg.msg.canfdmsg.flags & CPC_FDFLAG_BRS:
+				btrs = True
+		return Message(
+			timestamp=msg.ts_sec + (msg.ts_nsec / 1_000_000_000.0),
+			arbitration_id=msg.msg.canfdmsg.id,
+			is_extended_id=isExt,
+			is_remote_frame=isRTR,
+			is_error_frame=False,
+			dlc=msg.msg.canfdmsg.length,
+			data=msg.msg.canfdmsg.msg[:msg.msg.canfdmsg.length],
+			is_fd=isFD,
+			bitrate_switch=btrs,
+			error_state_indicator=isESI
+		)
+	elif msg.type == CPC_MSG_T_CAN:
+		return Message(
+			timestamp=msg.ts_sec + (msg.ts_nsec / 1_000_000_000.0),
+			arbitration_id=msg.msg.canmsg.id,
+			is_extended_id=False,
+			is_remote_frame=False,
+			is_error_frame=False,
+			dlc=msg.msg.canmsg.length,
+			data=msg.msg.canmsg.msg[:msg.msg.canmsg.length],
+			is_fd=False,
+			bitrate_switch=False,
+			error_state_indicator=False
+		)
+	elif msg.type == CPC_MSG_T_XCAN:
+		return Message(
+			timestamp=msg.ts_sec + (msg.ts_nsec / 1_000_000_000.0),
+			arbitration_id=msg.msg.canmsg.id,
+			is_extended_id=True,
+			is_remote_frame=False,
+			is_error_frame=False,
+			dlc=msg.msg.canmsg.length,
+			data=msg.msg.canmsg.msg[:msg.msg.canmsg.length],
+			is_fd=False,
+			bitrate_switch=False,
+			error_state_indicator=False
+		)
+	elif msg.type == CPC_MSG_T_RTR:
+		return Message(
+			timestamp=msg.ts_sec + (msg.ts_nsec / 1_000_000_000.0),
+			arbitration_id=msg.msg.canmsg.id,
+			is_extended_id=False,
+			is_remote_frame=True,
+			is_error_frame=False,
+			dlc=msg.msg.canmsg.length,
+			data=[],
+			is_fd=False,
+			bitrate_switch=False,
+			error_state_indicator=False
+		)
+	elif msg.type == CPC_MSG_T_XRTR:
+		return Message(
+			timestamp=msg.ts_sec + (msg.ts_nsec / 1_000_000_000.0),
+			arbitration_id=msg.msg.canmsg.id,
+			is_extended_id=True,
+			is_remote_frame=True,
+			is_error_frame=False,
+			dlc=msg.msg.canmsg.length,
+			data=[],
+			is_fd=False,
+			bitrate_switch=False,
+			error_state_indicator=False
+		)
+	elif msg.type == CPC_MSG_T_CANERROR:
+		if msg.msg.error.ecode == CPC_CAN_ECODE_ERRFRAME:
+			if msg.msg.error.cc.cc_type == SJA1000:
+				# u8 ecc, rxerr, txerr -> 3 bytes in total
+				data = bytes(msg.msg.error.cc.regs.sja1000)
+				return Message(
+					timestamp=msg.ts_sec + (msg.ts_nsec / 1_000_000_000.0),
+					dlc=len(data),
+					data=data,
+					is_error_frame=True
+				)
+			elif msg.msg.error.cc.cc_type == LPC546XX:
+				# u32 psr, ecr -> 8 bytes in total
+				data = bytes(msg.msg.error.cc.regs.lpc546xx)
+				return Message(
+					timestamp=msg.ts_sec + (msg.ts_nsec / 1_000_000_000.0),
+					dlc=len(data),
+					data=data,
+					is_fd=False,
+					is_error_frame=True
+				)
+		return Message(
+			timestamp=msg.ts_sec + (msg.ts_nsec / 1_000_000_000.0),
+			is_error_frame=True
+		)
+
+# Send functions by wire index (see _cpc_marshal_to_bytes)
+_cpc_send_funcs = (CPC_SendMsg, CPC_SendXMsg, CPC_SendRTR, CPC_SendXRTR, CPC_SendMsgFD)
+
+# Serialize a python-can message as one index byte (send function) followed by the library structure
+def _cpc_marshal_to_bytes(msg : Message) -> bytes:
+	send_func, canmsg = _cpc_marshal(msg)
+	return bytes((_cpc_send_funcs.index(send_func),)) + bytes(canmsg)
+
+# Inverse of _cpc_marshal_to_bytes(): returns the send function and the library structure
+def _cpc_unmarshal_bytes(data : bytes) -> tuple:
+	if (len(data) < 1) or (data[0] >= len(_cpc_send_funcs)):
+		raise ValueError("Invalid marshalled message")
+	send_func = _cpc_send_funcs[data[0]]
+	if send_func is CPC_SendMsgFD:
+		return send_func, CPC_CANFD_MSG_T.from_buffer_copy(data, 1)
+	return send_func, CPC_CAN_MSG_T.from_buffer_copy(data, 1)
+
+# Send functions for received frame types (see _cpc_record_to_marshalled)
+_cpc_record_send_funcs = { CPC_MSG_T_CAN : CPC_SendMsg, CPC_MSG_T_XCAN : CPC_SendXMsg, CPC_MSG_T_RTR : CPC_SendRTR, CPC_MSG_T_XRTR : CPC_SendXRTR }
+
+# Convert a raw received frame (CPC_MSG_T as bytes, see EMSWuenscheBus._recv_raw) into a marshalled message
+# (see _cpc_marshal) that sends the same frame. Returns None for records that are no frames (e.g. error frames).
+def _cpc_record_to_marshalled(record : bytes) -> "tuple | None":
+	msg_type = record[0]
+	if msg_type == CPC_MSG_T_CANFD:
+		canmsg = CPC_CANFD_MSG_T.from_buffer_copy(record, 11)
+		# Only the flags that describe the frame are valid for sending
+		canmsg.flags &= CPC_FDFLAG_XTD | CPC_FDFLAG_RTR | CPC_FDFLAG_BRS | CPC_FDFLAG_NONCANFD_MSG
+		return CPC_SendMsgFD, canmsg
+	send_func = _cpc_record_send_funcs.get(msg_type)
+	if send_func is None:
+		return None
+	return send_func, CPC_CAN_MSG_T.from_buffer_copy(record, 11)
+
+# Arbitration id and extended flag of a raw received frame
+def _cpc_record_id(record : bytes) -> Tuple[int, bool]:
+	msg_type = record[0]
+	if msg_type == CPC_MSG_T_CANERROR:
+		# Like the message of an error frame (see _cpc_msg_to_message)
+		return 0, True
+	can_id = int.from_bytes(record[11:15], "little")
+	if msg_type == CPC_MSG_T_CANFD:
+		return can_id, bool(record[16] & CPC_FDFLAG_XTD)
+	return can_id, msg_type in (CPC_MSG_T_XCAN, CPC_MSG_T_XRTR)
+
+# Same semantics as python-can's can_filters (no filters: everything matches)
+def _matches_can_filters(can_id : int, is_extended_id : bool, can_filters : "CanFilters | None") -> bool:
+	if not can_filters:
+		return True
+	for _filter in can_filters:
+		if "extended" in _filter and _filter["extended"] != is_extended_id:
+			continue
+		if (can_id ^ _filter["can_id"]) & _filter["can_mask"] == 0:
+			return True
+	return False
@@ -0,0 +1,98 @@
+"""
+Helpers to bring up many channels at once
+"""
+
+# Global imports
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Sequence
+
+# python-can imports
+from can.typechecking import AutoDetectedConfig
+
+# Local imports
+from .wuensche import EMSWuenscheBus
+
+class EMSWuenscheSession:
+	"""Factory for EMSWuenscheBus instances that share what was learned about the interfaces.
+
+	The channel list is discovered once and reused by every open_all() call. The controller 
+	type that each channel accepted is remembered, so later opens of the same channel skip 
+	the CPC_CANInit retry after CPC_ERR_WRONG_CONTROLLER_TYPE.
+	"""
+
+	def __init__(self):
+		self._lock        = threading.Lock()
+		self._channels    = None
+		self._controllers = {} # { channel key : controller type }
+
+	def channels(self, refresh : bool = False) -> List[AutoDetectedConfig]:
+		"""Channel list of the library (discovered on first use)."""
+		with self._lock:
+			if refresh or (self._channels is None):
+				self._channels = EMSWuenscheBus._detect_available_configs()
+			return list(self._channels)
+
+	def open(self, channel, **kwargs) -> EMSWuenscheBus:
+		"""Open a single channel. See EMSWuenscheBus for the arguments."""
+		key = self._channel_key(channel)
+		if "controller" not in kwargs:
+			with self._lock:
+				controller = self._controllers.get(key)
+			if controller is not None:
+				kwargs["controller"] = controller
+		bus = EMSWuenscheBus(channel=channel, **kwargs)
+		with self._lock:
+			self._controllers[key] = bus.cpc_controller
+		return bus
+
+	def open_all(self, channels : "Sequence | None" = None, max_workers : "int | None" = None, **kwargs) -> List[EMSWuenscheBus]:
+		"""Open several channels concurrently.
+
+		The library calls of the bring-up (open, info requests, CPC_CANInit, CPC_Control) release 
+		the GIL, so the channels come up in parallel instead of one after the other.
+
+		:param channels:
+			Channels to open (see EMSWuenscheBus(channel=...)). Default: all discovered channels.
+		:param max_workers:
+			Maximum number of channels that are opened at the same time (default: all).
+		:param kwargs:
+			Passed to every EMSWuenscheBus.
+		:return:
+			The buses in the order of channels. If any channel fails to open then all other 
+			buses are shut down and the first error is raised.
+		"""
+		if channels is None:
+			channels = [config["channel"] for config in self.channels()]
+		channels = list(channels)
+		if not channels:
+			return []
+		with ThreadPoolExecutor(max_workers=max_workers or len(channels), thread_name_prefix="EMSWuensche open") as executor:
+			futures = [executor.submit(self.open, channel, **kwargs) for channel in channels]
+		buses = []
+		error = None
+		for future in futures:
+			try:
+				buses.append(future.result())
+			except Exception as e:
+				if error is None:
+					error = e
+		if error is not None:
+			for bus in buses:
+				bus.shutdown()
+			raise error
+		return buses
+
+	@staticmethod
+	def _channel_key(channel) -> str:
+		if isinstance(channel, str):
+			return channel.strip()
+		return json.dumps(channel, sort_keys=True)
+
+# Session of open_buses()
+_default_session = EMSWuenscheSession()
+
+def open_buses(channels : "Sequence | None" = None, max_workers : "int | None" = None, **kwargs) -> List[EMSWuenscheBus]:
+	"""Open several channels concurrently with a process wide EMSWuenscheSession (see open_all())."""
+	return _default_session.open_all(channels=channels, max_workers=max_workers, **kwargs)
@@ -0,0 +1,333 @@
+"""
+Multi-channel capture with filtering and writing in a process pool
+"""
+
+# Global imports
+import heapq
+import logging
+import multiprocessing
+import os
+import queue
+import struct
+import threading
+import time
+from array import array
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Sequence, Tuple
+
+# python-can imports
+import can
+from can import Message
+from can.typechecking import CanFilters
+
+# Local imports
+from .constants  import *
+from .structures import CPC_MSG_T
+from .message    import _cpc_msg_to_message, _cpc_record_id, _matches_can_filters
+from .capture    import EMSWuenscheCaptureWriter, EMSWuenscheCaptureReader
+
+logger = logging.getLogger("can.can_wuensche")
+
+_CPC_MSG_SIZE = len(bytes(CPC_MSG_T()))
+
+# Runs in the worker processes: apply the filters (same semantics as python-can's can_filters) to
+# concatenated raw records (see EMSWuenscheBus._recv_raw)
+def _filter_records(data : bytes, filters : "CanFilters | None") -> List[bytes]:
+	records = [data[offset:offset + _CPC_MSG_SIZE] for offset in range(0, len(data), _CPC_MSG_SIZE)]
+	if not filters:
+		return records
+	return [record for record in records if _matches_can_filters(*_cpc_record_id(record), filters)]
+
+# Runs in the worker processes: filter a batch and return the timestamps and the concatenated raw
+# records, so the parent merges on the timestamps and only decodes what it delivers
+def _filter_batch(data : bytes, filters : "CanFilters | None") -> Tuple[array, bytes]:
+	records = _filter_records(data, filters)
+	timestamps = array("d", (sec + nsec / 1_000_000_000 for sec, nsec in (struct.unpack_from("<II", record, 3) for record in records)))
+	return timestamps, b"".join(records)
+
+# Open capture parts of a worker process (one process per bus, see EMSWuenscheCapturePipeline(path=...))
+_part_writers = {}
+
+# Runs in the worker processes: filter a batch and append it to the capture part of the bus
+def _write_part(data : bytes, part : str, channel, filters : "CanFilters | None") -> int:
+	writer = _part_writers.get(part)
+	if writer is None:
+		writer = _part_writers[part] = EMSWuenscheCaptureWriter(part, channel_info=str(channel))
+	records = _filter_records(data, filters)
+	writer.write_raw(records)
+	return len(records)
+
+# Runs in the worker processes: close the capture part (an empty one if the bus received nothing)
+def _close_part(part : str, channel) -> None:
+	writer = _part_writers.pop(part, None)
+	if writer is None:
+		writer = EMSWuenscheCaptureWriter(part, channel_info=str(channel))
+	writer.close()
+
+# Runs in a worker process: merge the capture parts by timestamp into a file of any format
+# supported by can.Logger. Returns the number of messages.
+def _merge_parts(parts : List[str], path : str) -> int:
+	def stream(part : str):
+		reader = EMSWuenscheCaptureReader(part)
+		channel = reader.channel_info or None
+		for record in reader.records():
+			sec, nsec = struct.unpack_from("<II", record, 3)
+			yield sec, nsec, record, channel
+	count = 0
+	with can.Logger(path) as writer:
+		for _, _, record, channel in heapq.merge(*[stream(part) for part in parts], key=lambda item: (item[0], item[1])):
+			msg = _cpc_msg_to_message(CPC_MSG_T.from_buffer_copy(record))
+			msg.channel = channel
+			writer.on_message_received(msg)
+			count += 1
+	return count
+
+class EMSWuenscheCapturePipeline:
+	"""Capture several buses with the filtering and writing spread over worker processes.
+
+	One reader thread per bus only copies the raw frames into batches, the reading process
+	never creates messages for them.
+
+	With path, each bus has its own worker process that filters the batches and appends them to
+	a capture part of the bus (EMSWuenscheCaptureWriter format, exact timestamps). On stop(), the
+	parts are merged by timestamp into path by another worker process. A path ending in .cap
+	keeps one capture file per bus instead (<name>.<bus index>.cap).
+
+	With a writer (e.g. can.Logger) or recv(), the workers filter the batches and return them
+	raw with their timestamps. A merge thread delivers the frames of all buses ordered by
+	timestamp (within reorder_window) and only converts the delivered frames into messages.
+
+	Memory is bounded: at most max_pending batches are in flight, after that the readers wait
+	and the frames are buffered by the driver. The workers are started with the "spawn" method,
+	so the main module needs an ``if __name__ == "__main__":`` guard.
+	"""
+
+	def __init__(
+		self,
+		buses : Sequence,
+		writer = None,
+		workers : "int | None" = None,
+		batch_size : int = 512,
+		batch_interval : float = 0.05,
+		max_pending : int = 64,
+		reorder_window : float = 0.1,
+		can_filters : "CanFilters | None" = None,
+		mp_context = None,
+		path : "str | None" = None,
+		keep_parts : bool = False,
+	):
+		"""
+		:param buses:
+			EMSWuenscheBus instances to capture. They must not be read by anybody else meanwhile.
+		:param writer:
+			Receives the merged messages through on_message_received() (e.g. can.Logger or another
+			can.Listener). If None (and no path), the messages are returned by recv().
+		:param int workers:
+			Number of filtering processes for writer and recv() (default: number of CPUs). With
+			path, every bus has its own process.
+		:param int batch_size:
+			Maximum number of frames per batch.
+		:param float batch_interval:
+			Maximum time a reader collects frames before a batch is submitted.
+		:param int max_pending:
+			Maximum number of batches that are being processed or waiting for the merge.
+		:param float reorder_window:
+			Messages are held back this long (in timestamp time) to merge the buses in order
+			(writer and recv() only).
+		:param can_filters:
+			Filters in python-can format, applied by the workers.
+		:param str path:
+			File of any format supported by can.Logger that the workers write (see above).
+		:param bool keep_parts:
+			Keep the capture parts of the buses after merging them into path.
+		"""
+		if (writer is not None) and (path is not None):
+			raise ValueError("Use either writer or path")
+		self.buses           = list(buses)
+		self.writer          = writer
+		self.path            = path
+		self.keep_parts      = keep_parts
+		self.batch_size      = batch_size
+		self.batch_interval  = batch_interval
+		self.reorder_window  = reorder_window
+		self.can_filters     = can_filters
+		self.frames_in       = 0
+		self.frames_out      = 0
+		self.frames_dropped  = 0 # recv() only: frames that did not fit into the output queue on stop()
+		self.batches         = 0
+		self.parts           = []
+		if path is not None:
+			root, ext = os.path.splitext(path)
+			self.parts = [root + "." + str(index) + ".cap" for index in range(len(self.buses))]
+		self._workers        = workers
+		self._mp_context     = mp_context if mp_context is not None else multiprocessing.get_context("spawn")
+		self._pending        = queue.Queue(maxsize=max_pending) # (bus index, future) in submit order
+		self._output         = queue.Queue(maxsize=max_pending * batch_size) if (writer is None) and (path is None) else None
+		self._stopped        = threading.Event()
+		self._executors      = []
+		self._readers        = []
+		self._merger         = None
+		self._counter_lock   = threading.Lock()
+
+	def start(self) -> None:
+		if self._executors:
+			return
+		self._stopped.clear()
+		if self.path is not None:
+			# One process per bus, so the batches of a bus are written in order
+			self._executors = [ProcessPoolExecutor(max_workers=1, mp_context=self._mp_context) for _ in self.buses]
+		else:
+			self._executors = [ProcessPoolExecutor(max_workers=self._workers, mp_context=self._mp_context)]
+		self._merger = threading.Thread(target=self._merge, name="EMSWuensche capture merge", daemon=True)
+		self._merger.start()
+		for index, bus in enumerate(self.buses):
+			reader = threading.Thread(target=self._read, args=(index, bus), name="EMSWuensche capture reader " + str(bus.channel_info), daemon=True)
+			reader.start()
+			self._readers.append(reader)
+
+	def stop(self) -> None:
+		"""Stop reading, write or deliver everything that was read so far. With recv(), the frames 
+		that do not fit into the output queue any more are dropped (see frames_dropped) instead of 
+		waiting for a consumer."""
+		if not self._executors:
+			return
+		self._stopped.set()
+		for reader in self._readers:
+			reader.join()
+		self._readers = []
+		self._pending.put(None)
+		self._merger.join()
+		if self.path is not None:
+			for executor, part, bus in zip(self._executors, self.parts, self.buses):
+				executor.submit(_close_part, part, bus.channel_info).result()
+			if not self.path.lower().endswith(".cap"):
+				# Merge in a worker process as well, the capturing process stays free
+				self._executors[0].submit(_merge_parts, self.parts, self.path).result()
+				if not self.keep_parts:
+					for part in self.parts:
+						if os.path.exists(part):
+							os.remove(part)
+		for executor in self._executors:
+			executor.shutdown()
+		self._executors = []
+
+	def recv(self, timeout : "float | None" = None) -> "Message | None":
+		"""Next merged message (only if neither writer nor path were given)."""
+		if self._output is None:
+			raise RuntimeError("The messages are passed to the writer")
+		try:
+			return self._output.get(timeout=timeout)
+		except queue.Empty:
+			return None
+
+	def __enter__(self):
+		self.start()
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		self.stop()
+
+	def _submit(self, index : int, data : bytes):
+		if self.path is not None:
+			return self._executors[index].submit(_write_part, data, self.parts[index], self.buses[index].channel_info, self.can_filters)
+		return self._executors[0].submit(_filter_batch, data, self.can_filters)
+
+	def _read(self, index : int, bus) -> None:
+		records = []
+		deadline = time.monotonic() + self.batch_interval
+		while True:
+			stopped = self._stopped.is_set()
+			if not stopped:
+				try:
+					records.extend(bus._recv_raw(timeout=max(0.0, deadline - time.monotonic()), max_count=self.batch_size - len(records)))
+				except Exception as e:
+					logger.exception(e)
+					stopped = True
+			if records and (stopped or (len(records) >= self.batch_size) or (time.monotonic() >= deadline)):
+				with self._counter_lock:
+					self.frames_in += len(records)
+					self.batches   += 1
+				# Blocks while max_pending batches are in flight
+				self._pending.put((index, self._submit(index, b"".join(records))))
+				records = []
+			if stopped:
+				return
+			if time.monotonic() >= deadline:
+				deadline = time.monotonic() + self.batch_interval
+
+	def _merge(self) -> None:
+		streams = {} # Bus index -> deque of [timestamps, records, position]
+		newest = None
+		while True:
+			try:
+				item = self._pending.get(timeout=self.reorder_window)
+			except queue.Empty:
+				# Nothing arrived for a while: deliver everything
+				self._emit(streams, None)
+				continue
+			if item is None:
+				self._emit(streams, None)
+				return
+			index, future = item
+			try:
+				result = future.result()
+			except Exception as e:
+				logger.exception(e)
+				continue
+			if self.path is not None:
+				# Written by the worker
+				self.frames_out += result
+				continue
+			timestamps, records = result
+			if timestamps:
+				streams.setdefault(index, deque()).append([timestamps, records, 0])
+				if (newest is None) or (timestamps[-1] > newest):
+					newest = timestamps[-1]
+			if newest is not None:
+				self._emit(streams, newest - self.reorder_window)
+
+	# Deliver all held back frames up to the given timestamp (None: all), merged by timestamp over
+	# the buses. The batches of one bus are already in order.
+	def _emit(self, streams : dict, until : "float | None") -> None:
+		heap = [(batches[0][0][batches[0][2]], index) for index, batches in streams.items() if batches]
+		heapq.heapify(heap)
+		while heap:
+			timestamp, index = heap[0]
+			if (until is not None) and (timestamp > until):
+				return
+			batches = streams[index]
+			batch = batches[0]
+			position = batch[2]
+			msg = _cpc_msg_to_message(CPC_MSG_T.from_buffer_copy(batch[1], position * _CPC_MSG_SIZE))
+			msg.channel = self.buses[index].channel_info
+			if self.writer is not None:
+				self.frames_out += 1
+				self.writer.on_message_received(msg)
+			else:
+				self._deliver(msg)
+			position += 1
+			if position < len(batch[0]):
+				batch[2] = position
+			else:
+				batches.popleft()
+			if batches:
+				heapq.heapreplace(heap, (batches[0][0][batches[0][2]], index))
+			else:
+				heapq.heappop(heap)
+
+	# Hand a message to recv(). Waits while the output queue is full, but not after stop(): the 
+	# consumer may be gone, so the merge thread (and stop()) must not block on it.
+	def _deliver(self, msg : Message) -> None:
+		while not self._stopped.is_set():
+			try:
+				self._output.put(msg, timeout=0.1)
+				self.frames_out += 1
+				return
+			except queue.Full:
+				pass
+		try:
+			self._output.put_nowait(msg)
+			self.frames_out += 1
+		except queue.Full:
+			self.frames_dropped += 1
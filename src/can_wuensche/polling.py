@@ -0,0 +1,151 @@
+"""
+Receive strategies (blocking wait, busy polling)
+"""
+
+# Global imports
+import logging
+import os
+import threading
+import time
+from typing import Sequence
+
+# Local imports
+from .constants import *
+from .functions import *
+
+logger = logging.getLogger("can.can_wuensche")
+
+class RxPollStrategy:
+	"""Strategy of an EMSWuenscheBus to wait for received frames.
+
+	CPC_WaitForEvent only takes whole milliseconds and puts the receiving thread to sleep, so
+	every frame pays the wakeup latency of the scheduler. Polling keeps the thread running
+	instead and picks up a frame as soon as the library has it, at the cost of a busy core.
+
+	:param str mode:
+		"blocking" always waits in CPC_WaitForEvent (default of the bus), "hybrid" polls for
+		spin seconds first and falls back to the blocking wait for the rest of the timeout,
+		"spin" polls for the whole timeout.
+
+	:param float spin:
+		Time in seconds to poll before the blocking wait ("hybrid" only).
+
+	:param float cpu_budget:
+		Share (0..1] of the time that the receiving thread may spend polling, measured over
+		budget_window seconds. Once the budget is used up, the bus waits blocking until the
+		next window. Use 1.0 for a dedicated core.
+
+	:param float budget_window:
+		Length of the window for cpu_budget in seconds.
+
+	:param cpus:
+		CPU number (or numbers) the receiving thread is pinned to on its first wait (Linux
+		only, see os.sched_setaffinity). Use None to leave the affinity alone.
+	"""
+	BLOCKING = "blocking"
+	HYBRID   = "hybrid"
+	SPIN     = "spin"
+
+	def __init__(
+		self,
+		mode : str = HYBRID,
+		spin : float = 0.0005,
+		cpu_budget : float = 1.0,
+		budget_window : float = 1.0,
+		cpus : "int | Sequence[int] | None" = None,
+	):
+		if mode not in (self.BLOCKING, self.HYBRID, self.SPIN):
+			raise ValueError("Unknown receive strategy: '" + str(mode) + "'")
+		if spin < 0:
+			raise ValueError("spin must not be negative")
+		if not 0 < cpu_budget <= 1:
+			raise ValueError("cpu_budget must be within (0, 1]")
+		if budget_window <= 0:
+			raise ValueError("budget_window must be greater than 0")
+		self.mode          = mode
+		self.spin          = spin
+		self.cpu_budget    = cpu_budget
+		self.budget_window = budget_window
+		self.cpus          = None if cpus is None else ({cpus} if isinstance(cpus, int) else set(cpus))
+
+	def __repr__(self) -> str:
+		return "RxPollStrategy(mode=" + repr(self.mode) + ", spin=" + str(self.spin) + ", cpu_budget=" + str(self.cpu_budget) + ", budget_window=" + str(self.budget_window) + ", cpus=" + repr(self.cpus) + ")"
+
+class _RxPoller:
+	# Polls the library for received messages according to an RxPollStrategy. Only used by the
+	# receive path (one thread at a time, see locking.py).
+	def __init__(self, strategy : RxPollStrategy):
+		self.strategy     = strategy
+		self._pinned      = set() # Threads that were pinned already
+		self._window_ns   = round(strategy.budget_window * 1_000_000_000)
+		self._window_end  = 0
+		self._budget_ns   = 0     # Polling time left in the current window
+		self.reset_statistics()
+
+	def reset_statistics(self) -> None:
+		self.hits      = 0 # Waits that were satisfied by polling
+		self.misses    = 0 # Waits that fell back to the blocking wait (or returned empty)
+		self.throttled = 0 # Waits without polling because the budget was used up
+		self.spin_ns   = 0 # Total polling time
+
+	def statistics(self) -> dict:
+		return {
+			"mode"      : self.strategy.mode,
+			"hits"      : self.hits,
+			"misses"    : self.misses,
+			"throttled" : self.throttled,
+			"spin_time" : self.spin_ns / 1_000_000_000,
+		}
+
+	def _pin(self) -> None:
+		ident = threading.get_ident()
+		if ident in self._pinned:
+			return
+		self._pinned.add(ident)
+		if not hasattr(os, "sched_setaffinity"):
+			logger.warning("Receive strategy: CPU pinning is not supported on this platform")
+			return
+		try:
+			# Pid 0 is the calling thread
+			os.sched_setaffinity(0, self.strategy.cpus)
+			logger.debug("Receive strategy: Pinned thread " + str(ident) + " to CPU(s) " + str(sorted(self.strategy.cpus)))
+		except OSError as e:
+			logger.warning("Receive strategy: Failed to pin the receiving thread: " + str(e))
+
+	# Poll for up to timeout seconds. Returns the CPC_WaitForEvent() result (0 if nothing
+	# arrived) and the time left for a blocking wait.
+	def poll(self, handle : int, timeout : float) -> "tuple[int, float]":
+		strategy = self.strategy
+		if strategy.mode == RxPollStrategy.BLOCKING:
+			return 0, timeout
+		if strategy.cpus is not None:
+			self._pin()
+		start = time.perf_counter_ns()
+		if start >= self._window_end:
+			self._window_end = start + self._window_ns
+			self._budget_ns  = round(self._window_ns * strategy.cpu_budget)
+		if self._budget_ns <= 0:
+			self.throttled += 1
+			return 0, timeout
+		spin = timeout if strategy.mode == RxPollStrategy.SPIN else min(strategy.spin, timeout)
+		deadline = start + min(round(spin * 1_000_000_000), self._budget_ns)
+		result = 0
+		while True:
+			# Messages that the library already buffered, then the device (without waiting)
+			if CPC_GetMSGQueueCnt(handle) > 0:
+				result = EVENT_READ
+				break
+			result = CPC_WaitForEvent(handle, 0, EVENT_READ)
+			if (result < 0) or (result & EVENT_READ):
+				break
+			result = 0
+			if time.perf_counter_ns() >= deadline:
+				break
+		now = time.perf_counter_ns()
+		self.spin_ns   += now - start
+		self._budget_ns -= now - start
+		if result:
+			self.hits += 1
+			return result, 0.0
+		self.misses += 1
+		return 0, max(0.0, timeout - (now - start) / 1_000_000_000)
@@ -0,0 +1,113 @@
+"""
+Helpers for the automatic recovery of a channel
+"""
+
+from collections import deque
+from typing import NamedTuple
+
+class ConnectionGap(NamedTuple):
+	"""Outage of a channel that was bridged by the resilient mode (see EMSWuenscheBus(reconnect=True))."""
+	start       : float # Time of the disconnect (time.time())
+	end         : float # Time of the successful reconnect (time.time())
+	duration    : float # Outage in seconds
+	tx_replayed : int   # Messages sent during the outage and transmitted after the reconnect
+	tx_dropped  : int   # Messages sent during the outage that were lost (backlog full or transmit failed)
+
+class _Backoff:
+	# Exponential backoff: 0, delay, 2*delay, 4*delay, ... limited to max_delay
+	def __init__(self, delay : float, max_delay : float):
+		if delay < 0 or max_delay < 0:
+			raise ValueError("Backoff delays must not be negative")
+		self._delay     = delay
+		self._max_delay = max(delay, max_delay)
+		self._next      = 0.0
+
+	def reset(self) -> None:
+		self._next = 0.0
+
+	def next(self) -> float:
+		retVar = self._next
+		if self._next == 0.0:
+			self._next = self._delay
+		else:
+			self._next = min(self._next * 2, self._max_delay)
+		return retVar
+
+class BusOffRecovery(NamedTuple):
+	"""Bus-off event that was recovered automatically (see BusOffRecoveryPolicy)."""
+	start       : float # Time of the bus-off report (time.time())
+	end         : float # Time of the successful recovery (time.time())
+	duration    : float # Downtime in seconds
+	restarts    : int   # Number of controller restarts (0 if the controller recovered on its own)
+	rx_dropped  : int   # Received frames lost during the downtime (reported by CPC_MSG_T_OVERRUN)
+	tx_dropped  : int   # Messages that could not be sent during the downtime
+
+class BusOffRecoveryPolicy:
+	"""Policy for the automatic restart of a controller after bus-off.
+
+	:param str mode:
+		"immediate" restarts the controller as soon as the bus-off is reported, "delayed" 
+		waits for delay seconds and "backoff" starts with delay and doubles the delay for 
+		every consecutive bus-off (up to max_delay).
+
+	:param float delay:
+		Delay in seconds before a restart ("delayed" and "backoff" only).
+
+	:param float max_delay:
+		Upper limit in seconds for the delay in "backoff" mode.
+
+	:param int max_restarts:
+		Maximum number of restarts within restart_window seconds. Further restarts are 
+		postponed until the window allows them again. Use 0 to disable the limit.
+
+	:param float restart_window:
+		Length of the window for max_restarts in seconds. A bus that stays error free for 
+		that long resets the backoff delay.
+	"""
+	IMMEDIATE = "immediate"
+	DELAYED   = "delayed"
+	BACKOFF   = "backoff"
+
+	def __init__(
+		self,
+		mode : str = IMMEDIATE,
+		delay : float = 0.1,
+		max_delay : float = 5.0,
+		max_restarts : int = 10,
+		restart_window : float = 60.0,
+	):
+		if mode not in (self.IMMEDIATE, self.DELAYED, self.BACKOFF):
+			raise ValueError("Unknown bus-off recovery mode: '" + str(mode) + "'")
+		if max_restarts < 0 or restart_window <= 0:
+			raise ValueError("Invalid bus-off restart rate")
+		self.mode           = mode
+		self.delay          = delay
+		self.max_restarts   = max_restarts
+		self.restart_window = restart_window
+		self._backoff       = _Backoff(delay=delay, max_delay=max_delay)
+		self._restarts      = deque()
+		self._last_restart  = None
+
+	# Delay in seconds until the next restart, 'now' is a time.monotonic() value
+	def _next_delay(self, now : float) -> float:
+		if self.mode == self.IMMEDIATE:
+			delay = 0.0
+		elif self.mode == self.DELAYED:
+			delay = self.delay
+		else:
+			# A bus that stayed error free for a while starts with the short delay again
+			if (self._last_restart is not None) and (now - self._last_restart > self.restart_window):
+				self._backoff.reset()
+			delay = self._backoff.next()
+			if delay == 0.0:
+				delay = self._backoff.next()
+		# Limit the restart rate
+		while self._restarts and (now - self._restarts[0] > self.restart_window):
+			self._restarts.popleft()
+		if self.max_restarts and (len(self._restarts) >= self.max_restarts):
+			delay = max(delay, self._restarts[0] + self.restart_window - now)
+		return delay
+
+	def _restarted(self, now : float) -> None:
+		self._restarts.append(now)
+		self._last_restart = now
@@ -0,0 +1,197 @@
+"""
+Timestamp accurate replay of recorded logs
+"""
+
+# Global imports
+import logging
+import threading
+import time
+from collections import deque
+from typing import Iterator, NamedTuple
+
+# python-can imports
+import can
+from can.typechecking import CanFilters
+
+# Local imports
+from .capture import EMSWuenscheCaptureReader
+from .message import _cpc_marshal, _cpc_record_to_marshalled, _cpc_record_id, _matches_can_filters
+
+logger = logging.getLogger("can.can_wuensche")
+
+# Frames whose deadlines are this close are sent together
+_REPLAY_SLOT_NS = 500_000
+# The replay sleeps until shortly before a deadline and spins for the rest of the time
+_REPLAY_SPIN_NS = 1_000_000
+# Frames read ahead of the current one
+_REPLAY_LOOKAHEAD = 1024
+
+class ReplayReport(NamedTuple):
+	frames: int             # Number of frames sent
+	loops: int              # Number of completed passes through the log
+	intended: float         # Duration of the sent part of the log (after speed scaling) in seconds
+	achieved: float         # Time the replay actually took in seconds
+	mean_error_us: float    # Mean send time error (positive: late) in microseconds
+	max_late_us: float      # Largest delay of a frame in microseconds
+	max_early_us: float     # Largest advance of a frame (batching) in microseconds
+
+class EMSWuenscheReplay:
+	"""Replay a recorded log on an EMSWuenscheBus with the original timing.
+
+	Capture files of EMSWuenscheCaptureWriter are memory-mapped and their records are sent
+	without creating can.Message objects. Any other format supported by can.LogReader (BLF,
+	ASC, ...) is read through python-can. The log is streamed: only a lookahead window of
+	frames is marshalled ahead of time, so the memory does not grow with the length of the log.
+	Frames that are due together are sent in batches of at most max_batch frames that wait for
+	transmit buffer space.
+	"""
+
+	def __init__(
+		self,
+		bus,
+		path : str,
+		speed : "float | None" = 1.0,
+		loop : "bool | int" = False,
+		can_filters : "CanFilters | None" = None,
+		timeout : "float | None" = 1.0,
+		max_batch : int = 64,
+	):
+		"""
+		:param bus:
+			The EMSWuenscheBus to send on.
+		:param str path:
+			Capture file or any log file supported by can.LogReader.
+		:param float speed:
+			Time scaling (2.0: twice as fast). None sends as fast as possible.
+		:param loop:
+			True repeats the log until stop() is called, an integer gives the number of passes.
+		:param can_filters:
+			Only frames matching these filters (python-can format) are sent.
+		:param float timeout:
+			Maximum time to wait for transmit buffer space.
+		:param int max_batch:
+			Maximum number of frames handed to the device at once (e.g. the depth of its transmit
+			queue), also if speed is None.
+		"""
+		if (speed is not None) and (speed <= 0):
+			raise ValueError("The speed must be greater than 0")
+		if max_batch <= 0:
+			raise ValueError("max_batch must be greater than 0")
+		self.bus         = bus
+		self.path        = path
+		self.speed       = speed
+		self.loops       = None if loop is True else (int(loop) if loop else 1)
+		self.can_filters = can_filters
+		self.timeout     = timeout
+		self.max_batch   = max_batch
+		self._stop       = threading.Event()
+		try:
+			self._capture = EMSWuenscheCaptureReader(path)
+		except ValueError:
+			self._capture = None
+
+	# Frames of the log as (timestamp in ns, marshalled message), read on demand
+	def __frames(self) -> Iterator[tuple]:
+		can_filters = self.can_filters
+		if self._capture is not None:
+			for record in self._capture.records():
+				marshalled = _cpc_record_to_marshalled(record)
+				if marshalled is None:
+					continue
+				if can_filters and not _matches_can_filters(*_cpc_record_id(record), can_filters):
+					continue
+				yield int.from_bytes(record[3:7], "little") * 1_000_000_000 + int.from_bytes(record[7:11], "little"), marshalled
+		else:
+			with can.LogReader(self.path) as reader:
+				for msg in reader:
+					if msg.is_error_frame:
+						continue
+					if can_filters and not _matches_can_filters(msg.arbitration_id, msg.is_extended_id, can_filters):
+						continue
+					yield round(msg.timestamp * 1_000_000_000), _cpc_marshal(msg)
+
+	def __len__(self) -> int:
+		"""Number of frames of one pass (reads the whole log)."""
+		return sum(1 for _ in self.__frames())
+
+	def stop(self) -> None:
+		"""Stop a running replay (e.g. from another thread)."""
+		self._stop.set()
+
+	def run(self) -> ReplayReport:
+		"""Replay the log and return the timing report."""
+		self._stop.clear()
+		sent      = 0
+		loops     = 0
+		intended  = 0
+		error_sum = 0
+		max_late  = 0
+		max_early = 0
+		begin_ns  = time.perf_counter_ns()
+		start_ns  = begin_ns
+		while ((self.loops is None) or (loops < self.loops)) and (not self._stop.is_set()):
+			frames    = self.__frames()
+			window    = deque() # (deadline relative to start_ns, marshalled)
+			exhausted = False
+			first     = None
+			last      = 0       # Latest deadline read so far
+			last_sent = 0       # Deadline of the last frame sent
+			count     = 0
+			try:
+				while not self._stop.is_set():
+					# Read ahead. Deadlines are relative to the start and never run backwards (e.g. merged logs).
+					while (not exhausted) and (len(window) < _REPLAY_LOOKAHEAD):
+						try:
+							timestamp, marshalled = next(frames)
+						except StopIteration:
+							exhausted = True
+							break
+						if first is None:
+							first = timestamp
+						if self.speed is not None:
+							last = max(last, round((timestamp - first) / self.speed))
+						window.append((last, marshalled))
+					if not window:
+						break
+					due_ns = start_ns + window[0][0]
+					delay_ns = due_ns - time.perf_counter_ns()
+					if delay_ns > _REPLAY_SPIN_NS:
+						self._stop.wait((delay_ns - _REPLAY_SPIN_NS) / 1_000_000_000)
+						continue
+					while time.perf_counter_ns() < due_ns:
+						pass
+					# Send what is due within the current slot
+					limit = time.perf_counter_ns() + _REPLAY_SLOT_NS - start_ns
+					batch = []
+					while window and (window[0][0] <= limit) and (len(batch) < self.max_batch):
+						batch.append(window.popleft())
+					self.bus._cpc_send_batch([marshalled for _, marshalled in batch], timeout=self.timeout)
+					sent_ns = time.perf_counter_ns() - start_ns
+					for deadline, _ in batch:
+						error = sent_ns - deadline
+						error_sum += error
+						if error > max_late:
+							max_late = error
+						elif error < max_early:
+							max_early = error
+					sent += len(batch)
+					count += len(batch)
+					last_sent = batch[-1][0]
+			finally:
+				frames.close()
+			intended += last_sent
+			if (not count) or window or (not exhausted):
+				# Empty log or stopped
+				break
+			loops += 1
+			# The next pass starts right after the last frame of this one
+			start_ns = max(time.perf_counter_ns(), start_ns + last)
+		return ReplayReport(
+			frames=sent,
+			loops=loops,
+			intended=intended / 1_000_000_000,
+			achieved=(time.perf_counter_ns() - begin_ns) / 1_000_000_000,
+			mean_error_us=(error_sum / sent / 1000) if sent else 0.0,
+			max_late_us=max_late / 1000,
+			max_early_us=-max_early / 1000,
+		)
@@ -0,0 +1,212 @@
+"""
+Single-thread periodic transmit scheduler
+"""
+
+# Global imports
+import heapq
+import logging
+import threading
+import time
+from typing import Callable, Sequence
+
+# python-can imports
+from can import Message
+from can.broadcastmanager import LimitedDurationCyclicSendTaskABC, ModifiableCyclicTaskABC, RestartableCyclicTaskABC
+
+# Local imports
+from .message import _cpc_marshal
+
+logger = logging.getLogger("can.can_wuensche")
+
+# Frames that are due within this window are sent together with a single wait for buffer space
+_SCHEDULER_SLOT_NS  = 500_000
+# Jitter histogram: bucket n counts send delays below 2^n microseconds (last bucket: everything above)
+_JITTER_BUCKETS     = 20
+# Deadline-miss histogram: bucket n counts events where n+1 periods were skipped (last bucket: more)
+_MISS_BUCKETS       = 8
+
+class _CyclicScheduler:
+	# One scheduler (and thread) per bus. Tasks are kept in a heap ordered by their next absolute deadline.
+	def __init__(self, bus):
+		self._bus       = bus
+		self._heap      = []
+		self._seq       = 0 # Tie breaker for tasks with the same deadline
+		self._cond      = threading.Condition()
+		self._stopped   = False
+		self._thread    = threading.Thread(target=self._run, name="EMSWuensche periodic scheduler", daemon=True)
+		self._thread.start()
+
+	def add(self, task : "EMSWuenscheCyclicSendTask") -> None:
+		with self._cond:
+			self._push(task.next_deadline_ns, task)
+			self._cond.notify()
+
+	def remove(self, task : "EMSWuenscheCyclicSendTask") -> None:
+		with self._cond:
+			self._heap = [entry for entry in self._heap if entry[2] is not task]
+			heapq.heapify(self._heap)
+			self._cond.notify()
+
+	def stop(self) -> None:
+		with self._cond:
+			self._stopped = True
+			self._heap = []
+			self._cond.notify()
+		if self._thread is not threading.current_thread():
+			self._thread.join()
+
+	def _is_stopped(self) -> bool:
+		return self._stopped
+
+	def _push(self, deadline_ns : int, task : "EMSWuenscheCyclicSendTask") -> None:
+		self._seq += 1
+		heapq.heappush(self._heap, (deadline_ns, self._seq, task))
+
+	def _run(self) -> None:
+		while True:
+			with self._cond:
+				if self._stopped:
+					return
+				if not self._heap:
+					self._cond.wait()
+					continue
+				deadline_ns = self._heap[0][0]
+				delay_ns = deadline_ns - time.perf_counter_ns()
+				if delay_ns > 0:
+					# Sleep until the deadline. add()/remove() will wake us up early.
+					self._cond.wait(delay_ns / 1_000_000_000)
+					continue
+			# Collect every task that is due within the current slot
+			batch = []
+			with self._cond:
+				limit_ns = time.perf_counter_ns() + _SCHEDULER_SLOT_NS
+				while self._heap and self._heap[0][0] <= limit_ns:
+					due_ns, _, task = heapq.heappop(self._heap)
+					batch.append((due_ns, task, task._generation))
+			if not batch:
+				continue
+			marshalled = []
+			for due_ns, task, generation in batch:
+				marshalled.append(task._next_marshalled())
+			try:
+				# Waits for buffer space in slices and gives up once the scheduler is stopped, so 
+				# stop() (and the shutdown of the bus) does not wait for a device that does not transmit
+				self._bus._cpc_send_batch(marshalled, abort=self._is_stopped)
+				sent_ns = time.perf_counter_ns()
+			except Exception as e:
+				# Same behaviour as python-can's ThreadBasedCyclicSendTask without on_error: stop the tasks
+				logger.exception(e)
+				for due_ns, task, generation in batch:
+					task.stopped = True
+				continue
+			with self._cond:
+				for due_ns, task, generation in batch:
+					# Skip tasks that were stopped (or restarted) while we were sending
+					if task.stopped or (task._generation != generation):
+						continue
+					next_ns = task._account(due_ns=due_ns, sent_ns=sent_ns)
+					if next_ns is not None:
+						self._push(next_ns, task)
+
+class EMSWuenscheCyclicSendTask(LimitedDurationCyclicSendTaskABC, ModifiableCyclicTaskABC, RestartableCyclicTaskABC):
+	"""Periodic send task that is driven by the shared scheduler thread of an EMSWuenscheBus.
+
+	Deadlines are absolute (start time + n * period) so the send times do not drift. Each task
+	records the send delay relative to its deadline and the number of skipped periods, see
+	statistics().
+	"""
+
+	def __init__(
+		self,
+		scheduler : _CyclicScheduler,
+		messages : "Message | Sequence[Message]",
+		period : float,
+		duration : "float | None" = None,
+		autostart : bool = True,
+		modifier_callback : "Callable[[Message], None] | None" = None,
+	):
+		super().__init__(messages, period, duration)
+		if self.period_ns <= 0:
+			raise ValueError("The period must be greater than 0")
+		self._scheduler        = scheduler
+		self.modifier_callback = modifier_callback
+		self.stopped           = True
+		self.next_deadline_ns  = 0
+		self.end_time_ns       = None
+		self._msg_index        = 0
+		self._marshalled       = None
+		self._generation       = 0
+		self.reset_statistics()
+		if autostart:
+			self.start()
+
+	def start(self) -> None:
+		if not self.stopped:
+			return
+		# Pre-marshal the messages once. A modifier callback may change them before every send.
+		self._marshal()
+		now_ns = time.perf_counter_ns()
+		self.end_time_ns      = now_ns + round(self.duration * 1_000_000_000) if self.duration else None
+		self.next_deadline_ns = now_ns
+		self._msg_index       = 0
+		self._generation     += 1
+		self.stopped          = False
+		self._scheduler.add(self)
+
+	def stop(self) -> None:
+		self.stopped = True
+		self._scheduler.remove(self)
+
+	def modify_data(self, messages : "Message | Sequence[Message]") -> None:
+		super().modify_data(messages)
+		self._marshal()
+
+	def reset_statistics(self) -> None:
+		self.sent_count       = 0
+		self.missed_count     = 0
+		self.max_jitter_ns    = 0
+		self.total_jitter_ns  = 0
+		self.jitter_histogram = [0] * _JITTER_BUCKETS
+		self.miss_histogram   = [0] * _MISS_BUCKETS
+
+	def statistics(self) -> dict:
+		return {
+			"sent"             : self.sent_count,
+			"missed"           : self.missed_count,
+			"max_jitter_us"    : self.max_jitter_ns / 1000,
+			"mean_jitter_us"   : (self.total_jitter_ns / self.sent_count / 1000) if self.sent_count else 0.0,
+			"jitter_histogram" : { ("<" + str(1 << i) + "us" if i < _JITTER_BUCKETS-1 else ">=" + str(1 << (i-1)) + "us") : n for i, n in enumerate(self.jitter_histogram) },
+			"miss_histogram"   : { (str(i+1) if i < _MISS_BUCKETS-1 else ">=" + str(i+1)) : n for i, n in enumerate(self.miss_histogram) },
+		}
+
+	def _marshal(self) -> None:
+		self._marshalled = [_cpc_marshal(msg) for msg in self.messages]
+
+	def _next_marshalled(self) -> tuple:
+		if self.modifier_callback is not None:
+			msg = self.messages[self._msg_index]
+			self.modifier_callback(msg)
+			return _cpc_marshal(msg)
+		return self._marshalled[self._msg_index]
+
+	# Record the statistics of a sent frame and return the next deadline (None if the task ended)
+	def _account(self, due_ns : int, sent_ns : int) -> "int | None":
+		jitter_ns = max(0, sent_ns - due_ns)
+		self.sent_count      += 1
+		self.total_jitter_ns += jitter_ns
+		if jitter_ns > self.max_jitter_ns:
+			self.max_jitter_ns = jitter_ns
+		self.jitter_histogram[min((jitter_ns // 1000).bit_length(), _JITTER_BUCKETS-1)] += 1
+		self._msg_index = (self._msg_index + 1) % len(self.messages)
+		# Keep the absolute grid. Skip deadlines that already passed instead of sending a burst.
+		next_ns = due_ns + self.period_ns
+		if next_ns <= sent_ns:
+			skipped = (sent_ns - next_ns) // self.period_ns + 1
+			next_ns += skipped * self.period_ns
+			self.missed_count += skipped
+			self.miss_histogram[min(skipped, _MISS_BUCKETS) - 1] += 1
+		if (self.end_time_ns is not None) and (next_ns >= self.end_time_ns):
+			self.stopped = True
+			return None
+		self.next_deadline_ns = next_ns
+		return next_ns
@@ -0,0 +1,199 @@
+"""
+Host-side priority transmit lanes
+"""
+
+# Global imports
+import logging
+import threading
+import time
+from collections import deque
+from typing import List
+
+# python-can imports
+from can import BitTimingFd, Message
+from can import CanOperationError, CanTimeoutError
+
+# Local imports
+from .message import _cpc_marshal
+
+logger = logging.getLogger("can.can_wuensche")
+
+# Latency histogram: bucket n counts queuing latencies below 2^n microseconds (last bucket: everything above)
+_LATENCY_BUCKETS = 24
+# Frames handed to the device in one go at most
+_TX_BATCH = 32
+
+class _TxLane:
+	def __init__(self, capacity : int):
+		self.frames  = deque() # (enqueued_ns, wire_ns, marshalled)
+		self.capacity = capacity
+		self.reset_statistics()
+
+	def reset_statistics(self) -> None:
+		self.sent_count        = 0
+		self.dropped_count     = 0
+		self.max_latency_ns    = 0
+		self.total_latency_ns  = 0
+		self.latency_histogram = [0] * _LATENCY_BUCKETS
+
+	def account(self, latency_ns : int) -> None:
+		self.sent_count       += 1
+		self.total_latency_ns += latency_ns
+		if latency_ns > self.max_latency_ns:
+			self.max_latency_ns = latency_ns
+		self.latency_histogram[min((latency_ns // 1000).bit_length(), _LATENCY_BUCKETS-1)] += 1
+
+	def statistics(self) -> dict:
+		return {
+			"queued"            : len(self.frames),
+			"sent"              : self.sent_count,
+			"dropped"           : self.dropped_count,
+			"max_latency_us"    : self.max_latency_ns / 1000,
+			"mean_latency_us"   : (self.total_latency_ns / self.sent_count / 1000) if self.sent_count else 0.0,
+			"latency_histogram" : { ("<" + str(1 << i) + "us" if i < _LATENCY_BUCKETS-1 else ">=" + str(1 << (i-1)) + "us") : n for i, n in enumerate(self.latency_histogram) },
+		}
+
+class EMSWuenscheTxQueue:
+	"""Priority transmit lanes in front of the command queue of an EMSWuenscheBus.
+
+	Frames are queued on the host in one of the lanes (0 is the most urgent) and handed to the
+	device by a background thread, always from the most urgent non-empty lane first. The device
+	is only fed up to max_backlog seconds of estimated bus time (from the bitrate and the frame
+	lengths), so an urgent frame never waits behind a long device queue of bulk frames.
+
+	Without an explicit priority the lane follows the arbitration id like on the bus: the 11-bit
+	id space (the base id of 29-bit ids) is split evenly into the lanes.
+
+	Create it with EMSWuenscheBus.cpc_tx_queue().
+	"""
+
+	def __init__(self, bus, lanes : int = 4, max_backlog : float = 0.002, capacity : int = 10000, timeout : float = 1.0):
+		if lanes <= 0:
+			raise ValueError("lanes must be greater than 0")
+		self.bus             = bus
+		self.max_backlog_ns  = round(max_backlog * 1_000_000_000)
+		self.timeout         = timeout
+		self._lanes          = [_TxLane(capacity=capacity) for _ in range(lanes)]
+		self._cond           = threading.Condition()
+		self._stopped        = False
+		self._busy_until_ns  = 0 # Estimated time at which the device queue is empty
+		self._timing         = None
+		self._bit_ns         = (2000.0, 2000.0) # Nominal and data bit time (default 500 kbit/s)
+		self._thread         = threading.Thread(target=self._run, name="EMSWuensche TX lanes", daemon=True)
+		self._thread.start()
+
+	# Estimated time on the bus (including bit stuffing and interframe space)
+	def _wire_ns(self, msg : Message) -> int:
+		timing = self.bus.timing
+		if timing is not self._timing:
+			# The timing changed (see EMSWuenscheBus.configure())
+			self._timing = timing
+			if isinstance(timing, BitTimingFd):
+				self._bit_ns = (1_000_000_000 / timing.nom_bitrate, 1_000_000_000 / timing.data_bitrate)
+			elif timing is not None:
+				self._bit_ns = (1_000_000_000 / timing.bitrate,) * 2
+		nominal_ns, data_ns = self._bit_ns
+		length = 0 if msg.is_remote_frame else len(msg.data)
+		if not msg.is_fd:
+			return round(((67 if msg.is_extended_id else 47) + 8 * length) * 1.2 * nominal_ns)
+		arbitration = (48 if msg.is_extended_id else 29) * nominal_ns
+		data = (8 * length + (21 if length > 16 else 17) + 12) * (data_ns if msg.bitrate_switch else nominal_ns)
+		return round((arbitration + data) * 1.2 + 10 * nominal_ns)
+
+	def lane_of(self, msg : Message) -> int:
+		"""Lane of a frame without an explicit priority."""
+		base_id = (msg.arbitration_id >> 18) if msg.is_extended_id else msg.arbitration_id
+		return (base_id & 0x7FF) * len(self._lanes) // 0x800
+
+	def send(self, msg : Message, priority : "int | None" = None, timeout : "float | None" = None) -> None:
+		"""Queue a frame in the lane of priority (0: most urgent, default: see lane_of())."""
+		if timeout is None:
+			timeout = self.timeout
+		lane = self.lane_of(msg) if priority is None else min(max(priority, 0), len(self._lanes) - 1)
+		entry = (time.perf_counter_ns(), self._wire_ns(msg), _cpc_marshal(msg))
+		queue = self._lanes[lane]
+		with self._cond:
+			if len(queue.frames) >= queue.capacity:
+				if not self._cond.wait_for(lambda: self._stopped or len(queue.frames) < queue.capacity, timeout=timeout):
+					raise CanTimeoutError(message="TX lane " + str(lane) + " is full")
+			if self._stopped:
+				raise CanOperationError(message="TX lanes are closed")
+			queue.frames.append(entry)
+			self._cond.notify_all()
+
+	def flush(self, lane : "int | None" = None) -> int:
+		"""Drop the queued frames of a lane (or of all lanes). Returns the number of dropped frames."""
+		with self._cond:
+			lanes = self._lanes if lane is None else [self._lanes[lane]]
+			dropped = 0
+			for queue in lanes:
+				dropped += len(queue.frames)
+				queue.dropped_count += len(queue.frames)
+				queue.frames.clear()
+			self._cond.notify_all()
+		return dropped
+
+	def statistics(self) -> List[dict]:
+		"""Statistics (queued, sent and dropped frames, queuing latency) of every lane."""
+		with self._cond:
+			return [queue.statistics() for queue in self._lanes]
+
+	def reset_statistics(self) -> None:
+		with self._cond:
+			for queue in self._lanes:
+				queue.reset_statistics()
+
+	def __len__(self) -> int:
+		return sum(len(queue.frames) for queue in self._lanes)
+
+	def close(self) -> None:
+		"""Stop the lanes, frames that are still queued are dropped."""
+		with self._cond:
+			self._stopped = True
+			self._cond.notify_all()
+		if self._thread is not threading.current_thread():
+			self._thread.join()
+		self.flush()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		self.close()
+
+	def _run(self) -> None:
+		while True:
+			batch = []
+			with self._cond:
+				while True:
+					if self._stopped:
+						return
+					now_ns = time.perf_counter_ns()
+					busy_until_ns = max(self._busy_until_ns, now_ns)
+					# Admit frames, most urgent lane first, until the device backlog is full
+					for index, queue in enumerate(self._lanes):
+						while queue.frames and (len(batch) < _TX_BATCH) and (busy_until_ns - now_ns < self.max_backlog_ns):
+							entry = queue.frames.popleft()
+							busy_until_ns += entry[1]
+							batch.append((index, entry))
+					if batch:
+						self._busy_until_ns = busy_until_ns
+						self._cond.notify_all()
+						break
+					if any(queue.frames for queue in self._lanes):
+						# Wait until the device worked off part of its backlog (or a new frame arrives)
+						self._cond.wait((busy_until_ns - now_ns - self.max_backlog_ns) / 1_000_000_000 + 0.000_05)
+					else:
+						self._cond.wait()
+			try:
+				self.bus._cpc_send_batch([entry[2] for _, entry in batch], timeout=self.timeout)
+			except Exception as e:
+				logger.warning("TX lanes: Failed to send " + str(len(batch)) + " frame(s): " + str(e))
+				with self._cond:
+					for index, _ in batch:
+						self._lanes[index].dropped_count += 1
+				continue
+			sent_ns = time.perf_counter_ns()
+			with self._cond:
+				for index, (enqueued_ns, _, _) in batch:
+					self._lanes[index].account(latency_ns=sent_ns - enqueued_ns)
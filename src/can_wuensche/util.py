@@ -320,6 +320,16 @@ def _can_params_is_fd(can_params : CPC_CAN_PARAMS_T) -> bool:
 	else:
 		raise ValueError(_cpcErrToStr(CPC_ERR_WRONG_CONTROLLER_TYPE))
 
+def _can_params_get_clock(can_params : CPC_CAN_PARAMS_T) -> int:
+	if can_params.cc_type == GENERIC_CAN_CONTR:
+		return can_params.cc_params.generic.can_clk
+	elif can_params.cc_type == SJA1000:
+		return 8_000_000
+	elif can_params.cc_type == LPC546XX:
+		return can_params.cc_params.lpc546xx.cclk
+	else:
+		raise ValueError(_cpcErrToStr(CPC_ERR_WRONG_CONTROLLER_TYPE))
+
 def _can_params_get_listen_only(can_params : CPC_CAN_PARAMS_T) -> bool:
 	if can_params.cc_type == GENERIC_CAN_CONTR:
 		if can_params.cc_params.generic.config & CPC_GENERICCONF_LISTEN_ONLY:
@@ -401,6 +411,28 @@ def _can_params_copy(dst : CPC_CAN_PARAMS_T, src : CPC_CAN_PARAMS_T) -> None:
 	else:
 		raise ValueError(_cpcErrToStr(CPC_ERR_WRONG_CONTROLLER_TYPE))
 
+# Fields of each controller type that _can_params_copy() transfers
+__can_params_fields = {
+	GENERIC_CAN_CONTR : ("generic.config", "generic.can_clk", "generic.n.tseg1", "generic.n.tseg2", "generic.n.brp", "generic.n.sjw", "generic.d.tseg1", "generic.d.tseg2", "generic.d.brp", "generic.d.sjw"),
+	SJA1000           : ("sja1000.mode", "sja1000.acc_code0", "sja1000.acc_code1", "sja1000.acc_code2", "sja1000.acc_code3", "sja1000.acc_mask0", "sja1000.acc_mask1", "sja1000.acc_mask2", "sja1000.acc_mask3", "sja1000.btr0", "sja1000.btr1", "sja1000.outp_contr"),
+	LPC546XX          : ("lpc546xx.dbtp", "lpc546xx.test", "lpc546xx.cccr", "lpc546xx.nbtp", "lpc546xx.psr", "lpc546xx.tdcr", "lpc546xx.gfc", "lpc546xx.sidfc", "lpc546xx.xidfc", "lpc546xx.xidam", "lpc546xx.cclk"),
+}
+
+def __can_params_field(can_params : CPC_CAN_PARAMS_T, field : str) -> int:
+	value = can_params.cc_params
+	for name in field.split("."):
+		value = getattr(value, name)
+	return value
+
+# Names of the fields that differ between two CAN parameter sets (with the semantics of _can_params_copy()).
+# An empty list means that a CPC_CANInit with new would not change anything.
+def _can_params_diff(old : CPC_CAN_PARAMS_T, new : CPC_CAN_PARAMS_T) -> list[str]:
+	if new.cc_type not in __can_params_fields:
+		raise ValueError(_cpcErrToStr(CPC_ERR_WRONG_CONTROLLER_TYPE))
+	if old.cc_type != new.cc_type:
+		return ["cc_type"]
+	return [field for field in __can_params_fields[new.cc_type] if __can_params_field(old, field) != __can_params_field(new, field)]
+
 def _isEMSHandleValid(handle: int) -> bool:
 	return handle >= 0
 
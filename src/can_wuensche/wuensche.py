@@ -5,14 +5,19 @@
 import logging
 import configparser
 import json
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
 from ctypes import c_int, byref
-from typing import Tuple, List
+from typing import Tuple, List, Sequence, Callable, Iterator
 
 # python-can imports
 from can              import BitTiming, BitTimingFd
 from can              import BusABC, BusState
-from can              import CanTimeoutError, CanOperationError, CanInitializationError, CanInterfaceNotImplementedError
+from can              import CanError, CanTimeoutError, CanOperationError, CanInitializationError, CanInterfaceNotImplementedError
 from can              import Message
+from can.broadcastmanager import CyclicSendTaskABC
 from can.typechecking import AutoDetectedConfig, CanFilters
 
 # Local imports
@@ -20,11 +25,34 @@ from .constants  import *
 from .structures import *
 from .functions  import *
 from .functions  import _cpclib_cpcconf_paths
-from .util       import _cpcErrToStr, _convert_timeout, _create_can_params, _can_params_copy, _can_params_is_fd, _can_params_get_listen_only, _can_params_set_listen_only, _isEMSHandleValid, _create_timing_from_can_params
+from .util       import _cpcErrToStr, _convert_timeout, _create_can_params, _can_params_copy, _can_params_diff, _can_params_is_fd, _can_params_get_listen_only, _can_params_set_listen_only, _can_params_get_clock, _isEMSHandleValid, _create_timing_from_can_params
 from .util       import _getAllInfoSources, _infoSourceToString, _stringToInfoSource, _getAllInfoTypes, _infoTypeToString, _stringToInfoType
+from .message    import _cpc_marshal, _cpc_msg_to_message, _cpc_frame_types
+from .scheduler  import _CyclicScheduler, EMSWuenscheCyclicSendTask
+from .capabilities import _open_capability_cache
+from .info       import _InfoRequests, _info_cache_store, _info_cache_lookup
+from .filters    import _FilterEngine
+from .changes    import _ChangeFilter, ChangeSummary
+from .latest     import EMSWuenscheLatestValues
+from .errors     import EMSWuenscheErrorAnalytics
+from .autobaud   import _AutoBaud, AutoBaudResult
+from .configuration import EMSWuenscheConfiguration, Reconfiguration
+from .columns    import _iter_batches
+from .locking    import _Quiesce
+from .txqueue    import EMSWuenscheTxQueue
+from .polling    import _RxPoller, RxPollStrategy
+from .correlator import _Correlator
+from .recovery   import _Backoff, ConnectionGap, BusOffRecovery, BusOffRecoveryPolicy
 
 logger = logging.getLogger("can.can_wuensche")
 
+# Maximum time in seconds a receiver blocks in CPC_WaitForEvent
+_RX_WAIT_SLICE = 0.1
+# Maximum time in seconds a sender waits for buffer space without leaving the transmit path
+_TX_WAIT_SLICE = 0.1
+# Maximum number of frames kept for recv() while waiting for something else (the oldest are dropped)
+_RX_PENDING_MAX = 10000
+
 class EMSWuenscheBus(BusABC):
 	_cpc_handle   : int
 	_can_params   : CPC_CAN_PARAMS_T
@@ -32,6 +60,7 @@ class EMSWuenscheBus(BusABC):
 	_target_state : BusState # Bus-state that the user requested. Needed for #reset()
 	_timing       : "BitTiming | BitTimingFd"
 	_infomsg      : dict
+	_scheduler    : "_CyclicScheduler | None" # Shared thread for all periodic tasks (created on demand)
 
 	def __init__(
 		self,
@@ -40,6 +69,20 @@ class EMSWuenscheBus(BusABC):
 		bitrate: int = 500_000,
 		timing = None,
 		req_infos = True,
+		info_timeout : float = 0.0,
+		capability_cache : "str | bool | None" = None,
+		reconnect : bool = False,
+		reconnect_delay : float = 0.1,
+		reconnect_max_delay : float = 5.0,
+		reconnect_tx_backlog : int = 1000,
+		on_reconnect : "Callable[[ConnectionGap], None] | None" = None,
+		busoff_recovery : "BusOffRecoveryPolicy | str | None" = None,
+		on_busoff_recovery : "Callable[[BusOffRecovery], None] | None" = None,
+		change_only : bool = False,
+		change_window : "float | None" = None,
+		change_summary_interval : float = 10.0,
+		on_change_summary : "Callable[[ChangeSummary], None] | None" = None,
+		rx_poll : "RxPollStrategy | str | None" = None,
 		**kwargs,
 	):
 		"""EMS Dr. Thomas Wuensche CAN-to-PC interface.
@@ -65,6 +108,84 @@ class EMSWuenscheBus(BusABC):
 			parsed during recv(). Depending on the device type, responses may be delayed.
 			We recommend to wait a bit and call recv() at least once before trying to 
 			access these informations.
+			Infos of a device that was already opened in this process are taken from a cache 
+			instead of being requested again.
+
+		:param capability_cache:
+			The accepted controller type, FD support and clock of each interface are recorded 
+			in a file, keyed by the channel (the serial number of a JSON channel description or 
+			the channel name) and the library version, which are known before the controller is 
+			initialized. Later opens of the same channel go straight to the right parameters. 
+			Serial number and firmware of the interface are recorded once its infos arrive, the 
+			entry is dropped if they change (the next open probes the controller again). The 
+			file is written whenever an entry changes. Disabled by default: use True for the 
+			default file (CAN_WUENSCHE_CAPABILITY_CACHE or can_wuensche/capabilities.json in the 
+			user cache directory) or a path for another file. None enables the cache only if 
+			CAN_WUENSCHE_CAPABILITY_CACHE is set, False disables it in any case.
+
+		:param int controller:
+			Controller type (e.g. GENERIC_CAN_CONTR, SJA1000 or LPC546XX) that the device is known 
+			to accept. It is tried first, which saves a CPC_CANInit round trip on devices that 
+			reject generic parameters. The accepted type is available through cpc_controller.
+
+		:param float info_timeout:
+			Maximum time in seconds to wait for the requested infos during the init process. 
+			The default only parses the answers that are already available.
+			The channel is brought up in stages (open, infos, init, enable). The duration of each 
+			stage in seconds is available through cpc_bringup_durations.
+
+		:param bool reconnect:
+			Enable the resilient mode. If the interface gets disconnected (CPC_MSG_T_DISCONNECTED) 
+			then the channel will be reopened with an exponential backoff instead of shutting 
+			down the bus. The CAN parameters and message/state/error reporting will be restored. 
+			Messages sent during the outage are kept (see reconnect_tx_backlog) and transmitted 
+			after the reconnect.
+
+		:param float reconnect_delay:
+			Delay in seconds before the second reconnect attempt. The delay doubles with every 
+			failed attempt.
+
+		:param float reconnect_max_delay:
+			Upper limit in seconds for the delay between two reconnect attempts.
+
+		:param int reconnect_tx_backlog:
+			Maximum number of messages that are kept for transmission while disconnected. The 
+			oldest messages are dropped if the backlog is full.
+
+		:param on_reconnect:
+			Called with a ConnectionGap after each successful reconnect. All gaps are also 
+			available through cpc_connection_gaps.
+
+		:param busoff_recovery:
+			Restart the controller automatically after bus-off. Use a BusOffRecoveryPolicy or 
+			one of its modes ("immediate", "delayed", "backoff") for the default settings. The 
+			restart reuses the current CAN parameters and does not clear any queues. It is 
+			performed during recv(), so keep receiving (e.g. with a can.Notifier).
+
+		:param on_busoff_recovery:
+			Called with a BusOffRecovery after each recovered bus-off. All recoveries are also 
+			available through cpc_busoff_recoveries.
+
+		:param bool change_only:
+			Only deliver frames whose payload (or dlc) changed since the last delivered frame with
+			the same id. Unchanged frames are dropped before any message is created.
+
+		:param float change_window:
+			Deliver an unchanged frame again once this time (in seconds) passed since the id was 
+			delivered last. None suppresses unchanged frames forever.
+
+		:param float change_summary_interval:
+			Interval of the ChangeSummary reports in seconds (change_only only).
+
+		:param on_change_summary:
+			Called with a ChangeSummary (counts of delivered and suppressed frames) every 
+			change_summary_interval. The summaries are also available through cpc_change_summaries.
+
+		:param rx_poll:
+			How recv() waits for frames. Use an RxPollStrategy or one of its modes ("blocking", 
+			"hybrid", "spin") for the default settings. Polling lowers the latency from the 
+			reception to the application at the cost of CPU time. None waits blocking. Can be 
+			changed later through cpc_rx_poll.
 
 		:param bool fd:
 			Ignored if timing is set
@@ -127,100 +248,146 @@ class EMSWuenscheBus(BusABC):
 			Ignored if timing is set or fd=False. Will be passed to BitTimingFd.
 		"""
 		self._cpc_handle   = CPC_ERR_NO_INTERFACE_PRESENT
+		self._cpc_quiesce  = _Quiesce() # Receive and transmit path locks (see locking.py)
 		self._can_params   = None
 		self._state        = BusState.ERROR
 		self._target_state = state
 		self._timing       = timing
 		self._infomsg      = {}
+		self._scheduler    = None
+		self._info_requests = _InfoRequests()
+		self._capability_cache = _open_capability_cache(setting=capability_cache)
+		self._capabilities_stored = False
+		self._rx_pending   = deque(maxlen=_RX_PENDING_MAX) # Raw frames that were received while waiting for something else
+		self._rx_pending_dropped = 0
+		self._cpc_filter   = None    # Compiled receive filters (see _apply_filters)
+		self._cpc_latest   = None    # Latest frame per id (see cpc_latest_values)
+		self._cpc_errors   = None    # Error frame statistics (see cpc_error_analytics)
+		self._cpc_protocol_stages = [] # See _cpc_add_rx_stage
+		self._cpc_correlator = None  # Outstanding requests (see request_async)
+		self._cpc_tx_queue = None    # Priority transmit lanes (see cpc_tx_queue)
+		self._cpc_rx_poller = None   # Busy polling before/instead of the blocking wait (see cpc_rx_poll)
+		self.cpc_rx_poll = rx_poll
+		self._cpc_open_json = False
+		self._reconnect    = reconnect
+		self._reconnect_backoff = _Backoff(delay=reconnect_delay, max_delay=reconnect_max_delay)
+		self._reconnect_next = 0.0
+		self._disconnected_since = None
+		self._tx_backlog   = deque(maxlen=max(0, reconnect_tx_backlog))
+		self._tx_backlog_dropped = 0
+		self._on_reconnect = on_reconnect
+		self.cpc_connection_gaps = deque(maxlen=100)
+		self._cpc_applied_params = None # CAN parameters of the last CPC_CANInit
+		self._cpc_init_duration  = 0.0  # Duration of the last CPC_CANInit in seconds
+		self._cpc_config_depth   = 0    # Nesting of configure()
+		self._cpc_config_saved   = None # Settings before configure() (restored if the block raises)
+		self.cpc_reconfigurations = deque(maxlen=100)
+		if isinstance(busoff_recovery, str):
+			busoff_recovery = BusOffRecoveryPolicy(mode=busoff_recovery)
+		self._busoff_policy = busoff_recovery
+		self._busoff_since = None
+		self._busoff_restart_at = None
+		self._busoff_restarts = 0
+		self._busoff_rx_dropped = 0
+		self._busoff_tx_dropped = 0
+		self._on_busoff_recovery = on_busoff_recovery
+		self.cpc_busoff_recoveries = deque(maxlen=100)
+		# Change-only receive mode
+		self._cpc_change_filter = _ChangeFilter(window=change_window, summary_interval=change_summary_interval, on_summary=self.__change_summary) if change_only else None
+		self._on_change_summary = on_change_summary
+		self.cpc_change_summaries = deque(maxlen=100)
+		self.__update_rx_stages()
 		# Check desired state
 		if state not in (BusState.ACTIVE, BusState.PASSIVE):
 			raise ValueError("BusState must be Active or Passive")
-		# Try to open the channel
-		if channel is None:
-			channel = "CHAN00"
-		if isinstance(channel, str):
-			channel = channel.strip()
-			if len(channel) < 1:
-				raise CanInterfaceNotImplementedError(message=_cpcErrToStr(error_code=CPC_ERR_NO_MATCHING_CHANNEL), error_code=CPC_ERR_NO_MATCHING_CHANNEL)
-			# Try the normal version first
-			self._cpc_handle = CPC_OpenChannel(channel.encode("ascii"))
-			if _isEMSHandleValid(handle=self._cpc_handle):
-				self.channel = channel
-				self.channel_info = channel
-			else:
-				# Prepare to try the json version
-				try:
-					channel = json.loads(channel)
-				except Exception:
-					raise CanInterfaceNotImplementedError(message=_cpcErrToStr(error_code=self._cpc_handle), error_code=self._cpc_handle)
-				# If json.loads worked then let the code below do the json handling
-		# Try the json version
-		if not _isEMSHandleValid(handle=self._cpc_handle):
-			if "InterfaceType" in channel:
-				self.channel = { "UNNAMED" : channel }
-				self.channel_info = json.dumps(obj=self.channel, skipkeys=False, ensure_ascii=True, allow_nan=False)
-				self._cpc_handle = CPC_OpenChannelJSON(self.channel_info.encode("ascii"))
-			else:
-				for key in channel:
-					if "InterfaceType" in channel[key]:
-						self.channel = { str(key) : channel[key] }
-						self.channel_info = json.dumps(obj=self.channel, skipkeys=False, ensure_ascii=True, allow_nan=False)
-						self._cpc_handle = CPC_OpenChannelJSON(self.channel_info.encode("ascii"))
-						if _isEMSHandleValid(handle=self._cpc_handle):
-							break
-		# Verify that our handle is valid
-		if not _isEMSHandleValid(handle=self._cpc_handle):
-			raise CanInterfaceNotImplementedError(message="Failed to open channel: '" + self.channel_info + "': " + _cpcErrToStr(error_code=self._cpc_handle), error_code=self._cpc_handle)
-		# Request infos before initializing the channel
-		if req_infos:
-			lib_string = _infoSourceToString(CPC_INFOMSG_T_LIBRARY)
-			self._infomsg[lib_string] = {}
-			for t in [CPC_INFOMSG_T_VERSION, CPC_INFOMSG_T_SERIAL, CPC_INFOMSG_T_CANFD, CPC_INFOMSG_T_CHANNEL_NR]:
-				CPC_RequestInfo(self._cpc_handle, 0, CPC_INFOMSG_T_INTERFACE, t)
-				CPC_RequestInfo(self._cpc_handle, 0, CPC_INFOMSG_T_DRIVER, t)
-				lib_info = CPC_GetInfo(self._cpc_handle, CPC_INFOMSG_T_LIBRARY, t)
-				if lib_info:
-					self._infomsg[lib_string][_infoTypeToString(t)] = lib_info.decode("ascii")
-			# Call receive to parse any received info messages (note: interface responses may 
-			# need more time but we won't wait for them)
-			self._recv_internal(None)
-		# Try to initialize the controller with generic params
+		# Bring up the channel in stages. Each stage is timed, see cpc_bringup_durations.
+		self.cpc_bringup_durations = {}
+		channel = self.__timed_stage("open", self.__stage_open, channel=channel)
 		try:
-			self._can_params = _create_can_params(controller=GENERIC_CAN_CONTR, timing=timing, bitrate=bitrate, **kwargs)
-			_can_params_set_listen_only(can_params=self._can_params, listen_only=state != BusState.ACTIVE)
-			try:
-				self.__apply_can_params()
-			except CanOperationError as e:
-				# Some devices may not support generic params yet
-				if e.error_code == CPC_ERR_WRONG_CONTROLLER_TYPE:
-					if _can_params_is_fd(can_params=self._can_params):
-						self._can_params = _create_can_params(controller=LPC546XX, timing=timing, bitrate=bitrate, **kwargs)
-					else:
-						self._can_params = _create_can_params(controller=SJA1000, timing=timing, bitrate=bitrate, **kwargs)
-					_can_params_set_listen_only(can_params=self._can_params, listen_only=state != BusState.ACTIVE)
-					self.__apply_can_params()
-				else:
-					raise
+			self.__timed_stage("infos", self.__stage_request_infos, req_infos=req_infos, info_timeout=info_timeout)
+			self.__timed_stage("init", self.__stage_init, state=state, timing=timing, bitrate=bitrate, **kwargs)
+			# Activate receive messages and CAN state
+			self.__timed_stage("enable", self.__enable_controls)
 		except:
 			CPC_CloseChannel(self._cpc_handle)
+			self._cpc_handle = CPC_ERR_NO_INTERFACE_PRESENT
 			raise
-		# Activate receive messages and CAN state
-		result = CPC_Control(self._cpc_handle, CONTR_CAN_Message | CONTR_CONT_ON)
-		if result != CPC_ERR_NONE:
-			CPC_CloseChannel(self._cpc_handle)
-			raise CanOperationError(message=_cpcErrToStr(error_code=result), error_code=result)
-		result = CPC_Control(self._cpc_handle, CONTR_CAN_State   | CONTR_CONT_ON)
-		if result != CPC_ERR_NONE:
-			CPC_CloseChannel(self._cpc_handle)
-			raise CanOperationError(message=_cpcErrToStr(error_code=result), error_code=result)
-		result = CPC_Control(self._cpc_handle, CONTR_BusError    | CONTR_CONT_ON)
-		if result != CPC_ERR_NONE:
-			CPC_CloseChannel(self._cpc_handle)
-			raise CanOperationError(message=_cpcErrToStr(error_code=result), error_code=result)
 		super().__init__(channel=channel, state=state, bitrate=bitrate, timing=timing, **kwargs)
 		
 	# Send message
 	def send(self, msg: Message, timeout: "float | None" = None) -> None:
+		marshalled = _cpc_marshal(msg)
+		deadline = None if timeout is None else time.monotonic() + timeout
+		while True:
+			with self._cpc_quiesce.tx:
+				# Keep the message for later if we are waiting for a reconnect
+				if self._disconnected_since is not None:
+					self.__backlog([marshalled])
+					return
+				if self.__wait_for_write_slice(deadline=deadline):
+					self._cpc_write(*marshalled)
+					return
+			# No buffer space within the slice: a pending configuration change goes first
+
+	# Send several messages with a single wait for buffer space. abort() is checked between the 
+	# waits for buffer space, the rest of the batch is dropped once it returns True. Returns the 
+	# number of messages that were handed to the library.
+	def _cpc_send_batch(self, marshalled : list, timeout: "float | None" = None, abort : "Callable[[], bool] | None" = None) -> int:
+		deadline = None if timeout is None else time.monotonic() + timeout
+		index = 0
+		while index < len(marshalled):
+			with self._cpc_quiesce.tx:
+				# Keep the rest of the batch for later if we are waiting for a reconnect (like send())
+				if self._disconnected_since is not None:
+					self.__backlog(marshalled[index:])
+					return len(marshalled)
+				if not self.__wait_for_write_slice(deadline=deadline):
+					if (abort is not None) and abort():
+						return index
+					continue
+				while index < len(marshalled):
+					try:
+						self._cpc_write(*marshalled[index])
+					except CanOperationError as e:
+						if e.error_code != CPC_ERR_CAN_NO_TRANSMIT_BUF:
+							raise
+						# The transmit buffer ran full within the batch: wait for space again
+						break
+					index += 1
+		return index
+
+	# Keep marshalled messages until the reconnect (the oldest are dropped if the backlog is full)
+	def __backlog(self, marshalled : list) -> None:
+		overflow = len(self._tx_backlog) + len(marshalled) - self._tx_backlog.maxlen
+		if overflow > 0:
+			self._tx_backlog_dropped += overflow
+		self._tx_backlog.extend(marshalled)
+
+	# Hand a marshalled message (see _cpc_marshal) to the library without waiting for buffer space
+	def _cpc_write(self, send_func, canmsg) -> None:
+		result = send_func(self._cpc_handle, 0, ctypes.byref(canmsg))
+		if result != CPC_ERR_NONE:
+			if self._busoff_since is not None:
+				self._busoff_tx_dropped += 1
+			raise CanOperationError(message="Failed to send: " + _cpcErrToStr(error_code=result), error_code=result)
+
+	# Wait for buffer space for at most _TX_WAIT_SLICE, so a sender does not block a pending 
+	# configuration change (e.g. the bus-off restart) while the device does not transmit. 
+	# Returns False if the caller has to leave the transmit path and try again, raises 
+	# CanTimeoutError once the deadline passed.
+	def __wait_for_write_slice(self, deadline : "float | None") -> bool:
+		timeout = _TX_WAIT_SLICE
+		if deadline is not None:
+			timeout = min(timeout, max(0.0, deadline - time.monotonic()))
+		try:
+			self.__wait_for_write_space(timeout=timeout)
+		except CanTimeoutError:
+			if (deadline is not None) and (time.monotonic() >= deadline):
+				raise
+			return False
+		return True
+
+	def __wait_for_write_space(self, timeout: "float | None") -> None:
 		# Verify that our handle is valid
 		if not _isEMSHandleValid(handle=self._cpc_handle):
 			raise CanOperationError(message=_cpcErrToStr(error_code=self._cpc_handle), error_code=self._cpc_handle)
@@ -234,239 +401,434 @@ class EMSWuenscheBus(BusABC):
 			raise CanOperationError(message=_cpcErrToStr(error_code=result), error_code=result)
 		elif not (result & EVENT_WRITE):
 			raise CanTimeoutError(message=_cpcErrToStr(error_code=CPC_ERR_IO_TRANSFER), error_code=CPC_ERR_IO_TRANSFER)
-		# Send FD message
-		if msg.is_fd:
-			canmsg = CPC_CANFD_MSG_T()
-			canmsg.id = msg.arbitration_id
-			canmsg.length = msg.dlc
-			canmsg.flags = 0
-			if msg.is_extended_id:
-				canmsg.type |= CPC_FDFLAG_XTD
-				canmsg.id = canmsg.id & 0x1FFFFFFF
-			else:
-				canmsg.id = canmsg.id & 0x000007FF
-			if msg.is_remote_frame:
-				canmsg.type |= CPC_FDFLAG_RTR
-			else:
-				# Copy data if not rtr
-				for i in range(msg.dlc):
-					canmsg.msg[i] = msg.data[i]
-			if not msg.is_fd:
-				canmsg.type |= CPC_FDFLAG_NONCANFD_MSG
-			if msg.is_error_frame:
-				canmsg.type |= CPC_FDFLAG_ESI
-			if msg.bitrate_switch:
-				canmsg.type |= CPC_FDFLAG_BRS
-			result = CPC_SendMsgFD(self._cpc_handle, 0, ctypes.byref(canmsg))
-		# Send classic CAN message
-		else:
-			canmsg = CPC_CAN_MSG_T()
-			canmsg.length = msg.dlc
-			# Copy data (for non-rtr messages)
-			if not msg.is_remote_frame:
-				for i in range(msg.dlc):
-					canmsg.msg[i] = msg.data[i]
-			if not msg.is_extended_id:
-				canmsg.id = msg.arbitration_id & 0x000007FF
-				if not msg.is_remote_frame:
-					result = CPC_SendMsg(self._cpc_handle, 0, ctypes.byref(canmsg))
-				else:
-					result = CPC_SendRTR(self._cpc_handle, 0, ctypes.byref(canmsg))
-			else:
-				canmsg.id = msg.arbitration_id & 0x1FFFFFFF
-				if not msg.is_remote_frame:
-					result = CPC_SendXMsg(self._cpc_handle, 0, ctypes.byref(canmsg))
-				else:
-					result = CPC_SendXRTR(self._cpc_handle, 0, ctypes.byref(canmsg))
-		if result != CPC_ERR_NONE:
-			raise CanOperationError(message="Failed to send: " + _cpcErrToStr(error_code=result), error_code=result)
+
+	def _send_periodic_internal(
+		self,
+		msgs: "Message | Sequence[Message]",
+		period: float,
+		duration: "float | None" = None,
+		autostart: bool = True,
+		modifier_callback: "Callable[[Message], None] | None" = None,
+	) -> CyclicSendTaskABC:
+		# python-can 4.2 passes modifier_callback as the fourth positional argument
+		if callable(autostart):
+			modifier_callback = autostart
+			autostart = True
+		if self._scheduler is None:
+			self._scheduler = _CyclicScheduler(bus=self)
+		return EMSWuenscheCyclicSendTask(
+			scheduler=self._scheduler,
+			messages=msgs,
+			period=period,
+			duration=duration,
+			autostart=autostart,
+			modifier_callback=modifier_callback,
+		)
 
 	# Fetch a message from interface
 	def _recv_internal(self, timeout: "float | None") -> Tuple["Message | None", bool]:
+		with self._cpc_quiesce.rx:
+			# Deliver the messages that were received while waiting for infos first
+			if self._rx_pending:
+				# Already filtered by _recv_raw()
+				return _cpc_msg_to_message(CPC_MSG_T.from_buffer_copy(self._rx_pending.popleft())), self._cpc_filter is not None
+			return self.__recv_cpc(timeout=timeout)
+
+	# Wait until all futures are done or the timeout expires. Messages received meanwhile are kept 
+	# for recv(). Returns True if all futures are done.
+	def _cpc_wait_futures(self, futures : list, timeout : float) -> bool:
+		deadline = time.monotonic() + timeout
+		while True:
+			if all(future.done() for future in futures):
+				return True
+			remaining = deadline - time.monotonic()
+			if remaining <= 0:
+				return False
+			with self._cpc_quiesce.rx:
+				# Frames that are already pending stay in front
+				records = self.__drain_raw(timeout=min(remaining, 0.01), max_count=1024)
+				overflow = len(self._rx_pending) + len(records) - _RX_PENDING_MAX
+				if overflow > 0:
+					# Nobody reads them: drop the oldest
+					self._rx_pending_dropped += overflow
+				self._rx_pending.extend(records)
+
+	# Wait for received messages. Returns False if there is nothing to read. Waits at most 
+	# _RX_WAIT_SLICE, so a pending configuration change does not wait for a long receive timeout 
+	# (BusABC.recv() calls again for the remaining time).
+	def __wait_for_read(self, timeout: "float | None") -> bool:
+		if (timeout is None) or (timeout > _RX_WAIT_SLICE):
+			timeout = _RX_WAIT_SLICE
+		# Try to reconnect first (resilient mode only)
+		if self._disconnected_since is not None:
+			if not self.__reconnect(timeout=timeout):
+				return False
+		# Restart the controller after bus-off (automatic bus-off recovery only)
+		if self._busoff_restart_at is not None:
+			wait = self._busoff_restart_at - time.monotonic()
+			if wait <= 0:
+				self.__busoff_restart()
+			elif (timeout is None) or (timeout > wait):
+				# Return in time for the restart
+				timeout = wait
 		# Verify that our handle is valid
 		if not _isEMSHandleValid(handle=self._cpc_handle):
 			raise CanOperationError(message=_cpcErrToStr(error_code=self._cpc_handle), error_code=self._cpc_handle)
-		# Sanity check the timeout value and convert it from float (sec) to int (msec)
-		_timeout = _convert_timeout(timeout=timeout)
-		if _timeout is None:
-			raise ValueError("Failed to convert timeout value: Faulty value is: '"+ str(timeout) + "'")
-		# Wait for messages
-		result = CPC_WaitForEvent(self._cpc_handle, _timeout, EVENT_READ)
+		result = 0
+		if self._cpc_rx_poller is not None:
+			# Poll first (see RxPollStrategy), the blocking wait only gets the time that is left
+			result, timeout = self._cpc_rx_poller.poll(handle=self._cpc_handle, timeout=timeout)
+			if (result == 0) and (timeout <= 0):
+				return False
+		if result == 0:
+			# Sanity check the timeout value and convert it from float (sec) to int (msec)
+			_timeout = _convert_timeout(timeout=timeout)
+			if _timeout is None:
+				raise ValueError("Failed to convert timeout value: Faulty value is: '"+ str(timeout) + "'")
+			# Wait for messages
+			result = CPC_WaitForEvent(self._cpc_handle, _timeout, EVENT_READ)
 		if result < 0:
+			if self._reconnect and (result == CPC_ERR_NO_INTERFACE_PRESENT):
+				self.__disconnected()
+				return False
 			raise CanOperationError(message=_cpcErrToStr(error_code=result), error_code=result)
-		elif (result & EVENT_READ) == 0:
+		return (result & EVENT_READ) != 0
+
+	# Fetch the next message from the library. The returned structure is only valid until the next call.
+	def __next_cpc_msg(self) -> "CPC_MSG_T | None":
+		if not _isEMSHandleValid(handle=self._cpc_handle):
+			return None
+		msg = CPC_Handle(self._cpc_handle)
+		if not msg:
+			return None
+		msg = msg[0]
+		if not msg:
+			return None
+		return msg
+
+	def __recv_cpc(self, timeout: "float | None") -> Tuple["Message | None", bool]:
+		if self._cpc_change_filter is not None:
+			self._cpc_change_filter.poll()
+		if not self.__wait_for_read(timeout=timeout):
 			return None, False
 		# Fetch message
 		while True:
-			msg = CPC_Handle(self._cpc_handle)
-			if not msg:
-				break
-			msg = msg[0]
-			if not msg:
+			msg = self.__next_cpc_msg()
+			if msg is None:
 				break
 			logger.debug("Received a message with type: " + str(msg.type))
-			if msg.type == CPC_MSG_T_CANFD:
-				isExt = False
-				isRTR = False
-				isFD = False
-				btrs = False
-				isESI = False
-				if msg.msg.canfdmsg.flags & CPC_FDFLAG_XTD:
-					isExt = True
-				if msg.msg.canfdmsg.flags & CPC_FDFLAG_RTR:
-					isRTR = True
-				if msg.msg.canfdmsg.flags & CPC_FDFLAG_ESI:
-					isESI = True
-				if not (msg.msg.canfdmsg.flags & CPC_FDFLAG_NONCANFD_MSG):
-					isFD = True
-					# baudrate switch is only available with CAN-FD
-					if msg.msg.canfdmsg.flags & CPC_FDFLAG_BRS:
-						btrs = True
-				return Message(
-					timestamp=msg.ts_sec + (msg.ts_nsec / 1_000_000_000.0),
-					arbitration_id=msg.msg.canfdmsg.id,
-					is_extended_id=isExt,
-					is_remote_frame=isRTR,
-					is_error_frame=False,
-					dlc=msg.msg.canfdmsg.length,
-					data=msg.msg.canfdmsg.msg[:msg.msg.canfdmsg.length],
-					is_fd=isFD,
-					bitrate_switch=btrs,
-					error_state_indicator=isESI
-				), False
-			elif msg.type == CPC_MSG_T_CAN:
-				return Message(
-					timestamp=msg.ts_sec + (msg.ts_nsec / 1_000_000_000.0),
-					arbitration_id=msg.msg.canmsg.id,
-					is_extended_id=False,
-					is_remote_frame=False,
-					is_error_frame=False,
-					dlc=msg.msg.canmsg.length,
-					data=msg.msg.canmsg.msg[:msg.msg.canmsg.length],
-					is_fd=False,
-					bitrate_switch=False,
-					error_state_indicator=False
-				), False
-			elif msg.type == CPC_MSG_T_XCAN:
-				return Message(
-					timestamp=msg.ts_sec + (msg.ts_nsec / 1_000_000_000.0),
-					arbitration_id=msg.msg.canmsg.id,
-					is_extended_id=True,
-					is_remote_frame=False,
-					is_error_frame=False,
-					dlc=msg.msg.canmsg.length,
-					data=msg.msg.canmsg.msg[:msg.msg.canmsg.length],
-					is_fd=False,
-					bitrate_switch=False,
-					error_state_indicator=False
-				), False
-			elif msg.type == CPC_MSG_T_RTR:
-				return Message(
-					timestamp=msg.ts_sec + (msg.ts_nsec / 1_000_000_000.0),
-					arbitration_id=msg.msg.canmsg.id,
-					is_extended_id=False,
-					is_remote_frame=True,
-					is_error_frame=False,
-					dlc=msg.msg.canmsg.length,
-					data=[],
-					is_fd=False,
-					bitrate_switch=False,
-					error_state_indicator=False
-				), False
-			elif msg.type == CPC_MSG_T_XRTR:
-				return Message(
-					timestamp=msg.ts_sec + (msg.ts_nsec / 1_000_000_000.0),
-					arbitration_id=msg.msg.canmsg.id,
-					is_extended_id=True,
-					is_remote_frame=True,
-					is_error_frame=False,
-					dlc=msg.msg.canmsg.length,
-					data=[],
-					is_fd=False,
-					bitrate_switch=False,
-					error_state_indicator=False
-				), False
-			elif msg.type == CPC_MSG_T_INFO:
-				if msg.length < 2:
-					logger.debug("CPC_MSG_T_INFO: Invalid length!")
+			if msg.type in _cpc_frame_types:
+				stages = self._cpc_rx_stages
+				if not stages:
+					return _cpc_msg_to_message(msg), False
+				record = bytes(msg)
+				for stage in stages:
+					if not stage.match(record):
+						break
 				else:
-					info_src  = _infoSourceToString(msg.msg.info.source)
-					if info_src is None:
-						info_src = str(msg.msg.info.source)
-					info_type = _infoTypeToString(msg.msg.info.type)
-					if info_type is None:
-						info_type = str(msg.msg.info.type)
-					#
-					if info_src not in self._infomsg:
-						self._infomsg[info_src] = {}
-					if msg.length > 2:
-						self._infomsg[info_src][info_type] = msg.msg.info.msg[:msg.length-2].decode("ascii")
-					else:
-						self._infomsg[info_src][info_type] = ""
-					logger.debug("CPC_MSG_T_INFO: len=" + str(msg.length) + " src=" + info_src + " type=" + info_type + " msg='" + self._infomsg[info_src][info_type] + "'")
-			elif msg.type == CPC_MSG_T_CANSTATE:
-				logger.debug("CPC_MSG_T_CANSTATE: " + str(msg.msg.canstate))
-				if msg.msg.canstate & CPC_CAN_STATE_BUSOFF:
-					self._state = BusState.ERROR
-				elif self._state == BusState.ERROR:
-					self._state = self._target_state
-			elif msg.type == CPC_MSG_T_CANERROR:
-				logger.debug("CPC_MSG_T_CANERROR")
-				if msg.msg.error.ecode == CPC_CAN_ECODE_ERRFRAME:
-					if msg.msg.error.cc.cc_type == SJA1000:
-						# u8 ecc, rxerr, txerr -> 3 bytes in total
-						data = bytes(msg.msg.error.cc.regs.sja1000)
-						return Message(
-							timestamp=msg.ts_sec + (msg.ts_nsec / 1_000_000_000.0),
-							dlc=len(data),
-							data=data,
-							is_error_frame=True
-						), False
-					elif msg.msg.error.cc.cc_type == LPC546XX:
-						# u32 psr, ecr -> 8 bytes in total
-						data = bytes(msg.msg.error.cc.regs.lpc546xx)
-						return Message(
-							timestamp=msg.ts_sec + (msg.ts_nsec / 1_000_000_000.0),
-							dlc=len(data),
-							data=data,
-							is_fd=False,
-							is_error_frame=True
-						), False
-				return Message(
-					timestamp=msg.ts_sec + (msg.ts_nsec / 1_000_000_000.0),
-					is_error_frame=True
-				), False
-			elif msg.type == CPC_MSG_T_DISCONNECTED:
-				logger.debug("CPC_MSG_T_DISCONNECTED")
-				self.shutdown()
-				raise CanOperationError(message=_cpcErrToStr(error_code=self._cpc_handle), error_code=self._cpc_handle)
-			elif msg.type == CPC_MSG_T_CAN_PRMS:
-				logger.debug("CPC_MSG_T_CAN_PRMS")
-				self._timing = _create_timing_from_can_params(can_params=msg.msg.canparams)
-				if not _can_params_get_listen_only(can_params=msg.msg.canparams):
-					self._target_state = BusState.ACTIVE
+					return _cpc_msg_to_message(msg), self._cpc_filter is not None
+				continue
+			self.__handle_cpc_msg(msg)
+		return None, False
+
+	# Fetch up to max_count frames as raw CPC_MSG_T records (bytes, see CPC_MSG_T.from_buffer_copy()).
+	# All other message types (infos, states, ...) are handled as usual. With unfiltered=True the 
+	# pending frames and the receive stages are bypassed.
+	def _recv_raw(self, timeout: "float | None", max_count : int = 1024, unfiltered : bool = False) -> List[bytes]:
+		with self._cpc_quiesce.rx:
+			if unfiltered:
+				return self.__drain_raw(timeout=timeout, max_count=max_count, stages=())
+			if self._rx_pending:
+				records = []
+				while self._rx_pending and (len(records) < max_count):
+					records.append(self._rx_pending.popleft())
+				return records
+			return self.__drain_raw(timeout=timeout, max_count=max_count)
+
+	# Like _recv_raw() but without the pending frames
+	def __drain_raw(self, timeout: "float | None", max_count : int, stages : "list | None" = None) -> List[bytes]:
+		records = []
+		if not self.__wait_for_read(timeout=timeout):
+			return records
+		while len(records) < max_count:
+			msg = self.__next_cpc_msg()
+			if msg is None:
+				break
+			if msg.type in _cpc_frame_types:
+				records.append(bytes(msg))
+			else:
+				self.__handle_cpc_msg(msg)
+		for stage in (self._cpc_rx_stages if stages is None else stages):
+			records = stage.filter(records)
+		return records
+
+	# Handle all messages that are not frames (see _cpc_frame_types)
+	def __handle_cpc_msg(self, msg : CPC_MSG_T) -> None:
+		if msg.type == CPC_MSG_T_INFO:
+			if msg.length < 2:
+				logger.debug("CPC_MSG_T_INFO: Invalid length!")
+			else:
+				info_src  = _infoSourceToString(msg.msg.info.source)
+				if info_src is None:
+					info_src = str(msg.msg.info.source)
+				info_type = _infoTypeToString(msg.msg.info.type)
+				if info_type is None:
+					info_type = str(msg.msg.info.type)
+				#
+				if info_src not in self._infomsg:
+					self._infomsg[info_src] = {}
+				if msg.length > 2:
+					self._infomsg[info_src][info_type] = msg.msg.info.msg[:msg.length-2].decode("ascii")
 				else:
-					self._target_state = BusState.PASSIVE
+					self._infomsg[info_src][info_type] = ""
+				logger.debug("CPC_MSG_T_INFO: len=" + str(msg.length) + " src=" + info_src + " type=" + info_type + " msg='" + self._infomsg[info_src][info_type] + "'")
+				if msg.msg.info.source in (CPC_INFOMSG_T_INTERFACE, CPC_INFOMSG_T_DRIVER):
+					_info_cache_store(channel_info=self.channel_info, infomsg=self._infomsg)
+					if not self._capabilities_stored:
+						self.__store_capabilities()
+				self._info_requests.resolve(msg.msg.info.source, msg.msg.info.type, self._infomsg[info_src][info_type])
+		elif msg.type == CPC_MSG_T_CANSTATE:
+			logger.debug("CPC_MSG_T_CANSTATE: " + str(msg.msg.canstate))
+			if msg.msg.canstate & CPC_CAN_STATE_BUSOFF:
+				self._state = BusState.ERROR
+				if (self._busoff_policy is not None) and (self._busoff_since is None):
+					self._busoff_since = time.time()
+					self._busoff_restart_at = time.monotonic() + self._busoff_policy._next_delay(now=time.monotonic())
+			elif self._state == BusState.ERROR:
+				self._state = self._target_state
+				if self._busoff_since is not None:
+					self.__busoff_recovered()
+		elif msg.type == CPC_MSG_T_OVERRUN:
+			logger.debug("CPC_MSG_T_OVERRUN: " + str(msg.msg.overrun.count & ~CPC_OVR_HW))
+			if self._busoff_since is not None:
+				self._busoff_rx_dropped += msg.msg.overrun.count & ~CPC_OVR_HW
+		elif msg.type == CPC_MSG_T_DISCONNECTED:
+			logger.debug("CPC_MSG_T_DISCONNECTED")
+			if self._reconnect:
+				self.__disconnected()
+				return
+			self.shutdown()
+			raise CanOperationError(message=_cpcErrToStr(error_code=self._cpc_handle), error_code=self._cpc_handle)
+		elif msg.type == CPC_MSG_T_CAN_PRMS:
+			logger.debug("CPC_MSG_T_CAN_PRMS")
+			self._timing = _create_timing_from_can_params(can_params=msg.msg.canparams)
+			if not _can_params_get_listen_only(can_params=msg.msg.canparams):
+				self._target_state = BusState.ACTIVE
+			else:
+				self._target_state = BusState.PASSIVE
+			if self._can_params is not None:
 				_can_params_copy(dst=self._can_params, src=msg.msg.canparams)
-				if self._state != BusState.ERROR:
-					self._state = self._target_state
-			#else:
-			#	logger.debug("Unhandled message type: "+str(msg.type))
-		return None, False
+			if self._cpc_applied_params is not None:
+				_can_params_copy(dst=self._cpc_applied_params, src=msg.msg.canparams)
+			if self._state != BusState.ERROR:
+				self._state = self._target_state
+		#else:
+		#	logger.debug("Unhandled message type: "+str(msg.type))
 
 	def flush_tx_buffer(self) -> None:
-		super().flush_tx_buffer()
-		if _isEMSHandleValid(handle=self._cpc_handle):
-			CPC_ClearCMDQueue(self._cpc_handle)
+		with self._cpc_quiesce.tx:
+			self._tx_backlog.clear()
+			if _isEMSHandleValid(handle=self._cpc_handle):
+				CPC_ClearCMDQueue(self._cpc_handle, 0)
 
 	def shutdown(self) -> None:
-		if _isEMSHandleValid(handle=self._cpc_handle):
-			CPC_CloseChannel(self._cpc_handle)
-			self._cpc_handle = CPC_ERR_NO_INTERFACE_PRESENT
 		super().shutdown()
+		self._info_requests.cancel_all()
+		if self._cpc_tx_queue is not None:
+			self._cpc_tx_queue.close()
+			self._cpc_tx_queue = None
+		if self._scheduler is not None:
+			self._scheduler.stop()
+			self._scheduler = None
+		with self._cpc_quiesce:
+			if _isEMSHandleValid(handle=self._cpc_handle):
+				CPC_CloseChannel(self._cpc_handle)
+				self._cpc_handle = CPC_ERR_NO_INTERFACE_PRESENT
+
+	# Filters are compiled into lookup tables and applied to the raw frames before any message is created
+	def _apply_filters(self, filters: "CanFilters | None") -> None:
+		self._cpc_filter = _FilterEngine(can_filters=filters) if filters else None
+		self.__update_rx_stages()
+
+	# Stages that every received frame passes (in this order) before it is delivered. Each stage has 
+	# match(record) -> bool for single raw frames and filter(records) -> records for batches.
+	# Protocol handlers come before the receive filters, so can_filters that exclude their ids do 
+	# not starve them (they only take their own frames, everything else passes on).
+	def __update_rx_stages(self) -> None:
+		first = [stage for stage in (self._cpc_errors, self._cpc_correlator) if stage is not None]
+		last  = [stage for stage in (self._cpc_filter, self._cpc_latest, self._cpc_change_filter) if stage is not None]
+		self._cpc_rx_stages = first + self._cpc_protocol_stages + last
+
+	# Add a protocol handler (e.g. ISO-TP) that sees the frames before the receive filters
+	def _cpc_add_rx_stage(self, stage) -> None:
+		self._cpc_protocol_stages = self._cpc_protocol_stages + [stage]
+		self.__update_rx_stages()
+
+	def _cpc_remove_rx_stage(self, stage) -> None:
+		self._cpc_protocol_stages = [s for s in self._cpc_protocol_stages if s is not stage]
+		self.__update_rx_stages()
+
+	def cpc_latest_values(self, ext_capacity : int = 1024, deliver : bool = True) -> EMSWuenscheLatestValues:
+		"""Store of the latest received frame per id, created on the first call.
+
+		The store is updated by the receive loop for every frame that passes the filters, so the bus
+		still needs to be read (e.g. by a can.Notifier). With deliver=False the frames only go to 
+		the store and recv() does not create any messages.
+		"""
+		if self._cpc_latest is None:
+			self._cpc_latest = EMSWuenscheLatestValues(ext_capacity=ext_capacity, deliver=deliver)
+			self.__update_rx_stages()
+		return self._cpc_latest
+
+	def cpc_tx_queue(self, lanes : int = 4, max_backlog : float = 0.002, capacity : int = 10000, timeout : float = 1.0) -> EMSWuenscheTxQueue:
+		"""Priority transmit lanes of the bus, created on the first call.
+
+		Frames sent through the lanes (EMSWuenscheTxQueue.send()) are queued on the host and 
+		handed to the device most urgent first, keeping at most max_backlog seconds of bus time 
+		in the device queue. Frames sent with send() of the bus bypass the lanes.
+		"""
+		if self._cpc_tx_queue is None:
+			self._cpc_tx_queue = EMSWuenscheTxQueue(bus=self, lanes=lanes, max_backlog=max_backlog, capacity=capacity, timeout=timeout)
+		return self._cpc_tx_queue
+
+	def cpc_error_analytics(self, window : float = 60.0, slots : int = 60, keep_events : int = 100) -> EMSWuenscheErrorAnalytics:
+		"""Decoded statistics of the received error frames, created on the first call.
+
+		Error frames are counted before the receive filters are applied. The bus still needs to 
+		be read (e.g. by a can.Notifier) to keep the statistics updated.
+		"""
+		if self._cpc_errors is None:
+			self._cpc_errors = EMSWuenscheErrorAnalytics(window=window, slots=slots, keep_events=keep_events)
+			self.__update_rx_stages()
+		return self._cpc_errors
+
+	def cpc_detect_bitrate(
+		self,
+		bitrates : "List[int] | None" = None,
+		fd : bool = False,
+		data_bitrates : "List[int] | None" = None,
+		min_dwell : float = 0.02,
+		max_dwell : float = 0.5,
+		min_frames : int = 3,
+		timeout : float = 10.0,
+		apply : bool = True,
+	) -> AutoBaudResult:
+		"""Detect the bitrate of the bus in listen-only mode.
+
+		The bitrates are tried in the given order (default AUTOBAUD_BITRATES, most common first). 
+		A bitrate is accepted after min_frames valid frames without an error frame and skipped as 
+		soon as only error frames arrive, so an active bus is usually detected within a few 
+		milliseconds per candidate. On a silent bus the listening time per candidate grows from 
+		min_dwell up to max_dwell until the timeout expires.
+
+		With fd=True the configurations are CAN FD ones and the data bitrate (data_bitrates, 
+		default AUTOBAUD_DATA_BITRATES) is detected from frames with bitrate switch. This needs 
+		a controller that reports the errors of the data phase (LPC546XX).
+
+		With apply=True the detected bitrate is kept (in the requested bus state), otherwise and 
+		if nothing was detected the previous parameters are restored. Frames received during 
+		the detection are not delivered.
+		"""
+		if fd and (self._can_params.cc_type == SJA1000):
+			raise CanOperationError(message="The SJA1000 does not support CAN FD")
+		with self._cpc_quiesce:
+			return self.__detect_bitrate(bitrates=bitrates, fd=fd, data_bitrates=data_bitrates, min_dwell=min_dwell, max_dwell=max_dwell, min_frames=min_frames, timeout=timeout, apply=apply)
+
+	# Runs quiesced: other threads neither receive nor send while the bitrate is probed
+	def __detect_bitrate(self, bitrates, fd : bool, data_bitrates, min_dwell : float, max_dwell : float, min_frames : int, timeout : float, apply : bool) -> AutoBaudResult:
+		previous = CPC_CAN_PARAMS_T()
+		_can_params_copy(dst=previous, src=self._can_params)
+		try:
+			result = _AutoBaud(
+				bus=self,
+				bitrates=bitrates,
+				fd=fd,
+				data_bitrates=data_bitrates,
+				min_dwell=min_dwell,
+				max_dwell=max_dwell,
+				min_frames=min_frames,
+				timeout=timeout,
+			).run()
+		except BaseException:
+			self._cpc_reinit(can_params=previous)
+			raise
+		if apply and (result.timing is not None):
+			can_params = _create_can_params(controller=previous.cc_type, timing=result.timing)
+			_can_params_set_listen_only(can_params=can_params, listen_only=self._target_state != BusState.ACTIVE)
+		else:
+			can_params = previous
+		self._cpc_reinit(can_params=can_params)
+		logger.info("Bitrate detection: " + str(result.bitrate) + "/" + str(result.data_bitrate) + " after " + str(round(result.duration, 3)) + "s")
+		return result
+
+	def cpc_iter_batches(
+		self,
+		batch_size : int = 65536,
+		flush_interval : float = 1.0,
+		arrow : bool = False,
+		payload_size : int = 64,
+		duration : "float | None" = None,
+		stop : "threading.Event | None" = None,
+	) -> Iterator:
+		"""Receive frames as column batches instead of messages.
+
+		Yields a dict of NumPy arrays (see COLUMNS; data is a (n, payload_size) uint8 array) or, 
+		with arrow=True, a pyarrow.RecordBatch (data as fixed size binary). The columns are 
+		built from the raw frames without creating a can.Message per frame. A batch is yielded 
+		when batch_size frames were received or flush_interval seconds after its first frame. 
+		Stops after duration seconds or when stop is set. Needs numpy (and pyarrow for arrow=True).
+		"""
+		return _iter_batches(bus=self, batch_size=batch_size, flush_interval=flush_interval, arrow=arrow, payload_size=payload_size, duration=duration, stop=stop)
+
+	# Send a request. The future resolves with the first received frame that matches (id, mask), 
+	# which is not delivered to recv(). Cancel the future to give up waiting.
+	def request_async(self, msg : Message, match : "int | Tuple[int, int]", is_extended_id : "bool | None" = None) -> Future:
+		if isinstance(match, int):
+			can_id, mask = match, 0x1FFFFFFF
+		else:
+			can_id, mask = match
+		if is_extended_id is None:
+			is_extended_id = msg.is_extended_id
+		if self._cpc_correlator is None:
+			self._cpc_correlator = _Correlator()
+			self.__update_rx_stages()
+		# Register before sending, the response may be received immediately
+		future = self._cpc_correlator.add(can_id=can_id, mask=mask & 0x1FFFFFFF, extended=is_extended_id)
+		try:
+			self.send(msg)
+		except Exception:
+			future.cancel()
+			raise
+		return future
 
-	#def _apply_filters(self, filters: "CanFilters | None") -> None:
-	#	return super()._apply_filters(filters)
+	# Send a request and wait for the response (None on timeout). Messages received while waiting 
+	# are kept for recv(). If another thread is receiving (e.g. a can.Notifier) then use 
+	# request_async() instead.
+	def request(self, msg : Message, match : "int | Tuple[int, int]", timeout : float = 1.0, is_extended_id : "bool | None" = None) -> "Message | None":
+		future = self.request_async(msg=msg, match=match, is_extended_id=is_extended_id)
+		if not self._cpc_wait_futures(futures=[future], timeout=timeout):
+			future.cancel()
+		if future.cancelled():
+			return None
+		return future.result()
+
+	def __change_summary(self, summary : ChangeSummary) -> None:
+		self.cpc_change_summaries.append(summary)
+		if self._on_change_summary is not None:
+			self._on_change_summary(summary)
+
+	@property
+	def cpc_rx_pending_dropped(self) -> int:
+		"""Number of frames that were dropped because too many frames arrived while 
+		waiting for infos or responses and nobody called recv()."""
+		return self._rx_pending_dropped
+
+	@property
+	def cpc_filter_hits(self) -> List[int]:
+		"""Number of received frames accepted by each filter (see set_filters())."""
+		if self._cpc_filter is None:
+			return []
+		return list(self._cpc_filter.hits)
 
 	@staticmethod
 	def _detect_available_configs() -> List[AutoDetectedConfig]:
@@ -517,12 +879,45 @@ class EMSWuenscheBus(BusABC):
 
 	@timing.setter
 	def timing(self, timing : "BitTiming | BitTimingFd"):
-		if self._can_params:
-			self._can_params = _create_can_params(controller=self._can_params.cc_type, timing=timing)
-		else:
-			self._can_params = _create_can_params(controller=GENERIC_CAN_CONTR, timing=timing)
-		self._timing = timing
-		self.__apply_can_params()
+		with self._cpc_quiesce:
+			if self._can_params:
+				self._can_params = _create_can_params(controller=self._can_params.cc_type, timing=timing)
+			else:
+				self._can_params = _create_can_params(controller=GENERIC_CAN_CONTR, timing=timing)
+			_can_params_set_listen_only(can_params=self._can_params, listen_only=self._target_state != BusState.ACTIVE)
+			self._timing = timing
+			self.__commit_can_params()
+
+	# Receive strategy (see RxPollStrategy)
+	@property
+	def cpc_rx_poll(self) -> RxPollStrategy:
+		if self._cpc_rx_poller is None:
+			return RxPollStrategy(mode=RxPollStrategy.BLOCKING)
+		return self._cpc_rx_poller.strategy
+
+	@cpc_rx_poll.setter
+	def cpc_rx_poll(self, strategy : "RxPollStrategy | str | None"):
+		if isinstance(strategy, str):
+			strategy = RxPollStrategy(mode=strategy)
+		with self._cpc_quiesce.rx:
+			if (strategy is None) or (strategy.mode == RxPollStrategy.BLOCKING):
+				self._cpc_rx_poller = None
+			else:
+				self._cpc_rx_poller = _RxPoller(strategy=strategy)
+
+	def cpc_rx_poll_statistics(self) -> dict:
+		"""Waits satisfied by polling (hits), waits that fell back to the blocking wait (misses) or 
+		skipped polling because the CPU budget was used up (throttled) and the total polling time."""
+		if self._cpc_rx_poller is None:
+			return {"mode": RxPollStrategy.BLOCKING, "hits": 0, "misses": 0, "throttled": 0, "spin_time": 0.0}
+		return self._cpc_rx_poller.statistics()
+
+	# Controller type of the current CAN parameters
+	@property
+	def cpc_controller(self) -> "int | None":
+		if self._can_params is None:
+			return None
+		return self._can_params.cc_type
 
 	@property
 	def state(self) -> BusState:
@@ -530,43 +925,381 @@ class EMSWuenscheBus(BusABC):
 
 	@state.setter
 	def state(self, state):
-		# We can't set the device to BusState.ERROR
-		if state not in (BusState.ACTIVE, BusState.PASSIVE):
-			raise ValueError("BusState must be Active or Passive")
-		_can_params_set_listen_only(can_params=self._can_params, listen_only=state != BusState.ACTIVE)
-		self._target_state = state
+		with self._cpc_quiesce:
+			# We can't set the device to BusState.ERROR
+			if state not in (BusState.ACTIVE, BusState.PASSIVE):
+				raise ValueError("BusState must be Active or Passive")
+			_can_params_set_listen_only(can_params=self._can_params, listen_only=state != BusState.ACTIVE)
+			self._target_state = state
+			self.__commit_can_params()
+
+	def configure(self) -> EMSWuenscheConfiguration:
+		"""Change several settings with a single CPC_CANInit:
+
+			with bus.configure():
+				bus.timing = BitTiming(...)
+				bus.state = BusState.PASSIVE
+
+		At the end of the block the CAN parameters are compared with the ones of the last 
+		CPC_CANInit and only applied if they differ. If the block raises, the changes are 
+		discarded. Each CPC_CANInit is recorded as Reconfiguration (with the time the controller 
+		was offline) in cpc_reconfigurations. Setting timing or state outside of a block behaves 
+		like a block with a single change.
+		"""
+		return EMSWuenscheConfiguration(bus=self)
+
+	# The paths stay quiesced for the whole block, so the changes are applied atomically
+	def _cpc_begin_configuration(self) -> None:
+		self._cpc_quiesce.__enter__()
+		if self._cpc_config_depth == 0:
+			can_params = CPC_CAN_PARAMS_T()
+			_can_params_copy(dst=can_params, src=self._can_params)
+			self._cpc_config_saved = (can_params, self._target_state, self._timing)
+		self._cpc_config_depth += 1
+
+	def _cpc_end_configuration(self, commit : bool) -> "Reconfiguration | None":
+		try:
+			self._cpc_config_depth -= 1
+			if self._cpc_config_depth:
+				return None
+			saved, self._cpc_config_saved = self._cpc_config_saved, None
+			if not commit:
+				self._can_params, self._target_state, self._timing = saved
+				return None
+			return self.__commit_can_params()
+		finally:
+			self._cpc_quiesce.__exit__(None, None, None)
+
+	# Apply the CAN parameters with a CPC_CANInit if they differ from the ones of the last 
+	# CPC_CANInit (or to leave an error state). Deferred until the end of a configure() block.
+	def __commit_can_params(self) -> "Reconfiguration | None":
+		if self._cpc_config_depth:
+			return None
+		if self._cpc_applied_params is None:
+			changes = ["cc_type"]
+		else:
+			changes = _can_params_diff(old=self._cpc_applied_params, new=self._can_params)
+		if (not changes) and (self._state == self._target_state):
+			logger.debug("CAN parameters unchanged, skipping CPC_CANInit")
+			return None
+		start = time.time()
 		self.__apply_can_params()
+		reconfiguration = Reconfiguration(time=start, offline=self._cpc_init_duration, changes=tuple(changes))
+		self.cpc_reconfigurations.append(reconfiguration)
+		logger.info("Reconfigured (" + (", ".join(changes) or "state") + "), offline for " + str(round(reconfiguration.offline * 1000, 3)) + "ms")
+		return reconfiguration
 
 	def reset(self) -> None:
-		if not _isEMSHandleValid(handle=self._cpc_handle):
-			raise CanOperationError(message=_cpcErrToStr(error_code=self._cpc_handle), error_code=self._cpc_handle)
-		result = CPC_ClearCMDQueue(self._cpc_handle, 0)
-		if result != CPC_ERR_NONE:
-			raise CanOperationError(message=_cpcErrToStr(error_code=result), error_code=result)
-		result = CPC_ClearMSGQueue(self._cpc_handle)
-		if result != CPC_ERR_NONE:
-			raise CanOperationError(message=_cpcErrToStr(error_code=result), error_code=result)
-		self.__apply_can_params()
+		with self._cpc_quiesce:
+			if not _isEMSHandleValid(handle=self._cpc_handle):
+				raise CanOperationError(message=_cpcErrToStr(error_code=self._cpc_handle), error_code=self._cpc_handle)
+			result = CPC_ClearCMDQueue(self._cpc_handle, 0)
+			if result != CPC_ERR_NONE:
+				raise CanOperationError(message=_cpcErrToStr(error_code=result), error_code=result)
+			result = CPC_ClearMSGQueue(self._cpc_handle)
+			if result != CPC_ERR_NONE:
+				raise CanOperationError(message=_cpcErrToStr(error_code=result), error_code=result)
+			self.__apply_can_params()
+			if self._busoff_since is not None:
+				self.__busoff_recovered()
 
-	def __apply_can_params(self) -> None:
+	def __timed_stage(self, name : str, stage, **kwargs):
+		start = time.perf_counter()
+		try:
+			return stage(**kwargs)
+		finally:
+			self.cpc_bringup_durations[name] = time.perf_counter() - start
+
+	# Open the channel by name (cpcconf.ini) or by JSON description. Returns the channel for BusABC.
+	def __stage_open(self, channel):
+		if channel is None:
+			channel = "CHAN00"
+		if isinstance(channel, str):
+			channel = channel.strip()
+			if len(channel) < 1:
+				raise CanInterfaceNotImplementedError(message=_cpcErrToStr(error_code=CPC_ERR_NO_MATCHING_CHANNEL), error_code=CPC_ERR_NO_MATCHING_CHANNEL)
+			# Try the normal version first
+			self._cpc_handle = CPC_OpenChannel(channel.encode("ascii"))
+			if _isEMSHandleValid(handle=self._cpc_handle):
+				self.channel = channel
+				self.channel_info = channel
+			else:
+				# Prepare to try the json version
+				try:
+					channel = json.loads(channel)
+				except Exception:
+					raise CanInterfaceNotImplementedError(message=_cpcErrToStr(error_code=self._cpc_handle), error_code=self._cpc_handle)
+				# If json.loads worked then let the code below do the json handling
+		# Try the json version
 		if not _isEMSHandleValid(handle=self._cpc_handle):
-			raise CanOperationError(message=_cpcErrToStr(error_code=self._cpc_handle), error_code=self._cpc_handle)
-		# Get init params pointer. Do NOT use "is None" as that wouldn't catch NULL.
-		initParams = CPC_GetInitParamsPtr(self._cpc_handle)
-		if not initParams:
-			raise CanOperationError(message="Failed to retrieve init parameters: " + _cpcErrToStr(error_code=CPC_ERR_UNKNOWN), error_code=CPC_ERR_UNKNOWN)
-		#
-		_can_params_copy(dst=initParams[0].canparams, src=self._can_params)
-		#
-		result = CPC_CANInit(self._cpc_handle, 0)
-		if result != CPC_ERR_NONE:
-			# TODO If the device was in BusState.ACTIVE before, could it be in BusState.ERROR now since init failed?
-			#self._state = BusState.ERROR
-			if result == CPC_ERR_INVALID_CANPARAMS:
-				raise CanInitializationError(message=_cpcErrToStr(error_code=CPC_ERR_INVALID_CANPARAMS), error_code=CPC_ERR_INVALID_CANPARAMS)
+			if "InterfaceType" in channel:
+				self.channel = { "UNNAMED" : channel }
+				self.channel_info = json.dumps(obj=self.channel, skipkeys=False, ensure_ascii=True, allow_nan=False)
+				self._cpc_handle = CPC_OpenChannelJSON(self.channel_info.encode("ascii"))
+				self._cpc_open_json = True
 			else:
+				for key in channel:
+					if "InterfaceType" in channel[key]:
+						self.channel = { str(key) : channel[key] }
+						self.channel_info = json.dumps(obj=self.channel, skipkeys=False, ensure_ascii=True, allow_nan=False)
+						self._cpc_handle = CPC_OpenChannelJSON(self.channel_info.encode("ascii"))
+						self._cpc_open_json = True
+						if _isEMSHandleValid(handle=self._cpc_handle):
+							break
+		# Verify that our handle is valid
+		if not _isEMSHandleValid(handle=self._cpc_handle):
+			raise CanInterfaceNotImplementedError(message="Failed to open channel: '" + self.channel_info + "': " + _cpcErrToStr(error_code=self._cpc_handle), error_code=self._cpc_handle)
+		return channel
+
+	# Request the infos and wait at most info_timeout for the answers
+	def __stage_request_infos(self, req_infos : bool, info_timeout : float) -> None:
+		if not req_infos:
+			return
+		lib_string = _infoSourceToString(CPC_INFOMSG_T_LIBRARY)
+		self._infomsg[lib_string] = {}
+		# Reuse the infos of a known device
+		cached = _info_cache_lookup(channel_info=self.channel_info, serial=self.__channel_serial())
+		if cached is not None:
+			self._infomsg.update(cached)
+		futures = []
+		for t in [CPC_INFOMSG_T_VERSION, CPC_INFOMSG_T_SERIAL, CPC_INFOMSG_T_CANFD, CPC_INFOMSG_T_CHANNEL_NR]:
+			if cached is None:
+				futures.append(self.__request_info(CPC_INFOMSG_T_INTERFACE, t))
+				futures.append(self.__request_info(CPC_INFOMSG_T_DRIVER, t))
+			lib_info = CPC_GetInfo(self._cpc_handle, CPC_INFOMSG_T_LIBRARY, t)
+			if lib_info:
+				self._infomsg[lib_string][_infoTypeToString(t)] = lib_info.decode("ascii")
+		# Parse the info messages that arrive in time (note: interface responses may 
+		# need more time but we won't wait longer than info_timeout for them)
+		self._cpc_wait_futures(futures=futures, timeout=info_timeout)
+
+	# Initialize the controller (generic params first, then the controller specific ones). A known
+	# controller type is tried first to save the round trip of the rejected generic params.
+	def __stage_init(self, state : BusState, timing, bitrate : int, controller : "int | None" = None, **kwargs) -> None:
+		candidates = [GENERIC_CAN_CONTR, None] # None: SJA1000 or LPC546XX, depending on the params
+		if controller is None:
+			controller = self.__cached_controller()
+		if controller is not None:
+			candidates.insert(0, controller)
+		tried = set()
+		for candidate in candidates:
+			if candidate is None:
+				candidate = LPC546XX if _can_params_is_fd(can_params=self._can_params) else SJA1000
+			if candidate in tried:
+				continue
+			tried.add(candidate)
+			try:
+				self._can_params = _create_can_params(controller=candidate, timing=timing, bitrate=bitrate, **kwargs)
+			except ValueError:
+				# The known controller may not support the requested timing (e.g. SJA1000 and CAN FD)
+				if (controller is not None) and (candidate == controller) and (len(tried) == 1):
+					continue
+				raise
+			_can_params_set_listen_only(can_params=self._can_params, listen_only=state != BusState.ACTIVE)
+			try:
+				self.__apply_can_params()
+				self.__store_capabilities()
+				return
+			except CanOperationError as e:
+				# Some devices may not support generic params yet
+				if e.error_code != CPC_ERR_WRONG_CONTROLLER_TYPE:
+					raise
+				error = e
+		raise error
+
+	# Serial number and firmware version of the interface (None if unknown)
+	def __interface_identity(self) -> "Tuple[str, str] | None":
+		interface = self._infomsg.get(_infoSourceToString(CPC_INFOMSG_T_INTERFACE), {})
+		serial   = interface.get(_infoTypeToString(CPC_INFOMSG_T_SERIAL))
+		firmware = interface.get(_infoTypeToString(CPC_INFOMSG_T_VERSION))
+		if not serial or not firmware:
+			return None
+		return serial, firmware
+
+	# Key of the capability cache entry. Only uses what is known before the controller is 
+	# initialized, the interface infos usually arrive later.
+	def __capability_key(self) -> str:
+		serial = self.__channel_serial()
+		if serial is not None:
+			return "serial:" + serial
+		return "channel:" + self.channel_info
+
+	def __library_version(self) -> str:
+		version = CPC_GetInfo(self._cpc_handle, CPC_INFOMSG_T_LIBRARY, CPC_INFOMSG_T_VERSION)
+		return version.decode("ascii", errors="replace") if isinstance(version, bytes) else ""
+
+	def __cached_controller(self) -> "int | None":
+		if self._capability_cache is None:
+			return None
+		entry = self._capability_cache.lookup(key=self.__capability_key(), library=self.__library_version())
+		if entry is None:
+			return None
+		return entry.get("controller")
+
+	# Record the accepted controller. Called again when the interface infos arrive, which replaces 
+	# the entry if the serial number or firmware differ from the recorded ones.
+	def __store_capabilities(self) -> None:
+		if (self._capability_cache is None) or (self._can_params is None):
+			return
+		identity = self.__interface_identity()
+		interface = self._infomsg.get(_infoSourceToString(CPC_INFOMSG_T_INTERFACE), {})
+		try:
+			can_clk = _can_params_get_clock(can_params=self._can_params)
+		except ValueError:
+			can_clk = None
+		self._capability_cache.store(
+			key=self.__capability_key(),
+			library=self.__library_version(),
+			serial=identity[0] if identity is not None else None,
+			firmware=identity[1] if identity is not None else None,
+			controller=self._can_params.cc_type,
+			canfd=interface.get(_infoTypeToString(CPC_INFOMSG_T_CANFD)),
+			can_clk=can_clk,
+		)
+		self._capabilities_stored = identity is not None
+
+	def __enable_controls(self) -> None:
+		for control in (CONTR_CAN_Message, CONTR_CAN_State, CONTR_BusError):
+			result = CPC_Control(self._cpc_handle, control | CONTR_CONT_ON)
+			if result != CPC_ERR_NONE:
 				raise CanOperationError(message=_cpcErrToStr(error_code=result), error_code=result)
-		self._state = self._target_state
+
+	# Close the lost channel and start the reconnect cycle (resilient mode only)
+	def __disconnected(self) -> None:
+		with self._cpc_quiesce:
+			logger.warning("Interface disconnected: '" + self.channel_info + "'. Trying to reconnect.")
+			if _isEMSHandleValid(handle=self._cpc_handle):
+				CPC_CloseChannel(self._cpc_handle)
+			self._cpc_handle = CPC_ERR_NO_INTERFACE_PRESENT
+			self._state = BusState.ERROR
+			self._busoff_since = None
+			self._busoff_restart_at = None
+			self._disconnected_since = time.time()
+			self._reconnect_backoff.reset()
+			self._reconnect_next = time.monotonic()
+
+	# Try to reopen the channel until it succeeds or the timeout expires. Returns True on success.
+	def __reconnect(self, timeout: "float | None") -> bool:
+		deadline = None if timeout is None else time.monotonic() + timeout
+		while True:
+			now = time.monotonic()
+			if now >= self._reconnect_next:
+				if self.__reopen():
+					break
+				self._reconnect_next = time.monotonic() + self._reconnect_backoff.next()
+			wakeup = self._reconnect_next
+			if deadline is not None:
+				if time.monotonic() >= deadline:
+					return False
+				wakeup = min(wakeup, deadline)
+			time.sleep(max(0.0, wakeup - time.monotonic()))
+		# Report the gap and transmit the messages that were sent during the outage
+		replayed = 0
+		with self._cpc_quiesce:
+			while self._tx_backlog:
+				try:
+					self.__wait_for_write_space(timeout=1.0)
+					self._cpc_write(*self._tx_backlog[0])
+				except CanOperationError as e:
+					logger.warning("Failed to transmit the backlog after reconnect: " + str(e))
+					break
+				self._tx_backlog.popleft()
+				replayed += 1
+			end = time.time()
+			gap = ConnectionGap(start=self._disconnected_since, end=end, duration=end - self._disconnected_since, tx_replayed=replayed, tx_dropped=self._tx_backlog_dropped + len(self._tx_backlog))
+			self._tx_backlog.clear()
+			self._tx_backlog_dropped = 0
+			self._disconnected_since = None
+		self.cpc_connection_gaps.append(gap)
+		logger.warning("Reconnected to '" + self.channel_info + "' after " + str(round(gap.duration, 3)) + "s")
+		if self._on_reconnect is not None:
+			self._on_reconnect(gap)
+		return True
+
+	# Reopen the channel with the stored channel info and restore the previous configuration
+	def __reopen(self) -> bool:
+		if self._cpc_open_json:
+			handle = CPC_OpenChannelJSON(self.channel_info.encode("ascii"))
+		else:
+			handle = CPC_OpenChannel(self.channel_info.encode("ascii"))
+		if not _isEMSHandleValid(handle=handle):
+			logger.debug("Reconnect failed: " + _cpcErrToStr(error_code=handle))
+			return False
+		with self._cpc_quiesce:
+			self._cpc_handle = handle
+			try:
+				self.__apply_can_params()
+				self.__enable_controls()
+			except CanError as e:
+				logger.debug("Reconnect failed: " + str(e))
+				CPC_CloseChannel(self._cpc_handle)
+				self._cpc_handle = CPC_ERR_NO_INTERFACE_PRESENT
+				self._state = BusState.ERROR
+				return False
+		return True
+
+	# Restart the controller with the current parameters (automatic bus-off recovery only)
+	def __busoff_restart(self) -> None:
+		self._busoff_restart_at = None
+		self._busoff_restarts += 1
+		self._busoff_policy._restarted(now=time.monotonic())
+		try:
+			self.__apply_can_params()
+		except CanError as e:
+			logger.warning("Bus-off recovery: Restart failed: " + str(e))
+			self._busoff_restart_at = time.monotonic() + self._busoff_policy._next_delay(now=time.monotonic())
+			return
+		self.__busoff_recovered()
+
+	def __busoff_recovered(self) -> None:
+		end = time.time()
+		recovery = BusOffRecovery(start=self._busoff_since, end=end, duration=end - self._busoff_since, restarts=self._busoff_restarts, rx_dropped=self._busoff_rx_dropped, tx_dropped=self._busoff_tx_dropped)
+		self._busoff_since = None
+		self._busoff_restart_at = None
+		self._busoff_restarts = 0
+		self._busoff_rx_dropped = 0
+		self._busoff_tx_dropped = 0
+		self.cpc_busoff_recoveries.append(recovery)
+		logger.info("Recovered from bus-off after " + str(round(recovery.duration, 3)) + "s")
+		if self._on_busoff_recovery is not None:
+			self._on_busoff_recovery(recovery)
+
+	# Initialize the controller with other CAN parameters (e.g. while detecting the bitrate).
+	# Frames that were received with the old parameters are dropped.
+	def _cpc_reinit(self, can_params : CPC_CAN_PARAMS_T) -> None:
+		with self._cpc_quiesce:
+			self._can_params = can_params
+			self._timing = None
+			self.__apply_can_params()
+			if _can_params_get_listen_only(can_params=can_params):
+				self._state = BusState.PASSIVE
+			CPC_ClearMSGQueue(self._cpc_handle)
+
+	def __apply_can_params(self) -> None:
+		with self._cpc_quiesce:
+			if not _isEMSHandleValid(handle=self._cpc_handle):
+				raise CanOperationError(message=_cpcErrToStr(error_code=self._cpc_handle), error_code=self._cpc_handle)
+			# Get init params pointer. Do NOT use "is None" as that wouldn't catch NULL.
+			initParams = CPC_GetInitParamsPtr(self._cpc_handle)
+			if not initParams:
+				raise CanOperationError(message="Failed to retrieve init parameters: " + _cpcErrToStr(error_code=CPC_ERR_UNKNOWN), error_code=CPC_ERR_UNKNOWN)
+			#
+			_can_params_copy(dst=initParams[0].canparams, src=self._can_params)
+			#
+			start = time.perf_counter()
+			result = CPC_CANInit(self._cpc_handle, 0)
+			self._cpc_init_duration = time.perf_counter() - start
+			if result != CPC_ERR_NONE:
+				# TODO If the device was in BusState.ACTIVE before, could it be in BusState.ERROR now since init failed?
+				#self._state = BusState.ERROR
+				if result == CPC_ERR_INVALID_CANPARAMS:
+					raise CanInitializationError(message=_cpcErrToStr(error_code=CPC_ERR_INVALID_CANPARAMS), error_code=CPC_ERR_INVALID_CANPARAMS)
+				else:
+					raise CanOperationError(message=_cpcErrToStr(error_code=result), error_code=result)
+			if self._cpc_applied_params is None:
+				self._cpc_applied_params = CPC_CAN_PARAMS_T()
+			_can_params_copy(dst=self._cpc_applied_params, src=self._can_params)
+			self._state = self._target_state
 
 	# Request info from device, driver or library
 	def cpc_request_info(self, info_source : str, info_type : str) -> bool:
@@ -592,6 +1325,48 @@ class EMSWuenscheBus(BusABC):
 				return True
 			return False
 
+	# Request info from device, driver or library. The future resolves with the answer (a string).
+	def cpc_request_info_async(self, info_source : str, info_type : str) -> Future:
+		s = _stringToInfoSource(info_source)
+		if s is None:
+			raise ValueError("Unknown info source: '" + str(info_source) + "'")
+		t = _stringToInfoType(info_type)
+		if t is None:
+			raise ValueError("Unknown info type: '" + str(info_type) + "'")
+		if not _isEMSHandleValid(self._cpc_handle):
+			raise CanOperationError(message=_cpcErrToStr(error_code=self._cpc_handle), error_code=self._cpc_handle)
+		if s == CPC_INFOMSG_T_LIBRARY:
+			future = Future()
+			if self.cpc_request_info(info_source=info_source, info_type=info_type):
+				future.set_result(self.cpc_read_info(info_source=info_source, info_type=info_type))
+			else:
+				future.set_exception(CanOperationError(message="Failed to get library info: '" + info_type + "'", error_code=CPC_ERR_UNKNOWN))
+			return future
+		return self.__request_info(s, t)
+
+	# Request info and wait for the answer. Messages received while waiting are kept for recv().
+	# If another thread is receiving (e.g. a can.Notifier) then use cpc_request_info_async() instead.
+	def cpc_wait_info(self, info_source : str, info_type : str, timeout : float = 1.0) -> "str | None":
+		future = self.cpc_request_info_async(info_source=info_source, info_type=info_type)
+		if not self._cpc_wait_futures(futures=[future], timeout=timeout):
+			return None
+		return future.result()
+
+	def __request_info(self, info_source : int, info_type : int) -> Future:
+		future = self._info_requests.add(info_source, info_type)
+		result = CPC_RequestInfo(self._cpc_handle, 0, info_source, info_type)
+		if result < 0:
+			future.set_exception(CanOperationError(message=_cpcErrToStr(error_code=result), error_code=result))
+		return future
+
+	# Serial number from the JSON channel description (if any)
+	def __channel_serial(self) -> "str | None":
+		if isinstance(self.channel, dict):
+			for description in self.channel.values():
+				if isinstance(description, dict) and ("SerialNumber" in description):
+					return str(description["SerialNumber"])
+		return None
+
 	# Read requested info
 	def cpc_read_info(self, info_source : str, info_type : str) -> "str | None":
 		if info_source in self._infomsg:
@@ -0,0 +1,33 @@
+"""
+Fixtures for the tests without a device
+"""
+
+import pytest
+
+@pytest.fixture
+def offline_bus(monkeypatch):
+	"""Factory of EMSWuenscheBus instances that are not connected to a device. The bring-up
+	stages are skipped, the tests patch the library functions they use (wuensche.CPC_*)."""
+	try:
+		from can_wuensche import wuensche
+	except Exception as e: # The library (libcpc.so / cpcwin.dll) is not installed
+		pytest.skip("can_wuensche not available: " + str(e))
+	def stage_open(self, channel):
+		self._cpc_handle = 0
+		self.channel = channel
+		self.channel_info = channel
+		return channel
+	monkeypatch.setattr(wuensche.EMSWuenscheBus, "_EMSWuenscheBus__stage_open", stage_open)
+	monkeypatch.setattr(wuensche.EMSWuenscheBus, "_EMSWuenscheBus__stage_request_infos", lambda self, **kwargs: None)
+	monkeypatch.setattr(wuensche.EMSWuenscheBus, "_EMSWuenscheBus__stage_init", lambda self, **kwargs: None)
+	monkeypatch.setattr(wuensche.EMSWuenscheBus, "_EMSWuenscheBus__enable_controls", lambda self: None)
+	monkeypatch.setattr(wuensche, "CPC_CloseChannel", lambda handle: 0)
+	buses = []
+	def create(**kwargs):
+		kwargs.setdefault("capability_cache", False)
+		bus = wuensche.EMSWuenscheBus(channel="OFFLINE", **kwargs)
+		buses.append(bus)
+		return bus
+	yield create
+	for bus in buses:
+		bus.shutdown()
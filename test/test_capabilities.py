@@ -0,0 +1,63 @@
+"""
+Persistent cache of the controller capabilities
+"""
+
+import pytest
+
+try:
+	from can_wuensche.capabilities import _CapabilityCache, _open_capability_cache
+except Exception as e: # The library (libcpc.so / cpcwin.dll) is not installed
+	pytest.skip("can_wuensche not available: " + str(e), allow_module_level=True)
+
+def _store(cache, serial="1234", firmware="1.0", controller=7, library="5.0"):
+	cache.store(key="serial:1234", library=library, serial=serial, firmware=firmware, controller=controller, canfd="1", can_clk=80_000_000)
+
+def test_roundtrip(tmp_path):
+	path = str(tmp_path / "capabilities.json")
+	_store(_CapabilityCache(path=path))
+	entry = _CapabilityCache(path=path).lookup(key="serial:1234", library="5.0")
+	assert entry["controller"] == 7
+	assert entry["can_clk"] == 80_000_000
+	assert _CapabilityCache(path=path).lookup(key="channel:CHAN00", library="5.0") is None
+
+def test_library_change_drops_the_entry(tmp_path):
+	cache = _CapabilityCache(path=str(tmp_path / "capabilities.json"))
+	_store(cache)
+	assert cache.lookup(key="serial:1234", library="6.0") is None
+	assert cache.lookup(key="serial:1234", library="5.0") is None
+
+def test_identity_is_kept_until_the_infos_arrive(tmp_path):
+	cache = _CapabilityCache(path=str(tmp_path / "capabilities.json"))
+	_store(cache)
+	_store(cache, serial=None, firmware=None)
+	entry = cache.lookup(key="serial:1234", library="5.0")
+	assert (entry["serial"], entry["firmware"]) == ("1234", "1.0")
+
+def test_firmware_change_drops_the_entry(tmp_path):
+	cache = _CapabilityCache(path=str(tmp_path / "capabilities.json"))
+	_store(cache)
+	# The cached controller was accepted by the updated firmware: it must not be recorded again
+	_store(cache, firmware="2.0")
+	assert cache.lookup(key="serial:1234", library="5.0") is None
+	# The next open probes again and records the result
+	_store(cache, firmware="2.0", controller=1)
+	assert cache.lookup(key="serial:1234", library="5.0")["controller"] == 1
+
+def test_unchanged_entry_is_not_written(tmp_path):
+	path = tmp_path / "capabilities.json"
+	cache = _CapabilityCache(path=str(path))
+	_store(cache)
+	path.unlink()
+	_store(cache)
+	assert not path.exists()
+
+def test_opt_in(tmp_path, monkeypatch):
+	monkeypatch.delenv("CAN_WUENSCHE_CAPABILITY_CACHE", raising=False)
+	monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path))
+	assert _open_capability_cache(setting=None) is None
+	assert _open_capability_cache(setting=False) is None
+	assert _open_capability_cache(setting=True).path == str(tmp_path / "can_wuensche" / "capabilities.json")
+	assert _open_capability_cache(setting=str(tmp_path / "other.json")).path == str(tmp_path / "other.json")
+	monkeypatch.setenv("CAN_WUENSCHE_CAPABILITY_CACHE", str(tmp_path / "env.json"))
+	assert _open_capability_cache(setting=None).path == str(tmp_path / "env.json")
+	assert _open_capability_cache(setting=False) is None
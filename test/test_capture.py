@@ -0,0 +1,86 @@
+"""
+Compact binary capture of raw frames
+"""
+
+import pytest
+
+try:
+	from can_wuensche.capture import EMSWuenscheCaptureWriter, EMSWuenscheCaptureReader
+	from can_wuensche.constants import CPC_MSG_T_CAN, CPC_MSG_T_XCAN, CPC_MSG_T_CANFD, CPC_FDFLAG_BRS
+	from can_wuensche.structures import CPC_MSG_T
+except Exception as e: # The library (libcpc.so / cpcwin.dll) is not installed
+	pytest.skip("can_wuensche not available: " + str(e), allow_module_level=True)
+
+def _record(msg_type : int, arbitration_id : int, data : bytes = b"", timestamp : float = 0.0, fdflags : int = 0) -> bytes:
+	record = CPC_MSG_T()
+	record.type = msg_type
+	record.ts_sec = int(timestamp)
+	record.ts_nsec = round((timestamp - int(timestamp)) * 1_000_000_000)
+	if msg_type == CPC_MSG_T_CANFD:
+		record.msg.canfdmsg.id = arbitration_id
+		record.msg.canfdmsg.flags = fdflags
+		record.msg.canfdmsg.length = len(data)
+		record.msg.canfdmsg.msg[:len(data)] = data
+	else:
+		record.msg.canmsg.id = arbitration_id
+		record.msg.canmsg.length = len(data)
+		record.msg.canmsg.msg[:len(data)] = data
+	return bytes(record)
+
+def test_round_trip(tmp_path):
+	path = str(tmp_path / "capture.bin")
+	records = [
+		_record(CPC_MSG_T_CAN, 0x123, b"\x01\x02", timestamp=1.5),
+		_record(CPC_MSG_T_XCAN, 0x1ABCDE, b"", timestamp=2.0),
+		_record(CPC_MSG_T_CANFD, 0x7FF, bytes(range(12)), timestamp=2.25, fdflags=CPC_FDFLAG_BRS),
+	]
+	with EMSWuenscheCaptureWriter(path, channel_info="USB-CANmodul") as writer:
+		writer.write_raw(records)
+	reader = EMSWuenscheCaptureReader(path)
+	assert reader.channel_info == "USB-CANmodul"
+	# Only the length in the record header differs (used part of the union)
+	assert [record[:1] + record[3:] for record in reader.records()] == [record[:1] + record[3:] for record in records]
+	messages = list(reader)
+	assert [msg.arbitration_id for msg in messages] == [0x123, 0x1ABCDE, 0x7FF]
+	assert [msg.is_extended_id for msg in messages] == [False, True, False]
+	assert bytes(messages[0].data) == b"\x01\x02"
+	assert messages[2].is_fd and messages[2].bitrate_switch
+	assert bytes(messages[2].data) == bytes(range(12))
+	assert messages[1].timestamp == pytest.approx(2.0)
+	assert all(msg.channel == "USB-CANmodul" for msg in messages)
+
+def test_index_and_seek(tmp_path):
+	path = str(tmp_path / "capture.bin")
+	with EMSWuenscheCaptureWriter(path, index_interval=10, buffer_size=4096) as writer:
+		writer.write_raw([_record(CPC_MSG_T_CAN, n, bytes((n,)), timestamp=float(n)) for n in range(100)])
+	reader = EMSWuenscheCaptureReader(path)
+	index = reader.index()
+	# close() adds a last index block
+	assert [count for _, count, _ in index] == list(range(10, 101, 10)) + [100]
+	assert [timestamp for _, _, timestamp in index] == [float(n) for n in range(9, 100, 10)] + [99.0]
+	assert [msg.arbitration_id for msg in reader.messages(start=42.0)] == list(range(42, 100))
+	assert sum(1 for _ in reader.records(start=42.0)) <= 60
+
+def test_unclosed_capture(tmp_path):
+	path = str(tmp_path / "capture.bin")
+	writer = EMSWuenscheCaptureWriter(path, index_interval=10)
+	writer.write_raw([_record(CPC_MSG_T_CAN, n, timestamp=float(n)) for n in range(25)])
+	writer.flush()
+	reader = EMSWuenscheCaptureReader(path)
+	# Without the trailer there is no index, but the records can be read
+	assert reader.index() == []
+	assert [msg.arbitration_id for msg in reader] == list(range(25))
+	writer.close()
+
+def test_not_a_capture(tmp_path):
+	path = tmp_path / "capture.bin"
+	path.write_bytes(b"\0" * 128)
+	with pytest.raises(ValueError):
+		EMSWuenscheCaptureReader(str(path))
+
+def test_export(tmp_path):
+	path = str(tmp_path / "capture.bin")
+	with EMSWuenscheCaptureWriter(path) as writer:
+		writer.write_raw([_record(CPC_MSG_T_CAN, n, bytes((n,)), timestamp=float(n)) for n in range(5)])
+	assert EMSWuenscheCaptureReader(path).export(str(tmp_path / "capture.asc")) == 5
+	assert (tmp_path / "capture.asc").stat().st_size > 0
@@ -0,0 +1,74 @@
+"""
+Change-only receive mode
+"""
+
+import pytest
+
+try:
+	from can_wuensche.changes import _ChangeFilter
+	from can_wuensche.constants import CPC_MSG_T_CAN, CPC_MSG_T_XCAN, CPC_MSG_T_RTR, CPC_MSG_T_CANFD, CPC_MSG_T_CANERROR, CPC_FDFLAG_RTR
+	from can_wuensche.structures import CPC_MSG_T
+except Exception as e: # The library (libcpc.so / cpcwin.dll) is not installed
+	pytest.skip("can_wuensche not available: " + str(e), allow_module_level=True)
+
+def _record(msg_type : int, arbitration_id : int, data : bytes = b"", timestamp : float = 0.0, fdflags : int = 0, dlc : "int | None" = None) -> bytes:
+	record = CPC_MSG_T()
+	record.type = msg_type
+	record.ts_sec = int(timestamp)
+	record.ts_nsec = round((timestamp - int(timestamp)) * 1_000_000_000)
+	if msg_type == CPC_MSG_T_CANFD:
+		record.msg.canfdmsg.id = arbitration_id
+		record.msg.canfdmsg.flags = fdflags
+		record.msg.canfdmsg.length = len(data) if dlc is None else dlc
+		record.msg.canfdmsg.msg[:len(data)] = data
+	else:
+		record.msg.canmsg.id = arbitration_id
+		record.msg.canmsg.length = len(data) if dlc is None else dlc
+		record.msg.canmsg.msg[:len(data)] = data
+	return bytes(record)
+
+def _filter(window : "float | None" = None) -> _ChangeFilter:
+	summaries = []
+	change_filter = _ChangeFilter(window=window, summary_interval=3600.0, on_summary=summaries.append)
+	return change_filter
+
+def test_unchanged_frames_are_suppressed():
+	change_filter = _filter()
+	records = [
+		_record(CPC_MSG_T_CAN, 0x100, b"\x01"),
+		_record(CPC_MSG_T_CAN, 0x100, b"\x01"),
+		_record(CPC_MSG_T_CAN, 0x100, b"\x02"),
+		_record(CPC_MSG_T_CAN, 0x100, b"\x02\x00"),
+		_record(CPC_MSG_T_XCAN, 0x100, b"\x02\x00"),
+		_record(CPC_MSG_T_CAN, 0x101, b"\x02\x00"),
+	]
+	assert change_filter.filter(records) == [records[0]] + records[2:]
+	summary = change_filter.summary()
+	assert (summary.passed, summary.suppressed) == (5, 1)
+	assert summary.suppressed_by_id == {(0x100, False): 1}
+
+def test_window_passes_unchanged_frames_again():
+	change_filter = _filter(window=1.0)
+	records = [_record(CPC_MSG_T_CAN, 0x100, b"\x01", timestamp=t) for t in (0.0, 0.5, 1.0, 1.5, 2.5)]
+	assert change_filter.filter(records) == [records[0], records[2], records[4]]
+
+def test_remote_frames_ignore_stale_data():
+	change_filter = _filter()
+	assert change_filter.match(_record(CPC_MSG_T_RTR, 0x100, b"\x01", dlc=1))
+	assert not change_filter.match(_record(CPC_MSG_T_RTR, 0x100, b"\x02", dlc=1))
+	assert change_filter.match(_record(CPC_MSG_T_RTR, 0x100, dlc=2))
+	assert change_filter.match(_record(CPC_MSG_T_CANFD, 0x100, b"\x01", fdflags=CPC_FDFLAG_RTR))
+	assert not change_filter.match(_record(CPC_MSG_T_CANFD, 0x100, b"\x02", fdflags=CPC_FDFLAG_RTR))
+
+def test_error_frames_pass():
+	change_filter = _filter()
+	record = _record(CPC_MSG_T_CANERROR, 0)
+	assert change_filter.match(record)
+	assert change_filter.match(record)
+
+def test_summary_interval():
+	summaries = []
+	change_filter = _ChangeFilter(window=None, summary_interval=0.0, on_summary=summaries.append)
+	change_filter.filter([_record(CPC_MSG_T_CAN, 0x100, b"\x01")] * 3)
+	assert len(summaries) == 1
+	assert (summaries[0].passed, summaries[0].suppressed) == (1, 2)
@@ -0,0 +1,71 @@
+"""
+Columnar batches of received frames
+"""
+
+import pytest
+
+numpy = pytest.importorskip("numpy")
+
+try:
+	from can_wuensche.columns import _records_to_columns, _columns_to_arrow, COLUMNS
+	from can_wuensche.constants import CPC_MSG_T_CAN, CPC_MSG_T_XCAN, CPC_MSG_T_XRTR, CPC_MSG_T_CANFD, CPC_MSG_T_CANERROR
+	from can_wuensche.constants import CPC_FDFLAG_XTD, CPC_FDFLAG_BRS, CPC_FDFLAG_ESI, CPC_FDFLAG_NONCANFD_MSG
+	from can_wuensche.structures import CPC_MSG_T
+except Exception as e: # The library (libcpc.so / cpcwin.dll) is not installed
+	pytest.skip("can_wuensche not available: " + str(e), allow_module_level=True)
+
+def _record(msg_type : int, arbitration_id : int, data : bytes = b"", timestamp : float = 0.0, fdflags : int = 0, dlc : "int | None" = None) -> bytes:
+	record = CPC_MSG_T()
+	record.type = msg_type
+	record.ts_sec = int(timestamp)
+	record.ts_nsec = round((timestamp - int(timestamp)) * 1_000_000_000)
+	if msg_type == CPC_MSG_T_CANFD:
+		record.msg.canfdmsg.id = arbitration_id
+		record.msg.canfdmsg.flags = fdflags
+		record.msg.canfdmsg.length = len(data) if dlc is None else dlc
+		record.msg.canfdmsg.msg[:len(data)] = data
+	else:
+		record.msg.canmsg.id = arbitration_id
+		record.msg.canmsg.length = len(data) if dlc is None else dlc
+		record.msg.canmsg.msg[:len(data)] = data
+	return bytes(record)
+
+def _buffer() -> bytes:
+	return b"".join((
+		_record(CPC_MSG_T_CAN, 0x123, b"\x01\x02\x03\xFF", timestamp=1.25, dlc=3),
+		_record(CPC_MSG_T_CANERROR, 0),
+		_record(CPC_MSG_T_XRTR, 0x1ABCDE, b"\x55" * 8, timestamp=1.5, dlc=8),
+		_record(CPC_MSG_T_CANFD, 0x1234567, bytes(range(16)), timestamp=2.0, fdflags=CPC_FDFLAG_XTD | CPC_FDFLAG_BRS | CPC_FDFLAG_ESI),
+		_record(CPC_MSG_T_CANFD, 0x7FF, b"\x09", timestamp=2.5, fdflags=CPC_FDFLAG_NONCANFD_MSG),
+	))
+
+def test_records_to_columns():
+	columns = _records_to_columns(_buffer())
+	assert list(columns["arbitration_id"]) == [0x123, 0x1ABCDE, 0x1234567, 0x7FF]
+	assert list(columns["timestamp"]) == pytest.approx([1.25, 1.5, 2.0, 2.5])
+	assert list(columns["is_extended_id"]) == [False, True, True, False]
+	assert list(columns["is_remote_frame"]) == [False, True, False, False]
+	assert list(columns["is_fd"]) == [False, False, True, False]
+	assert list(columns["bitrate_switch"]) == [False, False, True, False]
+	assert list(columns["error_state_indicator"]) == [False, False, True, False]
+	assert list(columns["dlc"]) == [3, 8, 16, 1]
+	data = columns["data"]
+	assert data.shape == (4, 64)
+	# Bytes beyond the length and the data of remote frames are cleared
+	assert bytes(data[0]) == b"\x01\x02\x03".ljust(64, b"\0")
+	assert not data[1].any()
+	assert bytes(data[2]) == bytes(range(16)).ljust(64, b"\0")
+	assert bytes(data[3]) == b"\x09".ljust(64, b"\0")
+
+def test_payload_size():
+	columns = _records_to_columns(_buffer(), payload_size=8)
+	assert columns["data"].shape == (4, 8)
+	assert bytes(columns["data"][2]) == bytes(range(8))
+
+def test_arrow():
+	pytest.importorskip("pyarrow")
+	batch = _columns_to_arrow(_records_to_columns(_buffer(), payload_size=8))
+	assert batch.schema.names == list(COLUMNS)
+	assert batch.num_rows == 4
+	assert batch.column("arbitration_id").to_pylist() == [0x123, 0x1ABCDE, 0x1234567, 0x7FF]
+	assert batch.column("data").to_pylist()[0] == b"\x01\x02\x03".ljust(8, b"\0")
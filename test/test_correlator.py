@@ -0,0 +1,66 @@
+"""
+Correlation of requests and responses in the receive loop
+"""
+
+import pytest
+
+try:
+	from can_wuensche.correlator import _Correlator
+	from can_wuensche.constants import CPC_MSG_T_CAN, CPC_MSG_T_XCAN, CPC_MSG_T_CANERROR
+	from can_wuensche.structures import CPC_MSG_T
+except Exception as e: # The library (libcpc.so / cpcwin.dll) is not installed
+	pytest.skip("can_wuensche not available: " + str(e), allow_module_level=True)
+
+def _record(msg_type : int, arbitration_id : int, data : bytes = b"") -> bytes:
+	record = CPC_MSG_T()
+	record.type = msg_type
+	record.msg.canmsg.id = arbitration_id
+	record.msg.canmsg.length = len(data)
+	record.msg.canmsg.msg[:len(data)] = data
+	return bytes(record)
+
+def test_exact_match_is_consumed():
+	correlator = _Correlator()
+	future = correlator.add(0x7E8, 0x1FFFFFFF, False)
+	assert len(correlator) == 1
+	records = [
+		_record(CPC_MSG_T_XCAN, 0x7E8, b"\x00"),
+		_record(CPC_MSG_T_CAN, 0x7E0, b"\x01"),
+		_record(CPC_MSG_T_CAN, 0x7E8, b"\x02"),
+		_record(CPC_MSG_T_CAN, 0x7E8, b"\x03"),
+	]
+	assert correlator.filter(records) == records[:2] + records[3:]
+	assert future.done()
+	assert bytes(future.result().data) == b"\x02"
+	assert len(correlator) == 0
+
+def test_requests_for_the_same_id_complete_in_order():
+	correlator = _Correlator()
+	first = correlator.add(0x100, 0x1FFFFFFF, False)
+	second = correlator.add(0x100, 0x1FFFFFFF, False)
+	correlator.filter([_record(CPC_MSG_T_CAN, 0x100, b"\x01"), _record(CPC_MSG_T_CAN, 0x100, b"\x02")])
+	assert bytes(first.result().data) == b"\x01"
+	assert bytes(second.result().data) == b"\x02"
+
+def test_masked_match():
+	correlator = _Correlator()
+	future = correlator.add(0x18DAF100, 0x1FFFFF00, True)
+	assert correlator.match(_record(CPC_MSG_T_CAN, 0x18DAF110))
+	assert not correlator.match(_record(CPC_MSG_T_XCAN, 0x18DAF110))
+	assert future.result().arbitration_id == 0x18DAF110
+
+def test_error_frames_pass():
+	correlator = _Correlator()
+	future = correlator.add(0, 0, True)
+	assert correlator.match(_record(CPC_MSG_T_CANERROR, 0))
+	assert not future.done()
+
+def test_cancel_drops_the_request():
+	correlator = _Correlator()
+	exact = correlator.add(0x100, 0x1FFFFFFF, False)
+	masked = correlator.add(0x200, 0x700, False)
+	assert exact.cancel() and masked.cancel()
+	assert len(correlator) == 0
+	assert correlator.match(_record(CPC_MSG_T_CAN, 0x100))
+	assert correlator.match(_record(CPC_MSG_T_CAN, 0x200))
+	assert (correlator._exact, correlator._masked) == ({}, [])
@@ -0,0 +1,72 @@
+"""
+Decoding and statistics of CAN error frames
+"""
+
+import pytest
+
+try:
+	from can import Message
+	from can_wuensche.errors import _decode_sja1000, _decode_lpc546xx, decode_error_frame, EMSWuenscheErrorAnalytics
+	from can_wuensche.constants import CPC_MSG_T_CAN, CPC_MSG_T_CANERROR, CPC_CAN_ECODE_ERRFRAME, SJA1000, LPC546XX
+	from can_wuensche.structures import CPC_MSG_T
+except Exception as e: # The library (libcpc.so / cpcwin.dll) is not installed
+	pytest.skip("can_wuensche not available: " + str(e), allow_module_level=True)
+
+def _error_record(cc : int, regs : bytes) -> bytes:
+	record = bytearray(bytes(CPC_MSG_T()))
+	record[0] = CPC_MSG_T_CANERROR
+	record[11] = CPC_CAN_ECODE_ERRFRAME
+	record[12] = cc
+	record[13:13 + len(regs)] = regs
+	return bytes(record)
+
+def test_sja1000():
+	# Missing acknowledge: other error in the ACK slot while transmitting
+	event = _decode_sja1000(1.0, 0xC0 | 0x19, 0, 8)
+	assert (event.error_type, event.direction, event.segment) == ("ack", "tx", "ack slot")
+	assert (event.error_warning, event.error_passive, event.tx_errors) == (False, False, 8)
+	# A form error in the ACK delimiter keeps its type
+	event = _decode_sja1000(1.0, 0x40 | 0x20 | 0x1B, 100, 0)
+	assert (event.error_type, event.direction, event.segment) == ("form", "rx", "ack delimiter")
+	assert (event.error_warning, event.error_passive) == (True, False)
+	assert _decode_sja1000(1.0, 0x00 | 0x08, 128, 0).error_passive
+
+def test_lpc546xx():
+	# Stuff error in the arbitration phase while receiving, error passive
+	event = _decode_lpc546xx(1.0, 0x1 | (2 << 3) | 0x20 | (7 << 8), (5 << 8) | 130)
+	assert (event.error_type, event.segment, event.direction, event.activity) == ("stuff", "arbitration", "rx", "receiver")
+	assert (event.error_passive, event.bus_off, event.rx_errors, event.tx_errors) == (True, False, 5, 130)
+	assert event.data_error_type is None
+	# CRC error in the data phase only
+	event = _decode_lpc546xx(1.0, 0x7 | (3 << 3) | (6 << 8) | 0x80, 0)
+	assert (event.error_type, event.segment, event.data_error_type, event.direction) == ("crc", "data", "crc", "tx")
+	assert event.bus_off
+
+def test_decode_error_frame():
+	assert decode_error_frame(Message(arbitration_id=0x100)) is None
+	msg = Message(is_error_frame=True, timestamp=2.0, data=bytes((0xC0 | 0x19, 1, 2)))
+	event = decode_error_frame(msg)
+	assert (event.controller, event.error_type, event.rx_errors, event.tx_errors) == ("SJA1000", "ack", 1, 2)
+	msg = Message(is_error_frame=True, data=(0x3 | (1 << 3)).to_bytes(4, "little") + bytes(4))
+	assert decode_error_frame(msg).controller == "LPC546XX"
+	assert decode_error_frame(Message(is_error_frame=True, data=b"\x01")) is None
+
+def test_analytics():
+	analytics = EMSWuenscheErrorAnalytics(window=60.0, slots=6, keep_events=2)
+	records = [
+		_error_record(SJA1000, bytes((0xC0 | 0x19, 0, 8))),
+		_error_record(SJA1000, bytes((0xC0 | 0x19, 0, 16))),
+		_error_record(LPC546XX, (0x1 | (2 << 3)).to_bytes(4, "little") + bytes(4)),
+		bytes(CPC_MSG_T()),
+	]
+	assert analytics.filter(records) == records
+	assert analytics.total == 3
+	assert analytics.histogram() == {("ack", "ack slot"): 2, ("stuff", "arbitration"): 1}
+	assert analytics.by_type() == {"ack": 2, "stuff": 1}
+	assert analytics.totals() == analytics.histogram()
+	assert analytics.rate() == pytest.approx(3 / 60.0)
+	assert [event.controller for event in analytics.last_events] == ["SJA1000", "LPC546XX"]
+
+def test_analytics_parameters():
+	with pytest.raises(ValueError):
+		EMSWuenscheErrorAnalytics(window=0)
@@ -0,0 +1,91 @@
+"""
+Shared-memory fan-out of a channel
+"""
+
+import logging
+import secrets
+import threading
+import time
+
+import pytest
+import can
+
+try:
+	from can_wuensche.fanout import EMSWuenscheFanoutServer, EMSWuenscheFanoutBus
+	from can_wuensche.constants import CPC_MSG_T_CAN
+	from can_wuensche.structures import CPC_MSG_T
+except Exception as e: # The library (libcpc.so / cpcwin.dll) is not installed
+	pytest.skip("can_wuensche not available: " + str(e), allow_module_level=True)
+
+def _record(arbitration_id : int) -> bytes:
+	record = CPC_MSG_T()
+	record.type = CPC_MSG_T_CAN
+	record.length = 5
+	record.msg.canmsg.id = arbitration_id
+	record.msg.canmsg.length = 1
+	return bytes(record)
+
+# Delivers queued raw records through _recv_raw() (see EMSWuenscheBus._recv_raw)
+class _Bus:
+	def __init__(self):
+		self._records = []
+		self._lock = threading.Lock()
+		self._is_shutdown = False
+		self._cpc_handle = 0
+		self.calls = 0
+
+	def put(self, records : list) -> None:
+		with self._lock:
+			self._records.extend(records)
+
+	def _recv_raw(self, timeout, max_count : int = 1024):
+		self.calls += 1
+		if self._is_shutdown:
+			raise can.CanOperationError("Bus is shut down")
+		with self._lock:
+			records, self._records = self._records[:max_count], self._records[max_count:]
+		if not records:
+			time.sleep(min(timeout, 0.01))
+		return records
+
+def _wait(condition, timeout : float = 2.0) -> bool:
+	end = time.monotonic() + timeout
+	while not condition():
+		if time.monotonic() >= end:
+			return False
+		time.sleep(0.01)
+	return True
+
+@pytest.fixture
+def server():
+	server = EMSWuenscheFanoutServer(_Bus(), name="test_" + secrets.token_hex(4), capacity=8)
+	yield server
+	server.shutdown()
+
+def test_clients_see_all_frames(server):
+	clients = [EMSWuenscheFanoutBus(channel=server.name) for _ in range(2)]
+	try:
+		server.bus.put([_record(0x100 + i) for i in range(5)])
+		for client in clients:
+			assert [client.recv(timeout=1.0).arbitration_id for _ in range(5)] == [0x100 + i for i in range(5)]
+			assert client.recv(timeout=0) is None
+	finally:
+		for client in clients:
+			client.shutdown()
+
+def test_lapped_reader_counts_lost_frames(server):
+	client = EMSWuenscheFanoutBus(channel=server.name)
+	try:
+		server.bus.put([_record(0x100 + i) for i in range(12)])
+		assert _wait(lambda: server.rx_count == 12)
+		assert client.recv(timeout=1.0).arbitration_id == 0x104
+		assert client.lost_count == 4
+	finally:
+		client.shutdown()
+
+def test_drain_stops_when_the_bus_is_shut_down(server, caplog):
+	with caplog.at_level(logging.WARNING, logger="can.can_wuensche"):
+		server.bus._is_shutdown = True
+		assert _wait(lambda: not server._drain_thread.is_alive())
+	records = [record for record in caplog.records if record.name == "can.can_wuensche"]
+	assert len(records) == 1
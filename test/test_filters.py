@@ -0,0 +1,87 @@
+"""
+Receive filter engine
+"""
+
+import pytest
+import can
+
+try:
+	from can_wuensche.filters import _FilterEngine
+	from can_wuensche.constants import CPC_MSG_T_CAN, CPC_MSG_T_XCAN, CPC_MSG_T_RTR, CPC_MSG_T_CANFD, CPC_MSG_T_CANERROR, CPC_FDFLAG_XTD, CPC_FDFLAG_RTR
+	from can_wuensche.structures import CPC_MSG_T
+	from can_wuensche.message import _cpc_msg_to_message
+except Exception as e: # The library (libcpc.so / cpcwin.dll) is not installed
+	pytest.skip("can_wuensche not available: " + str(e), allow_module_level=True)
+
+def _record(msg_type : int, arbitration_id : int = 0, data : bytes = b"", fdflags : int = 0, dlc : "int | None" = None) -> bytes:
+	record = CPC_MSG_T()
+	record.type = msg_type
+	if msg_type == CPC_MSG_T_CANFD:
+		record.msg.canfdmsg.id = arbitration_id
+		record.msg.canfdmsg.flags = fdflags
+		record.msg.canfdmsg.length = len(data) if dlc is None else dlc
+		record.msg.canfdmsg.msg[:len(data)] = data
+	elif msg_type != CPC_MSG_T_CANERROR:
+		record.length = 5 + len(data)
+		record.msg.canmsg.id = arbitration_id
+		record.msg.canmsg.length = len(data) if dlc is None else dlc
+		record.msg.canmsg.msg[:len(data)] = data
+	return bytes(record)
+
+# python-can's filter semantics for a message (see BusABC._matches_filters)
+def _python_can_match(msg : can.Message, can_filters) -> bool:
+	for _filter in can_filters:
+		if ("extended" in _filter) and (_filter["extended"] != msg.is_extended_id):
+			continue
+		if (msg.arbitration_id ^ _filter["can_id"]) & _filter["can_mask"] == 0:
+			return True
+	return False
+
+FILTERS = [
+	{"can_id": 0x100, "can_mask": 0x7F0, "extended": False},
+	{"can_id": 0x18DAF100, "can_mask": 0x1FFFFF00, "extended": True},
+	{"can_id": 0x7E8, "can_mask": 0x7FF},
+	{"can_id": 0x0, "can_mask": 0x1FFFFFFF, "extended": True},
+]
+
+RECORDS = [
+	_record(CPC_MSG_T_CAN, 0x100),
+	_record(CPC_MSG_T_CAN, 0x10F),
+	_record(CPC_MSG_T_CAN, 0x110),
+	_record(CPC_MSG_T_CAN, 0x7E8),
+	_record(CPC_MSG_T_XCAN, 0x7E8),
+	_record(CPC_MSG_T_XCAN, 0x18DAF1AA),
+	_record(CPC_MSG_T_XCAN, 0x18DAF2AA),
+	_record(CPC_MSG_T_XCAN, 0x0),
+	_record(CPC_MSG_T_RTR, 0x105),
+	_record(CPC_MSG_T_CANFD, 0x101, data=bytes(12)),
+	_record(CPC_MSG_T_CANFD, 0x18DAF101, data=bytes(12), fdflags=CPC_FDFLAG_XTD),
+	_record(CPC_MSG_T_CANERROR),
+]
+
+@pytest.mark.parametrize("filters", [FILTERS, FILTERS[:3], [FILTERS[2]], [{"can_id": 0, "can_mask": 0}]])
+def test_same_result_as_python_can(filters):
+	engine = _FilterEngine(can_filters=filters)
+	for record in RECORDS:
+		msg = _cpc_msg_to_message(CPC_MSG_T.from_buffer_copy(record))
+		assert engine.match(record) == _python_can_match(msg, filters), msg
+
+def test_hits_count_the_first_matching_filter():
+	engine = _FilterEngine(can_filters=[{"can_id": 0x100, "can_mask": 0x700}, {"can_id": 0x123, "can_mask": 0x7FF}])
+	assert engine.filter([_record(CPC_MSG_T_CAN, 0x123), _record(CPC_MSG_T_CAN, 0x200)]) == [_record(CPC_MSG_T_CAN, 0x123)]
+	assert engine.hits == [1, 0]
+	assert engine.rejected == 1
+
+def test_data_predicate():
+	engine = _FilterEngine(can_filters=[{"can_id": 0x7E8, "can_mask": 0x7FF, "data": b"\x02\x50", "data_mask": b"\x0f\xff"}])
+	assert engine.match(_record(CPC_MSG_T_CAN, 0x7E8, data=b"\x12\x50\x01"))
+	assert not engine.match(_record(CPC_MSG_T_CAN, 0x7E8, data=b"\x02\x51"))
+	assert not engine.match(_record(CPC_MSG_T_CAN, 0x7E8, data=b"\x02"))
+	assert engine.match(_record(CPC_MSG_T_CANFD, 0x7E8, data=b"\x02\x50" + bytes(10)))
+
+def test_remote_frames_skip_the_data_predicate():
+	engine = _FilterEngine(can_filters=[{"can_id": 0x7E8, "can_mask": 0x7FF, "data": b"\x02\x50"}])
+	# The stale data bytes of a remote frame must not decide
+	assert engine.match(_record(CPC_MSG_T_RTR, 0x7E8, data=b"\x00\x00", dlc=2))
+	assert engine.match(_record(CPC_MSG_T_CANFD, 0x7E8, data=b"\x00\x00", fdflags=CPC_FDFLAG_RTR))
+	assert not engine.match(_record(CPC_MSG_T_RTR, 0x7E9, dlc=2))
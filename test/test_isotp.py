@@ -0,0 +1,123 @@
+"""
+ISO-TP transport
+"""
+
+import pytest
+
+try:
+	from can import CanOperationError, CanTimeoutError
+	from can_wuensche.isotp import EMSWuenscheIsoTp
+	from can_wuensche.constants import CPC_MSG_T_CAN, CPC_MSG_T_CANFD
+	from can_wuensche.structures import CPC_MSG_T
+except Exception as e: # The library (libcpc.so / cpcwin.dll) is not installed
+	pytest.skip("can_wuensche not available: " + str(e), allow_module_level=True)
+
+class _Bus:
+	# The parts of EMSWuenscheBus used by the transport. Frames of the other side are queued in
+	# incoming and handed to the receive stages when the transport waits.
+	def __init__(self):
+		self.stages   = []
+		self.sent     = []
+		self.incoming = []
+		self.on_send  = None
+
+	def _cpc_add_rx_stage(self, stage) -> None:
+		self.stages.append(stage)
+
+	def _cpc_remove_rx_stage(self, stage) -> None:
+		self.stages.remove(stage)
+
+	def _cpc_send_batch(self, marshalled : list, timeout : "float | None" = None, abort = None) -> int:
+		for _, canmsg in marshalled:
+			frame = bytes(canmsg.msg[:canmsg.length])
+			self.sent.append(frame)
+			if self.on_send is not None:
+				self.on_send(frame)
+		return len(marshalled)
+
+	def _cpc_wait_futures(self, futures : list, timeout : "float | None" = None) -> bool:
+		while self.incoming and not all(future.done() for future in futures):
+			record = self.incoming.pop(0)
+			for stage in self.stages:
+				stage.match(record)
+		return all(future.done() for future in futures)
+
+def _record(arbitration_id : int, data : bytes, fd : bool = False) -> bytes:
+	record = CPC_MSG_T()
+	if fd:
+		record.type = CPC_MSG_T_CANFD
+		record.msg.canfdmsg.id = arbitration_id
+		record.msg.canfdmsg.length = len(data)
+		record.msg.canfdmsg.msg[:len(data)] = data
+	else:
+		record.type = CPC_MSG_T_CAN
+		record.msg.canmsg.id = arbitration_id
+		record.msg.canmsg.length = len(data)
+		record.msg.canmsg.msg[:len(data)] = data
+	return bytes(record)
+
+def test_single_frame():
+	bus = _Bus()
+	with EMSWuenscheIsoTp(bus, tx_id=0x7E0, rx_id=0x7E8) as isotp:
+		isotp.send(b"\x3E\x00")
+	assert bus.sent == [b"\x02\x3E\x00\xCC\xCC\xCC\xCC\xCC"]
+	assert bus.stages == []
+
+def test_segmented_send():
+	bus = _Bus()
+	isotp = EMSWuenscheIsoTp(bus, tx_id=0x7E0, rx_id=0x7E8, padding=None)
+	payload = bytes(range(20))
+	# Flow control: block size 1, then no limit
+	bus.incoming = [_record(0x7E8, b"\x30\x01\x00"), _record(0x7E8, b"\x30\x00\x00")]
+	isotp.send(payload)
+	assert bus.sent == [b"\x10\x14" + payload[:6], b"\x21" + payload[6:13], b"\x22" + payload[13:]]
+	assert bus.incoming == []
+
+def test_flow_control_timeout_and_overflow():
+	bus = _Bus()
+	isotp = EMSWuenscheIsoTp(bus, tx_id=0x7E0, rx_id=0x7E8, timeout=0.01)
+	with pytest.raises(CanTimeoutError):
+		isotp.send(bytes(20))
+	bus.incoming = [_record(0x7E8, b"\x32\x00\x00")]
+	with pytest.raises(CanOperationError):
+		isotp.send(bytes(20))
+	assert len(bus.sent) == 2
+
+def test_fd_segmentation():
+	bus = _Bus()
+	isotp = EMSWuenscheIsoTp(bus, tx_id=0x7E0, rx_id=0x7E8, fd=True)
+	frames = isotp._segment(bytes(range(30)))
+	assert len(frames) == 1
+	# Escaped single frame, padded to the next valid CAN FD length
+	assert bytes(frames[0][1].msg[:frames[0][1].length]) == (b"\x00\x1E" + bytes(range(30))).ljust(32, b"\xCC")
+	assert len(isotp._segment(bytes(100))) == 2
+
+def test_reception():
+	bus = _Bus()
+	isotp = EMSWuenscheIsoTp(bus, tx_id=0x7E0, rx_id=0x7E8, block_size=2)
+	payload = bytes(range(30))
+	bus.incoming = [
+		_record(0x123, b"\x01\x00"),
+		_record(0x7E8, b"\x03\x01\x02\x03"),
+		_record(0x7E8, b"\x10\x1E" + payload[:6]),
+		_record(0x7E8, b"\x21" + payload[6:13]),
+		_record(0x7E8, b"\x22" + payload[13:20]),
+		_record(0x7E8, b"\x23" + payload[20:27]),
+		_record(0x7E8, b"\x24" + payload[27:]),
+	]
+	assert isotp.recv(timeout=0.1) == b"\x01\x02\x03"
+	assert isotp.recv(timeout=0.1) == payload
+	assert isotp.recv(timeout=0.01) is None
+	# Flow control after the first frame and after the first block of two consecutive frames (the
+	# second block completes the payload)
+	assert bus.sent == [b"\x30\x02\x00\xCC\xCC\xCC\xCC\xCC"] * 2
+
+def test_reception_wrong_sequence():
+	bus = _Bus()
+	isotp = EMSWuenscheIsoTp(bus, tx_id=0x7E0, rx_id=0x7E8)
+	bus.incoming = [_record(0x7E8, b"\x10\x0A" + bytes(6)), _record(0x7E8, b"\x22" + bytes(7))]
+	assert isotp.recv(timeout=0.01) is None
+
+def test_invalid_frame_length():
+	with pytest.raises(ValueError):
+		EMSWuenscheIsoTp(_Bus(), tx_id=0x7E0, rx_id=0x7E8, frame_length=12)
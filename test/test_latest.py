@@ -0,0 +1,70 @@
+"""
+Latest received frame per id
+"""
+
+import pytest
+
+try:
+	from can_wuensche.latest import EMSWuenscheLatestValues
+	from can_wuensche.constants import CPC_MSG_T_CAN, CPC_MSG_T_XCAN, CPC_MSG_T_RTR, CPC_MSG_T_CANFD, CPC_MSG_T_CANERROR, CPC_FDFLAG_BRS
+	from can_wuensche.structures import CPC_MSG_T
+except Exception as e: # The library (libcpc.so / cpcwin.dll) is not installed
+	pytest.skip("can_wuensche not available: " + str(e), allow_module_level=True)
+
+def _record(msg_type : int, arbitration_id : int, data : bytes = b"", timestamp : float = 0.0, fdflags : int = 0, dlc : "int | None" = None) -> bytes:
+	record = CPC_MSG_T()
+	record.type = msg_type
+	record.ts_sec = int(timestamp)
+	record.ts_nsec = round((timestamp - int(timestamp)) * 1_000_000_000)
+	if msg_type == CPC_MSG_T_CANFD:
+		record.msg.canfdmsg.id = arbitration_id
+		record.msg.canfdmsg.flags = fdflags
+		record.msg.canfdmsg.length = len(data) if dlc is None else dlc
+		record.msg.canfdmsg.msg[:len(data)] = data
+	else:
+		record.msg.canmsg.id = arbitration_id
+		record.msg.canmsg.length = len(data) if dlc is None else dlc
+		record.msg.canmsg.msg[:len(data)] = data
+	return bytes(record)
+
+def test_latest_frame_and_rate():
+	latest = EMSWuenscheLatestValues()
+	assert latest.get(0x100) is None
+	for index, timestamp in enumerate((1.0, 1.1, 1.2)):
+		latest.match(_record(CPC_MSG_T_CAN, 0x100, bytes((index,)), timestamp=timestamp))
+	frame = latest.get(0x100)
+	assert frame.data == b"\x02"
+	assert frame.timestamp == pytest.approx(1.2)
+	assert frame.count == 3
+	assert frame.sequence == latest.sequence(0x100) == 3
+	assert frame.rate == pytest.approx(10.0)
+	assert frame.period == pytest.approx(0.1)
+	assert frame.to_message().arbitration_id == 0x100
+	assert latest.get(0x100, is_extended_id=True) is None
+
+def test_frame_types():
+	latest = EMSWuenscheLatestValues()
+	latest.filter([
+		_record(CPC_MSG_T_XCAN, 0x18DAF100, b"\x01\x02"),
+		_record(CPC_MSG_T_RTR, 0x200, b"\x55", dlc=4),
+		_record(CPC_MSG_T_CANFD, 0x300, bytes(range(12)), fdflags=CPC_FDFLAG_BRS),
+		_record(CPC_MSG_T_CANERROR, 0),
+	])
+	assert latest.get(0x18DAF100, is_extended_id=True).data == b"\x01\x02"
+	remote = latest.get(0x200)
+	assert remote.is_remote_frame and (remote.dlc == 4) and (remote.data == b"")
+	fd = latest.get(0x300)
+	assert fd.is_fd and fd.bitrate_switch and (fd.data == bytes(range(12)))
+	assert sorted(latest.ids()) == [(0x200, False), (0x300, False), (0x18DAF100, True)]
+
+def test_extended_capacity():
+	latest = EMSWuenscheLatestValues(ext_capacity=2)
+	for can_id in (0x10000, 0x10001, 0x10002):
+		latest.match(_record(CPC_MSG_T_XCAN, can_id))
+	assert latest.overflow == 1
+	assert latest.get(0x10002, is_extended_id=True) is None
+
+def test_deliver():
+	records = [_record(CPC_MSG_T_CAN, 0x100)]
+	assert EMSWuenscheLatestValues(deliver=True).filter(records) == records
+	assert EMSWuenscheLatestValues(deliver=False).filter(records) == []
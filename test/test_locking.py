@@ -0,0 +1,70 @@
+"""
+Locking of the receive and transmit paths
+"""
+
+import threading
+import time
+
+import pytest
+import can
+
+try:
+	from can_wuensche import wuensche
+	from can_wuensche.constants import EVENT_WRITE
+except Exception as e: # The library (libcpc.so / cpcwin.dll) is not installed
+	pytest.skip("can_wuensche not available: " + str(e), allow_module_level=True)
+
+# Bus without a device: only the state that the transmit path needs
+def _create_bus(monkeypatch, space : threading.Event) -> "wuensche.EMSWuenscheBus":
+	def wait_for_event(handle, timeout, event):
+		# The device transmit queue does not drain until space is set
+		if space.wait(timeout / 1000):
+			return EVENT_WRITE
+		return 0
+	monkeypatch.setattr(wuensche, "CPC_WaitForEvent", wait_for_event)
+	bus = wuensche.EMSWuenscheBus.__new__(wuensche.EMSWuenscheBus)
+	bus._cpc_quiesce = wuensche._Quiesce()
+	bus._cpc_handle = 0
+	bus._disconnected_since = None
+	bus._busoff_since = None
+	bus.sent = []
+	bus._cpc_write = lambda send_func, canmsg: bus.sent.append(canmsg)
+	return bus
+
+@pytest.mark.parametrize("batch", [False, True])
+def test_blocked_sender_does_not_block_quiesce(monkeypatch, batch):
+	space = threading.Event()
+	bus = _create_bus(monkeypatch, space=space)
+	msg = can.Message(arbitration_id=0x123, data=b"\x01", is_extended_id=False)
+	if batch:
+		sender = threading.Thread(target=bus._cpc_send_batch, args=([wuensche._cpc_marshal(msg)] * 3,))
+	else:
+		sender = threading.Thread(target=bus.send, args=(msg,))
+	sender.start()
+	time.sleep(0.05)
+	# A configuration change (e.g. the bus-off restart in the receive path) while the sender 
+	# waits for buffer space without a timeout
+	waited = []
+	def configure():
+		start = time.monotonic()
+		with bus._cpc_quiesce.rx:
+			with bus._cpc_quiesce:
+				waited.append(time.monotonic() - start)
+	configurator = threading.Thread(target=configure, daemon=True)
+	configurator.start()
+	configurator.join(timeout=3 * wuensche._TX_WAIT_SLICE)
+	blocked = not waited
+	sent_during_change = list(bus.sent)
+	space.set()
+	assert not blocked, "The configuration change waited for the blocked sender"
+	assert not sent_during_change
+	sender.join(timeout=2.0)
+	assert not sender.is_alive()
+	assert len(bus.sent) == (3 if batch else 1)
+
+def test_send_timeout(monkeypatch):
+	bus = _create_bus(monkeypatch, space=threading.Event())
+	start = time.monotonic()
+	with pytest.raises(can.CanTimeoutError):
+		bus.send(can.Message(arbitration_id=0x123, is_extended_id=False), timeout=0.25)
+	assert 0.2 <= time.monotonic() - start < 0.5
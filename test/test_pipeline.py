@@ -0,0 +1,79 @@
+"""
+Multi-channel capture pipeline
+"""
+
+import threading
+
+import pytest
+import can
+
+try:
+	from can_wuensche.pipeline import EMSWuenscheCapturePipeline, _filter_records
+	from can_wuensche.constants import CPC_MSG_T_CAN, CPC_MSG_T_CANERROR
+	from can_wuensche.structures import CPC_MSG_T
+except Exception as e: # The library (libcpc.so / cpcwin.dll) is not installed
+	pytest.skip("can_wuensche not available: " + str(e), allow_module_level=True)
+
+def _record(arbitration_id : int, timestamp : float, msg_type : int = CPC_MSG_T_CAN) -> bytes:
+	record = CPC_MSG_T()
+	record.type = msg_type
+	record.length = 5
+	record.ts_sec = int(timestamp)
+	record.ts_nsec = round((timestamp - int(timestamp)) * 1_000_000_000)
+	record.msg.canmsg.id = arbitration_id
+	record.msg.canmsg.length = 1
+	return bytes(record)
+
+# Delivers the given raw records through _recv_raw() (see EMSWuenscheBus._recv_raw)
+class _Bus:
+	def __init__(self, channel_info : str, records : list):
+		self.channel_info = channel_info
+		self._records = list(records)
+		self._lock = threading.Lock()
+
+	def _recv_raw(self, timeout, max_count : int = 1024):
+		with self._lock:
+			records, self._records = self._records[:max_count], self._records[max_count:]
+		if not records:
+			threading.Event().wait(min(timeout, 0.01))
+		return records
+
+class _Collector(can.Listener):
+	def __init__(self):
+		self.messages = []
+
+	def on_message_received(self, msg):
+		self.messages.append(msg)
+
+def test_filter_records():
+	data = _record(0x100, 1.0) + _record(0x200, 2.0) + _record(0, 3.0, msg_type=CPC_MSG_T_CANERROR)
+	assert _filter_records(data, [{"can_id": 0x100, "can_mask": 0x7FF, "extended": False}]) == [data[:len(data) // 3]]
+	# Error frames are matched like python-can does it (extended id 0)
+	assert len(_filter_records(data, [{"can_id": 0x100, "can_mask": 0x7FF}, {"can_id": 0, "can_mask": 0x1FFFFFFF, "extended": True}])) == 2
+	assert _filter_records(data, None) == [data[i:i + len(data) // 3] for i in range(0, len(data), len(data) // 3)]
+
+def test_merge_by_timestamp():
+	buses = [
+		_Bus("A", [_record(0x100, 1.0 + i / 10) for i in range(10)]),
+		_Bus("B", [_record(0x200, 1.05 + i / 10) for i in range(10)]),
+	]
+	collector = _Collector()
+	with EMSWuenscheCapturePipeline(buses, writer=collector, workers=1, batch_size=4, reorder_window=10.0):
+		threading.Event().wait(0.5)
+	timestamps = [msg.timestamp for msg in collector.messages]
+	assert len(timestamps) == 20
+	assert timestamps == sorted(timestamps)
+	assert {msg.channel for msg in collector.messages} == {"A", "B"}
+
+def test_stop_without_consumer():
+	bus = _Bus("A", [_record(0x100, 1.0 + i / 1000) for i in range(50)])
+	pipeline = EMSWuenscheCapturePipeline([bus], workers=1, batch_size=2, max_pending=1)
+	pipeline.start()
+	threading.Event().wait(0.5)
+	stopper = threading.Thread(target=pipeline.stop, daemon=True)
+	stopper.start()
+	stopper.join(timeout=10.0)
+	assert not stopper.is_alive(), "stop() waited for a consumer of recv()"
+	assert pipeline.frames_dropped > 0
+	assert pipeline.frames_out + pipeline.frames_dropped == pipeline.frames_in == 50
+	assert pipeline.recv(timeout=0).arbitration_id == 0x100
@@ -0,0 +1,52 @@
+"""
+Receiving while waiting for infos or responses
+"""
+
+import ctypes
+import time
+from concurrent.futures import Future
+
+import pytest
+
+try:
+	from can_wuensche import wuensche
+	from can_wuensche.constants import EVENT_READ, CPC_MSG_T_CAN
+	from can_wuensche.structures import CPC_MSG_T
+except Exception as e: # The library (libcpc.so / cpcwin.dll) is not installed
+	pytest.skip("can_wuensche not available: " + str(e), allow_module_level=True)
+
+# A bus that never runs out of received frames
+@pytest.fixture
+def busy_bus(monkeypatch, offline_bus):
+	frame = CPC_MSG_T()
+	frame.type = CPC_MSG_T_CAN
+	frame.length = 5
+	frame.msg.canmsg.id = 0x123
+	frame.msg.canmsg.length = 1
+	monkeypatch.setattr(wuensche, "_RX_PENDING_MAX", 100)
+	monkeypatch.setattr(wuensche, "CPC_WaitForEvent", lambda handle, timeout, event: EVENT_READ)
+	monkeypatch.setattr(wuensche, "CPC_Handle", lambda handle: ctypes.pointer(frame))
+	return offline_bus()
+
+def test_wait_futures_timeout_on_busy_bus(busy_bus):
+	start = time.monotonic()
+	assert not busy_bus._cpc_wait_futures(futures=[Future()], timeout=0.2)
+	assert time.monotonic() - start < 0.5
+
+def test_wait_futures_done(busy_bus):
+	future = Future()
+	future.set_result(None)
+	assert busy_bus._cpc_wait_futures(futures=[future], timeout=10.0)
+
+def test_pending_frames_are_bounded(busy_bus):
+	busy_bus._cpc_wait_futures(futures=[Future()], timeout=0.05)
+	assert len(busy_bus._rx_pending) == 100
+	assert busy_bus.cpc_rx_pending_dropped > 0
+	msg = busy_bus.recv(timeout=0)
+	assert msg.arbitration_id == 0x123
+
+def test_wait_info_timeout_on_busy_bus(busy_bus, monkeypatch):
+	monkeypatch.setattr(wuensche, "CPC_RequestInfo", lambda *args: 0)
+	start = time.monotonic()
+	assert busy_bus.cpc_wait_info("interface", "version", timeout=0.2) is None
+	assert time.monotonic() - start < 0.5
@@ -0,0 +1,56 @@
+"""
+Resilient mode (reconnect after a disconnect)
+"""
+
+import pytest
+import can
+
+try:
+	from can_wuensche import wuensche
+	from can_wuensche.constants import EVENT_WRITE
+	from can_wuensche.recovery import _Backoff
+except Exception as e: # The library (libcpc.so / cpcwin.dll) is not installed
+	pytest.skip("can_wuensche not available: " + str(e), allow_module_level=True)
+
+def _msg(arbitration_id : int) -> can.Message:
+	return can.Message(arbitration_id=arbitration_id, is_extended_id=False)
+
+# A resilient bus that just lost its interface. The interface is back on the next reopen.
+@pytest.fixture
+def disconnected_bus(monkeypatch, offline_bus):
+	def create(**kwargs):
+		monkeypatch.setattr(wuensche, "CPC_OpenChannel", lambda name: 0)
+		monkeypatch.setattr(wuensche, "CPC_WaitForEvent", lambda handle, timeout, event: EVENT_WRITE)
+		monkeypatch.setattr(wuensche.EMSWuenscheBus, "_EMSWuenscheBus__apply_can_params", lambda self: None)
+		bus = offline_bus(reconnect=True, **kwargs)
+		bus.sent = []
+		bus._cpc_write = lambda send_func, canmsg: bus.sent.append(canmsg.id)
+		bus._EMSWuenscheBus__disconnected()
+		return bus
+	return create
+
+def test_backoff():
+	backoff = _Backoff(delay=0.5, max_delay=2.0)
+	assert [backoff.next() for _ in range(5)] == [0.0, 0.5, 1.0, 2.0, 2.0]
+	backoff.reset()
+	assert backoff.next() == 0.0
+
+def test_send_and_batch_are_kept_during_the_outage(disconnected_bus):
+	bus = disconnected_bus()
+	bus.send(_msg(0x100))
+	assert bus._cpc_send_batch([wuensche._cpc_marshal(_msg(0x101)), wuensche._cpc_marshal(_msg(0x102))]) == 2
+	assert bus.sent == []
+	assert bus.recv(timeout=0.01) is None
+	assert bus.sent == [0x100, 0x101, 0x102]
+	gap = bus.cpc_connection_gaps[-1]
+	assert (gap.tx_replayed, gap.tx_dropped) == (3, 0)
+
+def test_full_backlog_drops_the_oldest(disconnected_bus):
+	bus = disconnected_bus(reconnect_tx_backlog=2)
+	bus.send(_msg(0x100))
+	bus._cpc_send_batch([wuensche._cpc_marshal(_msg(0x101)), wuensche._cpc_marshal(_msg(0x102))])
+	bus.send(_msg(0x103))
+	bus.recv(timeout=0.01)
+	assert bus.sent == [0x102, 0x103]
+	gap = bus.cpc_connection_gaps[-1]
+	assert (gap.tx_replayed, gap.tx_dropped) == (2, 2)
@@ -0,0 +1,41 @@
+"""
+Bus-off recovery policy
+"""
+
+import pytest
+
+try:
+	from can_wuensche.recovery import BusOffRecoveryPolicy
+except Exception as e: # The library (libcpc.so / cpcwin.dll) is not installed
+	pytest.skip("can_wuensche not available: " + str(e), allow_module_level=True)
+
+def test_immediate_and_delayed():
+	assert BusOffRecoveryPolicy(mode="immediate", max_restarts=0)._next_delay(0.0) == 0.0
+	assert BusOffRecoveryPolicy(mode="delayed", delay=0.5, max_restarts=0)._next_delay(0.0) == 0.5
+
+def test_backoff():
+	policy = BusOffRecoveryPolicy(mode="backoff", delay=0.1, max_delay=0.5, max_restarts=0, restart_window=10.0)
+	delays = []
+	now = 0.0
+	for _ in range(5):
+		delays.append(policy._next_delay(now))
+		policy._restarted(now)
+		now += 1.0
+	assert delays == pytest.approx([0.1, 0.2, 0.4, 0.5, 0.5])
+	# An error free restart window starts with the short delay again
+	assert policy._next_delay(now + 20.0) == pytest.approx(0.1)
+
+def test_restart_rate_limit():
+	policy = BusOffRecoveryPolicy(mode="immediate", max_restarts=3, restart_window=10.0)
+	for now in (0.0, 1.0, 2.0):
+		assert policy._next_delay(now) == 0.0
+		policy._restarted(now)
+	# The fourth restart has to wait until the first one left the window
+	assert policy._next_delay(3.0) == pytest.approx(7.0)
+	assert policy._next_delay(10.5) == 0.0
+
+def test_invalid_parameters():
+	with pytest.raises(ValueError):
+		BusOffRecoveryPolicy(mode="sometimes")
+	with pytest.raises(ValueError):
+		BusOffRecoveryPolicy(max_restarts=-1)
@@ -0,0 +1,68 @@
+"""
+Periodic transmit scheduler
+"""
+
+import threading
+import time
+
+import pytest
+import can
+
+try:
+	from can_wuensche import wuensche
+	from can_wuensche.constants import EVENT_WRITE
+	from can_wuensche.scheduler import EMSWuenscheCyclicSendTask
+except Exception as e: # The library (libcpc.so / cpcwin.dll) is not installed
+	pytest.skip("can_wuensche not available: " + str(e), allow_module_level=True)
+
+class _Scheduler:
+	def add(self, task):
+		pass
+
+	def remove(self, task):
+		pass
+
+def _task(period : float, duration : "float | None" = None) -> EMSWuenscheCyclicSendTask:
+	return EMSWuenscheCyclicSendTask(scheduler=_Scheduler(), messages=can.Message(arbitration_id=0x100), period=period, duration=duration, autostart=False)
+
+def test_deadlines_stay_on_the_grid():
+	task = _task(period=0.01)
+	assert task._account(due_ns=0, sent_ns=1_000_000) == 10_000_000
+	assert task.missed_count == 0
+	assert task.max_jitter_ns == 1_000_000
+
+def test_passed_deadlines_are_skipped():
+	task = _task(period=0.01)
+	assert task._account(due_ns=0, sent_ns=35_000_000) == 40_000_000
+	assert task.missed_count == 3
+	assert task.statistics()["miss_histogram"]["3"] == 1
+
+def test_duration_ends_the_task():
+	task = _task(period=0.01, duration=0.02)
+	task.start()
+	start_ns = task.next_deadline_ns
+	assert task._account(due_ns=start_ns, sent_ns=start_ns) is not None
+	assert task._account(due_ns=start_ns + 10_000_000, sent_ns=start_ns + 10_000_000) is None
+	assert task.stopped
+
+def test_periodic_send(monkeypatch, offline_bus):
+	monkeypatch.setattr(wuensche, "CPC_WaitForEvent", lambda handle, timeout, event: EVENT_WRITE)
+	bus = offline_bus()
+	sent = []
+	bus._cpc_write = lambda send_func, canmsg: sent.append(canmsg.id)
+	task = bus.send_periodic(can.Message(arbitration_id=0x100, is_extended_id=False), period=0.01)
+	time.sleep(0.105)
+	task.stop()
+	assert 8 <= len(sent) <= 12
+	assert set(sent) == {0x100}
+
+def test_shutdown_with_full_transmit_buffer(monkeypatch, offline_bus):
+	# The device never reports buffer space
+	monkeypatch.setattr(wuensche, "CPC_WaitForEvent", lambda handle, timeout, event: time.sleep(timeout / 1000) or 0)
+	bus = offline_bus()
+	bus.send_periodic(can.Message(arbitration_id=0x100), period=0.01)
+	time.sleep(0.05)
+	shutdown = threading.Thread(target=bus.shutdown, daemon=True)
+	shutdown.start()
+	shutdown.join(timeout=3 * wuensche._TX_WAIT_SLICE)
+	assert not shutdown.is_alive(), "shutdown() waited for the blocked scheduler"
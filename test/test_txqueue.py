@@ -0,0 +1,83 @@
+"""
+Priority transmit lanes
+"""
+
+import threading
+import time
+
+import pytest
+import can
+
+try:
+	from can_wuensche.txqueue import EMSWuenscheTxQueue
+except Exception as e: # The library (libcpc.so / cpcwin.dll) is not installed
+	pytest.skip("can_wuensche not available: " + str(e), allow_module_level=True)
+
+# Records the batches and blocks them until release is set
+class _Bus:
+	def __init__(self):
+		self.timing = can.BitTiming.from_sample_point(f_clock=8_000_000, bitrate=500_000, sample_point=87.5)
+		self.sent = []
+		self.release = threading.Event()
+		self.release.set()
+
+	def _cpc_send_batch(self, marshalled : list, timeout = None) -> int:
+		self.release.wait()
+		self.sent.extend(canmsg.id for _, canmsg in marshalled)
+		return len(marshalled)
+
+def _wait(condition, timeout : float = 2.0) -> bool:
+	end = time.monotonic() + timeout
+	while not condition():
+		if time.monotonic() >= end:
+			return False
+		time.sleep(0.001)
+	return True
+
+def _msg(arbitration_id : int, **kwargs) -> can.Message:
+	return can.Message(arbitration_id=arbitration_id, is_extended_id=False, **kwargs)
+
+def test_lane_of():
+	with EMSWuenscheTxQueue(_Bus(), lanes=4) as lanes:
+		assert lanes.lane_of(_msg(0x000)) == 0
+		assert lanes.lane_of(_msg(0x1FF)) == 0
+		assert lanes.lane_of(_msg(0x200)) == 1
+		assert lanes.lane_of(_msg(0x7FF)) == 3
+		assert lanes.lane_of(can.Message(arbitration_id=0x7FF << 18, is_extended_id=True)) == 3
+
+def test_wire_time():
+	with EMSWuenscheTxQueue(_Bus()) as lanes:
+		# 47 + 64 bits, 20 % stuffing, 2 us per bit
+		assert lanes._wire_ns(_msg(0x100, data=bytes(8))) == round(111 * 1.2 * 2000)
+		assert lanes._wire_ns(_msg(0x100, is_remote_frame=True, dlc=8)) == round(47 * 1.2 * 2000)
+
+def test_urgent_lane_first():
+	bus = _Bus()
+	bus.release.clear()
+	with EMSWuenscheTxQueue(bus, lanes=4, max_backlog=1e-9) as lanes:
+		# The first frame blocks the sender, the others are queued meanwhile
+		lanes.send(_msg(0x700))
+		assert _wait(lambda: len(lanes) == 0)
+		lanes.send(_msg(0x600))
+		lanes.send(_msg(0x000))
+		lanes.send(_msg(0x300))
+		bus.release.set()
+		assert _wait(lambda: len(bus.sent) == 4)
+		assert bus.sent == [0x700, 0x000, 0x300, 0x600]
+		assert [lane["sent"] for lane in lanes.statistics()] == [1, 1, 0, 2]
+
+def test_full_lane_times_out():
+	bus = _Bus()
+	bus.release.clear()
+	with EMSWuenscheTxQueue(bus, lanes=1, max_backlog=1e-9, capacity=1) as lanes:
+		lanes.send(_msg(0x100))
+		lanes.send(_msg(0x101))
+		with pytest.raises(can.CanTimeoutError):
+			lanes.send(_msg(0x102), timeout=0.05)
+		bus.release.set()
+
+def test_send_after_close():
+	lanes = EMSWuenscheTxQueue(_Bus())
+	lanes.close()
+	with pytest.raises(can.CanOperationError):
+		lanes.send(_msg(0x100))
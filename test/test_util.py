@@ -0,0 +1,35 @@
+"""
+Helpers for the CAN parameters
+"""
+
+import pytest
+
+try:
+	from can_wuensche.util import _can_params_diff, _create_can_params
+	from can_wuensche.constants import GENERIC_CAN_CONTR, SJA1000
+except Exception as e: # The library (libcpc.so / cpcwin.dll) is not installed
+	pytest.skip("can_wuensche not available: " + str(e), allow_module_level=True)
+
+def test_identical_parameters():
+	params = _create_can_params(controller=GENERIC_CAN_CONTR, bitrate=500000, fd=False)
+	assert _can_params_diff(params, _create_can_params(controller=GENERIC_CAN_CONTR, bitrate=500000, fd=False)) == []
+
+def test_changed_bitrate():
+	old = _create_can_params(controller=GENERIC_CAN_CONTR, bitrate=500000, fd=False)
+	new = _create_can_params(controller=GENERIC_CAN_CONTR, bitrate=250000, fd=False)
+	assert _can_params_diff(old, new) == ["generic.n.brp", "generic.d.brp"]
+	old = _create_can_params(controller=SJA1000, bitrate=500000, fd=False)
+	new = _create_can_params(controller=SJA1000, bitrate=125000, fd=False)
+	assert _can_params_diff(old, new) == ["sja1000.btr0"]
+
+def test_changed_controller():
+	old = _create_can_params(controller=GENERIC_CAN_CONTR, bitrate=500000, fd=False)
+	new = _create_can_params(controller=SJA1000, bitrate=500000, fd=False)
+	assert _can_params_diff(old, new) == ["cc_type"]
+
+def test_unknown_controller():
+	old = _create_can_params(controller=GENERIC_CAN_CONTR, bitrate=500000, fd=False)
+	new = _create_can_params(controller=GENERIC_CAN_CONTR, bitrate=500000, fd=False)
+	new.cc_type = 0xFF
+	with pytest.raises(ValueError):
+		_can_params_diff(old, new)